@@ -1,17 +1,113 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_from_directory, stream_with_context
+import functools
 import os
-import json
+import time
+import uuid
 from datetime import datetime
+from modules.output_sink import get_output_sink
+from modules.serialization import dumps_bytes
+from modules.startup import preload, start_warm_up, is_ready, readiness
 
-app = Flask(__name__, static_folder='.', static_url_path='')
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
+# Heavy imports (cv2, pytesseract, pyzbar, deep_translator) happen here, at
+# start-up - before fork when gunicorn runs with preload_app (gunicorn.conf.py)
+preload()
+from main import (
+    process_images, process_pdf, process_burst, resolve_single_scan,
+    iter_process_images, iter_process_pdf, stage_update,
+)
+from modules.api_common import (
+    UPLOAD_FOLDER, OUTPUT_FOLDER, MAX_CONTENT_LENGTH, API_INFO, process_options, schedule, wants_side_check,
+    sides_info, busy_payload, result_payload, burst_summary, finish_stream, encode_event, face_from_upload,
+    duplicates_payload, duplicates_denied, remove_uploads,
+)
+from modules.pdf_reader import is_pdf
+from modules.burst import MAX_BURST_FRAMES
+from modules.memory import MemoryBudgetExceeded, estimate_decoded_bytes, get_memory_budget
+from modules.scheduler import SchedulerBusy, get_scheduler
+from modules.profiling import RequestProfile, requested_mode
+from modules.side_classifier import assign_sides
 
-UPLOAD_FOLDER = 'uploads'
-OUTPUT_FOLDER = 'outputs'
+app = Flask(__name__, static_folder='.', static_url_path='')
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
 for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER]:
     os.makedirs(folder, exist_ok=True)
 
+
+@app.before_request
+def stamp_arrival():
+    """deadline_ms counts from here, before the upload is read and the request queued"""
+    g.started_at = time.time()
+
+
+def json_response(payload, status=200):
+    """Compact JSON response through the fast encoder (orjson when installed)"""
+    return Response(dumps_bytes(payload), status=status, mimetype='application/json')
+
+
+def profiled(view):
+    """Run the view under the request profiler when the request asks for it (see modules.profiling)"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        mode = requested_mode(request.headers)
+        if mode is None:
+            return view(*args, **kwargs)
+        profile = RequestProfile(mode, f'{view.__name__}_{uuid.uuid4().hex[:8]}')
+        profile.start()
+        try:
+            response = app.make_response(view(*args, **kwargs))
+        finally:
+            profile.stop()
+        paths = profile.write()
+        response.headers['X-Profile-Files'] = ','.join(os.path.basename(p) for p in paths)
+        return response
+    return wrapper
+
+
+def form_value(name, default=None):
+    """A request option from the form, else the query string"""
+    return request.form.get(name, request.args.get(name, default))
+
+
+def busy_response(error):
+    """503 for a request the scheduler or the memory budget could not admit"""
+    payload, status = busy_payload(error, get_scheduler())
+    return jsonify(payload), status, {'Retry-After': '2'}
+
+
+def read_schedule():
+    """(lane, tenant) of a request: X-Priority (or priority) and X-API-Key. Raises ValueError"""
+    return schedule(form_value, request.headers)
+
+
+def read_process_options():
+    """Options shared by the /process endpoints. Raises ValueError with the client message"""
+    return process_options(form_value, started_at=g.get('started_at'))
+
+
+def order_uploads(front_path, back_path):
+    """Check the front/back fields against the images' content.
+
+    Runs the side classifier when the client asks for it (sides=auto) or when
+    an upload's file name claims the other side. Returns (front_path,
+    back_path, sides) where sides is None when the fields were trusted.
+    """
+    if not wants_side_check(form_value, request.files['front'].filename, request.files['back'].filename):
+        return front_path, back_path, None
+    front_path, back_path, info = assign_sides(front_path, back_path)
+    return front_path, back_path, sides_info(info)
+
+
+def render_result(result, profile, upload_info, extra=None):
+    """Turn a pipeline result into the /process response (422 when quality-rejected).
+
+    `extra` holds additional top-level keys, e.g. the burst summary.
+    """
+    payload, status = result_payload(result, profile, upload_info, extra, logger=app.logger, source=request.path)
+    if status != 200:
+        return jsonify(payload), status
+    return json_response(payload)
+
 @app.route('/', methods=['GET'])
 def index():
     """Serve HTML form or API info based on Accept header"""
@@ -23,18 +119,7 @@ def index():
         except:
             pass
     # Return JSON API info
-    return jsonify({
-        'service': 'OcrVerification API',
-        'version': '1.0.0',
-        'status': 'running',
-        'endpoints': {
-            'GET /': 'API information / Web UI',
-            'GET /health': 'Health check',
-            'GET /version': 'API version',
-            'POST /process': 'Process Aadhaar images (upload front and back)'
-        },
-        'documentation': 'https://github.com/Ranch12k/OcrVerification'
-    }), 200
+    return jsonify(API_INFO), 200
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -45,6 +130,49 @@ def health():
         'timestamp': datetime.now().isoformat()
     }), 200
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness check: 503 until this worker has finished its warm-up"""
+    # Normally started by the gunicorn post_fork hook; start it here otherwise
+    start_warm_up()
+    return jsonify(readiness()), 200 if is_ready() else 503
+
+@app.route('/duplicates', methods=['GET', 'POST'])
+def duplicates():
+    """Earlier submissions of the same card or face.
+
+    GET ?request_id=... checks an already processed request; POST takes an
+    `aadhaar` number and/or a `face` image (a face crop or a card front,
+    whose largest face is used). Needs the X-Duplicates-Token header; the
+    number is only read from the POST body, never from the URL.
+    """
+    denied = duplicates_denied(request.headers)
+    if denied:
+        return jsonify(denied[0]), denied[1]
+    request_id = request.args.get('request_id') or request.form.get('request_id')
+    aadhaar = request.form.get('aadhaar')
+    face_b64 = None
+    face_uploaded = not request_id and 'face' in request.files and request.files['face'].filename != ''
+    if face_uploaded:
+        face_path = os.path.join(UPLOAD_FOLDER, f'dup_{uuid.uuid4().hex}.jpg')
+        request.files['face'].save(face_path)
+        try:
+            face_b64 = face_from_upload(face_path)
+        finally:
+            os.remove(face_path)
+    payload, status = duplicates_payload(request_id, aadhaar, face_b64, face_uploaded)
+    return jsonify(payload), status
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Worker scheduler, memory budget and output sink counters"""
+    return jsonify({
+        'scheduler': get_scheduler().stats(),
+        'memory': get_memory_budget().stats(),
+        'output_sink': get_output_sink(OUTPUT_FOLDER).stats(),
+        'timestamp': datetime.now().isoformat()
+    }), 200
+
 @app.route('/version', methods=['GET'])
 def version():
     """Get API version"""
@@ -55,15 +183,31 @@ def version():
     }), 200
 
 @app.route('/process', methods=['POST'])
+@profiled
 def process_aadhaar():
     """Process uploaded Aadhaar images (single or both)"""
+    # Per-request names: a worker runs several requests at once (gthread)
+    request_id = uuid.uuid4().hex
+    uploaded = []
     try:
         # Check if at least one image is provided
         has_front = 'front' in request.files and request.files['front'].filename != ''
         has_back = 'back' in request.files and request.files['back'].filename != ''
+        has_pdf = 'pdf' in request.files and request.files['pdf'].filename != ''
         
-        if not has_front and not has_back:
-            return jsonify({'error': 'Upload at least one image (front or back)'}), 400
+        if not has_front and not has_back and not has_pdf:
+            return jsonify({'error': 'Upload at least one image (front or back) or an e-Aadhaar PDF'}), 400
+        
+        try:
+            options = read_process_options()
+            lane, tenant = read_schedule()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        deadline_ms = options['deadline_ms']
+        fields = options['fields']
+        profile = options['profile']
+        quality_gate = options['quality_gate']
+        started_at = options['started_at']
         
         front_path = None
         back_path = None
@@ -71,59 +215,229 @@ def process_aadhaar():
         # Handle front image
         if has_front:
             front = request.files['front']
-            front_path = os.path.join(UPLOAD_FOLDER, 'aff.jpg')
+            front_path = os.path.join(UPLOAD_FOLDER, f'{request_id}_front.jpg')
             front.save(front_path)
+            uploaded.append(front_path)
         
         # Handle back image
         if has_back:
             back = request.files['back']
-            back_path = os.path.join(UPLOAD_FOLDER, 'aadhaarBack.jpg')
+            back_path = os.path.join(UPLOAD_FOLDER, f'{request_id}_back.jpg')
             back.save(back_path)
+            uploaded.append(back_path)
         
-        # If only one image provided, use it for both (parser will handle it)
-        if not has_front:
-            front_path = back_path
-        elif not has_back:
-            back_path = front_path
-        
-        # Import and run main processing
-        from main import process_images, assemble_final
-        from modules.output_formatter import format_detailed_response
+        # Handle e-Aadhaar PDF (also accepted in the front/back fields)
+        pdf_path = None
+        if has_pdf:
+            pdf_path = os.path.join(UPLOAD_FOLDER, f'{request_id}.pdf')
+            request.files['pdf'].save(pdf_path)
+            uploaded.append(pdf_path)
         
-        result = process_images(front_path, back_path)
-        final = assemble_final(result)
+        if pdf_path is None:
+            pdf_path = next((p for p in (front_path, back_path) if p and is_pdf(p)), None)
         
-        # Extract components for formatter
-        final_data = final.get('final_data', {})
-        translations = final.get('translations', {})
-        ocr_details_front = final.get('detailed_breakdown', {}).get('ocr_front_extracted', {}).get('ocr_parsed_dict', {})
-        ocr_details_back = final.get('detailed_breakdown', {}).get('ocr_back_extracted', {}).get('ocr_parsed_dict', {})
-        qr_data = final.get('detailed_breakdown', {}).get('qr_xml_extracted', {}).get('qr_decoded', {})
-        
-        # Format for cleaner output
-        formatted_result = format_detailed_response(final_data, translations, ocr_details_front, ocr_details_back, qr_data)
-        
-        # Add raw data for advanced users
-        formatted_result['raw_data'] = final.get('raw_sources', {})
-        
-        # Add upload info
-        formatted_result['upload_info'] = {
-            'front_uploaded': has_front,
-            'back_uploaded': has_back,
-            'single_image_mode': (has_front and not has_back) or (has_back and not has_front)
-        }
-        
-        # Save result to outputs folder
-        output_file = os.path.join(OUTPUT_FOLDER, f'output_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
-        with open(output_file, 'w') as f:
-            json.dump(formatted_result, f, indent=2, ensure_ascii=False)
-        
-        return jsonify(formatted_result), 200
+        # Wait for a pipeline slot in the request's lane, then reserve the decoded size
+        # of the upload; reject when the queue or the memory budget cannot take it
+        with get_scheduler().slot(lane, tenant), \
+                get_memory_budget().admit(estimate_decoded_bytes([front_path, back_path, pdf_path])):
+            layout = None
+            sides = None
+            if pdf_path:
+                try:
+                    result = process_pdf(pdf_path, os.path.join(UPLOAD_FOLDER, 'pdf', request_id),
+                                         password=request.form.get('password'),
+                                         deadline_ms=deadline_ms, fields=fields, quality_gate=quality_gate,
+                                         profile=profile, started_at=started_at)
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
+            else:
+                # If only one image provided, split it when it is a combined front+back
+                # scan, otherwise use it for both (parser will handle it)
+                if not has_front or not has_back:
+                    front_path, back_path, layout = resolve_single_scan(front_path or back_path,
+                                                                        os.path.join(UPLOAD_FOLDER, 'splits', request_id))
+                else:
+                    # Swapped or contradictorily named uploads are put back in order by content
+                    front_path, back_path, sides = order_uploads(front_path, back_path)
+                
+                result = process_images(front_path, back_path, deadline_ms=deadline_ms, fields=fields,
+                                        quality_gate=quality_gate, profile=profile, started_at=started_at)
+            
+            upload_info = {
+                'front_uploaded': has_front,
+                'back_uploaded': has_back,
+                'input_type': result.input_type,
+                'single_image_mode': (has_front and not has_back) or (has_back and not has_front),
+                'split_scan': bool(layout and layout['regions']),
+                'layout_regions': layout['regions'] if layout else [],
+            }
+            if sides:
+                upload_info['sides'] = sides
+            return render_result(result, profile, upload_info)
         
+    except (SchedulerBusy, MemoryBudgetExceeded) as e:
+        return busy_response(e)
     except ImportError as e:
         return jsonify({'error': f'Import error: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': f'Processing error: {str(e)}'}), 500
+    finally:
+        remove_uploads(request_id, uploaded)
+
+@app.route('/process/burst', methods=['POST'])
+@profiled
+def process_aadhaar_burst():
+    """Process a burst of frames per side (several `front` / `back` files).
+
+    Frames are run sharpest first and processing stops once the fields are
+    validated; the response is the /process response plus a `burst` summary.
+    """
+    front_files = [f for f in request.files.getlist('front') if f.filename]
+    back_files = [f for f in request.files.getlist('back') if f.filename]
+    if not front_files and not back_files:
+        return jsonify({'error': 'Upload at least one front or back frame'}), 400
+    try:
+        options = read_process_options()
+        lane, tenant = read_schedule()
+        max_frames = int(form_value('max_frames', MAX_BURST_FRAMES))
+        if max_frames <= 0:
+            raise ValueError('max_frames must be a positive integer')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Per-request names: a burst has many files per side
+    burst_id = uuid.uuid4().hex
+    front_paths = []
+    back_paths = []
+    try:
+        for side, files, paths in (('front', front_files, front_paths), ('back', back_files, back_paths)):
+            for i, f in enumerate(files):
+                path = os.path.join(UPLOAD_FOLDER, 'burst', f'{burst_id}_{side}_{i}.jpg')
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                f.save(path)
+                paths.append(path)
+        
+        # Frames of one side only: the same frames serve both sides. Frames run
+        # one at a time, so the budget is charged for the largest pair only
+        estimate = max(estimate_decoded_bytes([f]) for f in front_paths or [None]) + \
+            max(estimate_decoded_bytes([b]) for b in back_paths or [None])
+        with get_scheduler().slot(lane, tenant), get_memory_budget().admit(estimate):
+            result = process_burst(front_paths or back_paths, back_paths or front_paths, max_frames=max_frames,
+                                   **options)
+        upload_info = {
+            'front_uploaded': bool(front_files),
+            'back_uploaded': bool(back_files),
+            'input_type': 'burst',
+            'front_frames': len(front_paths),
+            'back_frames': len(back_paths),
+        }
+        return render_result(result, options['profile'], upload_info, extra={'burst': burst_summary(result.burst)})
+    except (SchedulerBusy, MemoryBudgetExceeded) as e:
+        return busy_response(e)
+    except Exception as e:
+        return jsonify({'error': f'Processing error: {str(e)}'}), 500
+    finally:
+        remove_uploads(burst_id, front_paths + back_paths)
+
+@app.route('/process/stream', methods=['POST'])
+def process_aadhaar_stream():
+    """Like /process, but streams each section as soon as its stage finishes.
+
+    Responds with NDJSON (one {"event", "data"} object per line), or with
+    Server-Sent Events when the client sends Accept: text/event-stream.
+    Events follow the pipeline stages (plan, quality, qr, ocr_back,
+    ocr_front, face, translate); the last one, "final", carries the
+    assemble_final() record and the request_id.
+    """
+    has_front = 'front' in request.files and request.files['front'].filename != ''
+    has_back = 'back' in request.files and request.files['back'].filename != ''
+    has_pdf = 'pdf' in request.files and request.files['pdf'].filename != ''
+    if not has_front and not has_back and not has_pdf:
+        return jsonify({'error': 'Upload at least one image (front or back) or an e-Aadhaar PDF'}), 400
+    try:
+        options = read_process_options()
+        lane, tenant = read_schedule()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Save uploads under a per-request name: the stream outlives this view
+    request_id = uuid.uuid4().hex
+    front_path = back_path = pdf_path = None
+    try:
+        if has_front:
+            front_path = os.path.join(UPLOAD_FOLDER, f'{request_id}_front.jpg')
+            request.files['front'].save(front_path)
+        if has_back:
+            back_path = os.path.join(UPLOAD_FOLDER, f'{request_id}_back.jpg')
+            request.files['back'].save(back_path)
+        if has_pdf:
+            pdf_path = os.path.join(UPLOAD_FOLDER, f'{request_id}.pdf')
+            request.files['pdf'].save(pdf_path)
+    except Exception as e:
+        remove_uploads(request_id)
+        return jsonify({'error': f'Processing error: {str(e)}'}), 500
+    uploaded = [front_path, back_path, pdf_path]
+    if pdf_path is None:
+        pdf_path = next((p for p in (front_path, back_path) if p and is_pdf(p)), None)
+    
+    # The slot and the memory reservation are held until the stream ends; like
+    # /process, layout detection and side classification only run once admitted
+    scheduler = get_scheduler()
+    budget = get_memory_budget()
+    try:
+        ticket = scheduler.acquire(lane, tenant)
+    except SchedulerBusy as e:
+        remove_uploads(request_id, uploaded)
+        return busy_response(e)
+    try:
+        reserved = budget.acquire(estimate_decoded_bytes([front_path, back_path, pdf_path]))
+    except MemoryBudgetExceeded as e:
+        scheduler.release(ticket)
+        remove_uploads(request_id, uploaded)
+        return busy_response(e)
+    
+    def release():
+        budget.release(reserved)
+        scheduler.release(ticket)
+        remove_uploads(request_id, uploaded)
+    
+    # Run up to the first event here so a bad PDF password is still a plain 400
+    try:
+        if pdf_path:
+            stages = iter_process_pdf(pdf_path, os.path.join(UPLOAD_FOLDER, 'pdf', request_id),
+                                      password=request.form.get('password'), **options)
+        elif not has_front or not has_back:
+            front_path, back_path, _ = resolve_single_scan(front_path or back_path,
+                                                           os.path.join(UPLOAD_FOLDER, 'splits', request_id))
+            stages = iter_process_images(front_path, back_path, **options)
+        else:
+            front_path, back_path, _ = order_uploads(front_path, back_path)
+            stages = iter_process_images(front_path, back_path, **options)
+        first = next(stages)
+    except ValueError as e:
+        release()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        release()
+        return jsonify({'error': f'Processing error: {str(e)}'}), 500
+    
+    sse = 'text/event-stream' in request.headers.get('Accept', '')
+    
+    def generate():
+        result = first[1]
+        yield encode_event(first[0], stage_update(*first), sse)
+        try:
+            for stage, result in stages:
+                yield encode_event(stage, stage_update(stage, result), sse)
+            yield encode_event('final', finish_stream(result, request_id, logger=app.logger), sse)
+        except Exception as e:
+            yield encode_event('error', {'error': f'Processing error: {str(e)}', 'request_id': request_id}, sse)
+        finally:
+            release()
+    
+    return Response(stream_with_context(generate()),
+                    mimetype='text/event-stream' if sse else 'application/x-ndjson',
+                    headers={'X-Request-ID': request_id, 'X-Accel-Buffering': 'no'})
 
 @app.errorhandler(404)
 def not_found(error):
@@ -145,4 +459,5 @@ if __name__ == '__main__':
     print("Starting Flask server...")
     print("Visit: http://localhost:5000")
     print("=" * 50)
+    start_warm_up()
     app.run(debug=False, host='0.0.0.0', port=5000, threaded=True)
@@ -0,0 +1,488 @@
+"""
+ASGI entry point: the API of app.py on an event loop.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Uploads are received and saved, translations awaited and results indexed
+and queued on the event loop, so slow clients and translation network waits
+hold no worker. The CPU stages (quality gate, QR, OCR, face, side
+classification, scan splitting) run in a warm process pool
+(modules.process_pool). The scheduler has one slot per pool worker, with the
+lanes and tenant quotas of the Flask app, and the memory budget admits
+requests as it does there. Run one ASGI server process per container and
+size the pool with OCR_PROCESS_POOL_WORKERS.
+"""
+import asyncio
+import functools
+import logging
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from modules.serialization import dumps_bytes
+from modules.startup import preload, readiness
+
+preload()
+from main import (
+    process_images, process_pdf, process_burst, resolve_single_scan, iter_process_images, iter_process_pdf,
+    stage_update, build_translations, translation_planned,
+)
+from modules.api_common import (
+    UPLOAD_FOLDER, OUTPUT_FOLDER, MAX_CONTENT_LENGTH, API_INFO, process_options, schedule, wants_side_check,
+    sides_info, busy_payload, result_payload, burst_summary, finish_stream, encode_event, face_from_upload,
+    duplicates_payload, duplicates_denied, remove_uploads,
+)
+from modules.burst import MAX_BURST_FRAMES
+from modules.memory import MemoryBudgetExceeded, estimate_decoded_bytes, get_memory_budget
+from modules.output_sink import get_output_sink
+from modules.pdf_reader import is_pdf
+from modules.process_pool import get_process_pool
+from modules.scheduler import LANE_MAX_QUEUED, Scheduler, SchedulerBusy
+from modules.side_classifier import assign_sides
+
+logger = logging.getLogger('asgi')
+
+pool = get_process_pool()
+# One slot per pool worker: a request holds its slot while its stages run in the pool
+scheduler = Scheduler(slots=pool.workers)
+
+# Threads that block in the scheduler or the memory budget on behalf of waiting requests
+# (never more than the lane queues hold)
+admission_threads = ThreadPoolExecutor(max_workers=sum(LANE_MAX_QUEUED.values()) + pool.workers,
+                                       thread_name_prefix="admission")
+
+for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER]:
+    os.makedirs(folder, exist_ok=True)
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+def json_response(payload, status=200, headers=None):
+    """Compact JSON response through the fast encoder (orjson when installed)"""
+    return Response(dumps_bytes(payload), status_code=status, media_type='application/json', headers=headers)
+
+
+def busy_response(error):
+    payload, status = busy_payload(error, scheduler)
+    return json_response(payload, status, headers={'Retry-After': '2'})
+
+
+async def read_form(request):
+    """Multipart/form body of a request, received on the event loop"""
+    length = request.headers.get('content-length')
+    if length and length.isdigit() and int(length) > MAX_CONTENT_LENGTH:
+        raise RequestTooLarge()
+    return await request.form()
+
+
+def form_lookup(request, form):
+    """get(name, default): a request option from the form, else the query string"""
+    def get(name, default=None):
+        value = form.get(name)
+        if isinstance(value, str):
+            return value
+        return request.query_params.get(name, default)
+    return get
+
+
+def uploads(form, name):
+    """Files sent in a form field (ignoring empty file inputs)"""
+    return [f for f in form.getlist(name) if getattr(f, 'filename', None)]
+
+
+def _copy_upload(upload, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    upload.file.seek(0)
+    with open(path, 'wb') as out:
+        shutil.copyfileobj(upload.file, out)
+
+
+async def save_upload(upload, path):
+    await asyncio.to_thread(_copy_upload, upload, path)
+    return path
+
+
+async def _admission_call(acquire, release):
+    """Run a blocking acquire in an admission thread. If the request goes away
+    while it waits, whatever it acquires afterwards is released again."""
+    future = asyncio.get_running_loop().run_in_executor(admission_threads, acquire)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        future.add_done_callback(lambda f: f.cancelled() or f.exception() or release(f.result()))
+        raise
+
+
+async def admit(lane, tenant, nbytes):
+    """Wait for a scheduler slot, then reserve `nbytes` of the memory budget. Returns release()"""
+    budget = get_memory_budget()
+    ticket = await _admission_call(functools.partial(scheduler.acquire, lane, tenant), scheduler.release)
+    try:
+        reserved = await _admission_call(functools.partial(budget.acquire, nbytes), budget.release)
+    except BaseException:
+        scheduler.release(ticket)
+        raise
+
+    def release():
+        budget.release(reserved)
+        scheduler.release(ticket)
+    return release
+
+
+@asynccontextmanager
+async def admitted(lane, tenant, nbytes):
+    release = await admit(lane, tenant, nbytes)
+    try:
+        yield
+    finally:
+        release()
+
+
+async def translate(result):
+    """Run the translation stage on the event loop side (network waits, no CPU)"""
+    if translation_planned(result.plan) and not result.quality_rejected:
+        result.translations = await asyncio.to_thread(build_translations, result)
+
+
+async def render_result(request, result, profile, upload_info, extra=None):
+    # Indexing and formatting touch SQLite and the face crop: kept off the loop
+    payload, status = await asyncio.to_thread(result_payload, result, profile, upload_info, extra, logger,
+                                              request.url.path)
+    return json_response(payload, status)
+
+
+async def order_uploads(get, form, front_path, back_path):
+    """Check the front/back fields against the images' content, as app.order_uploads does"""
+    if not wants_side_check(get, uploads(form, 'front')[0].filename, uploads(form, 'back')[0].filename):
+        return front_path, back_path, None
+    front_path, back_path, info = await pool.run(assign_sides, front_path, back_path)
+    return front_path, back_path, sides_info(info)
+
+
+async def save_card_uploads(form, request_id):
+    """Save the front/back/pdf uploads under per-request names. Returns (front, back, pdf) paths"""
+    paths = {}
+    for name, suffix in (('front', '_front.jpg'), ('back', '_back.jpg'), ('pdf', '.pdf')):
+        files = uploads(form, name)
+        paths[name] = await save_upload(files[0], os.path.join(UPLOAD_FOLDER, request_id + suffix)) if files else None
+    pdf_path = paths['pdf']
+    if pdf_path is None:
+        pdf_path = next((p for p in (paths['front'], paths['back']) if p and is_pdf(p)), None)
+    return paths['front'], paths['back'], pdf_path
+
+
+async def index(request):
+    """Serve HTML form or API info based on Accept header"""
+    accept_header = request.headers.get('accept', '')
+    if ('text/html' in accept_header or not accept_header) and os.path.exists('index.html'):
+        return FileResponse('index.html')
+    return json_response(API_INFO)
+
+
+async def health(request):
+    """Health check endpoint"""
+    return json_response({
+        'status': 'healthy',
+        'service': 'OcrVerification API',
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+async def ready(request):
+    """Readiness check: 503 until every pool worker has warmed up"""
+    payload = readiness()
+    payload['ready'] = pool.ready
+    payload['process_pool'] = pool.stats()
+    return json_response(payload, 200 if pool.ready else 503)
+
+
+async def version(request):
+    """Get API version"""
+    return json_response({
+        'version': '1.0.0',
+        'service': 'OcrVerification API',
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+async def metrics(request):
+    """Scheduler, memory budget, output sink and process pool counters"""
+    return json_response({
+        'scheduler': scheduler.stats(),
+        'memory': get_memory_budget().stats(),
+        'output_sink': get_output_sink(OUTPUT_FOLDER).stats(),
+        'process_pool': pool.stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+async def duplicates(request):
+    """Earlier submissions of the same card or face, see app.duplicates"""
+    denied = duplicates_denied(request.headers)
+    if denied:
+        return json_response(*denied)
+    form = await read_form(request) if request.method == 'POST' else {}
+    get = form_lookup(request, form)
+    request_id = get('request_id')
+    face_b64 = None
+    faces = uploads(form, 'face') if form and not request_id else []
+    if faces:
+        face_path = await save_upload(faces[0], os.path.join(UPLOAD_FOLDER, f'dup_{uuid.uuid4().hex}.jpg'))
+        try:
+            face_b64 = await pool.run(face_from_upload, face_path)
+        finally:
+            os.remove(face_path)
+    # The number is only taken from the POST body, never from the URL
+    aadhaar = form.get('aadhaar') if form else None
+    payload, status = await asyncio.to_thread(duplicates_payload, request_id, aadhaar, face_b64, bool(faces))
+    return json_response(payload, status)
+
+
+async def process_aadhaar(request):
+    """Process uploaded Aadhaar images (single or both) or an e-Aadhaar PDF"""
+    # deadline_ms counts from here, before the upload is read and the request queued
+    started_at = time.time()
+    form = await read_form(request)
+    get = form_lookup(request, form)
+    has_front = bool(uploads(form, 'front'))
+    has_back = bool(uploads(form, 'back'))
+    if not has_front and not has_back and not uploads(form, 'pdf'):
+        return json_response({'error': 'Upload at least one image (front or back) or an e-Aadhaar PDF'}, 400)
+    try:
+        options = process_options(get, started_at)
+        lane, tenant = schedule(get, request.headers)
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+
+    # Per-request names: requests run concurrently in the pool
+    request_id = uuid.uuid4().hex
+    uploaded = []
+    try:
+        front_path, back_path, pdf_path = await save_card_uploads(form, request_id)
+        uploaded = [front_path, back_path, pdf_path]
+        async with admitted(lane, tenant, estimate_decoded_bytes([front_path, back_path, pdf_path])):
+            layout = None
+            sides = None
+            if pdf_path:
+                try:
+                    result = await pool.run(process_pdf, pdf_path, os.path.join(UPLOAD_FOLDER, 'pdf', request_id),
+                                            password=get('password'), translate=False, **options)
+                except ValueError as e:
+                    return json_response({'error': str(e)}, 400)
+            else:
+                if not has_front or not has_back:
+                    front_path, back_path, layout = await pool.run(
+                        resolve_single_scan, front_path or back_path, os.path.join(UPLOAD_FOLDER, 'splits', request_id))
+                else:
+                    front_path, back_path, sides = await order_uploads(get, form, front_path, back_path)
+                result = await pool.run(process_images, front_path, back_path, translate=False, **options)
+
+        # The slot is free again: translation only waits on the network
+        await translate(result)
+        upload_info = {
+            'front_uploaded': has_front,
+            'back_uploaded': has_back,
+            'input_type': result.input_type,
+            'single_image_mode': has_front != has_back,
+            'split_scan': bool(layout and layout['regions']),
+            'layout_regions': layout['regions'] if layout else [],
+        }
+        if sides:
+            upload_info['sides'] = sides
+        return await render_result(request, result, options['profile'], upload_info)
+    except (SchedulerBusy, MemoryBudgetExceeded) as e:
+        return busy_response(e)
+    except Exception as e:
+        return json_response({'error': f'Processing error: {str(e)}'}, 500)
+    finally:
+        await asyncio.to_thread(remove_uploads, request_id, uploaded)
+
+
+async def process_aadhaar_burst(request):
+    """Process a burst of frames per side (several `front` / `back` files), see app.process_aadhaar_burst"""
+    # deadline_ms counts from here, before the upload is read and the request queued
+    started_at = time.time()
+    form = await read_form(request)
+    get = form_lookup(request, form)
+    front_files = uploads(form, 'front')
+    back_files = uploads(form, 'back')
+    if not front_files and not back_files:
+        return json_response({'error': 'Upload at least one front or back frame'}, 400)
+    try:
+        options = process_options(get, started_at)
+        lane, tenant = schedule(get, request.headers)
+        max_frames = int(get('max_frames', MAX_BURST_FRAMES))
+        if max_frames <= 0:
+            raise ValueError('max_frames must be a positive integer')
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+
+    burst_id = uuid.uuid4().hex
+    front_paths = []
+    back_paths = []
+    try:
+        for i, f in enumerate(front_files):
+            front_paths.append(await save_upload(f, os.path.join(UPLOAD_FOLDER, 'burst', f'{burst_id}_front_{i}.jpg')))
+        for i, f in enumerate(back_files):
+            back_paths.append(await save_upload(f, os.path.join(UPLOAD_FOLDER, 'burst', f'{burst_id}_back_{i}.jpg')))
+        # Frames run one at a time, so the budget is charged for the largest pair only
+        estimate = max(estimate_decoded_bytes([f]) for f in front_paths or [None]) + \
+            max(estimate_decoded_bytes([b]) for b in back_paths or [None])
+        async with admitted(lane, tenant, estimate):
+            result = await pool.run(process_burst, front_paths or back_paths, back_paths or front_paths,
+                                    max_frames=max_frames, translate=False, **options)
+        await translate(result)
+        upload_info = {
+            'front_uploaded': bool(front_files),
+            'back_uploaded': bool(back_files),
+            'input_type': 'burst',
+            'front_frames': len(front_paths),
+            'back_frames': len(back_paths),
+        }
+        return await render_result(request, result, options['profile'], upload_info,
+                                   extra={'burst': burst_summary(result.burst)})
+    except (SchedulerBusy, MemoryBudgetExceeded) as e:
+        return busy_response(e)
+    except Exception as e:
+        return json_response({'error': f'Processing error: {str(e)}'}, 500)
+    finally:
+        await asyncio.to_thread(remove_uploads, burst_id, front_paths + back_paths)
+
+
+async def process_aadhaar_stream(request):
+    """Like /process, streaming each section as its stage finishes in the pool (see app.process_aadhaar_stream)"""
+    # deadline_ms counts from here, before the upload is read and the request queued
+    started_at = time.time()
+    form = await read_form(request)
+    get = form_lookup(request, form)
+    has_front = bool(uploads(form, 'front'))
+    has_back = bool(uploads(form, 'back'))
+    if not has_front and not has_back and not uploads(form, 'pdf'):
+        return json_response({'error': 'Upload at least one image (front or back) or an e-Aadhaar PDF'}, 400)
+    try:
+        options = process_options(get, started_at)
+        lane, tenant = schedule(get, request.headers)
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+
+    request_id = uuid.uuid4().hex
+    uploaded = []
+    # The slot and the memory reservation are held until the stream ends
+    try:
+        front_path, back_path, pdf_path = await save_card_uploads(form, request_id)
+        uploaded = [front_path, back_path, pdf_path]
+        release_admission = await admit(lane, tenant, estimate_decoded_bytes(uploaded))
+    except Exception as e:
+        await asyncio.to_thread(remove_uploads, request_id, uploaded)
+        if isinstance(e, (SchedulerBusy, MemoryBudgetExceeded)):
+            return busy_response(e)
+        return json_response({'error': f'Processing error: {str(e)}'}, 500)
+
+    def release():
+        release_admission()
+        remove_uploads(request_id, uploaded)
+
+    stream = None
+    try:
+        if pdf_path:
+            stream = pool.stream(iter_process_pdf, pdf_path, os.path.join(UPLOAD_FOLDER, 'pdf', request_id),
+                                 password=get('password'), translate=False, **options)
+        else:
+            if not has_front or not has_back:
+                front_path, back_path, _ = await pool.run(
+                    resolve_single_scan, front_path or back_path, os.path.join(UPLOAD_FOLDER, 'splits', request_id))
+            else:
+                front_path, back_path, _ = await order_uploads(get, form, front_path, back_path)
+            stream = pool.stream(iter_process_images, front_path, back_path, translate=False, **options)
+        # Wait for the first event here so a bad PDF password is still a plain 400
+        first = await stream.__anext__()
+    except Exception as e:
+        if stream is not None:
+            await stream.aclose()
+        await asyncio.to_thread(release)
+        if isinstance(e, ValueError):
+            return json_response({'error': str(e)}, 400)
+        return json_response({'error': f'Processing error: {str(e)}'}, 500)
+
+    sse = 'text/event-stream' in request.headers.get('accept', '')
+
+    async def generate():
+        try:
+            yield encode_event(*first, sse)
+            async for stage, update in stream:
+                yield encode_event(stage, update, sse)
+            result = stream.result
+            if translation_planned(result.plan):
+                await translate(result)
+                yield encode_event('translate', stage_update('translate', result), sse)
+            final = await asyncio.to_thread(finish_stream, result, request_id, logger)
+            yield encode_event('final', final, sse)
+        except Exception as e:
+            yield encode_event('error', {'error': f'Processing error: {str(e)}', 'request_id': request_id}, sse)
+        finally:
+            await stream.aclose()
+            await asyncio.to_thread(release)
+
+    return StreamingResponse(generate(), media_type='text/event-stream' if sse else 'application/x-ndjson',
+                             headers={'X-Request-ID': request_id, 'X-Accel-Buffering': 'no'})
+
+
+async def too_large(request, exc):
+    return json_response({'error': 'Request body too large'}, 413)
+
+
+async def not_found(request, exc):
+    """Handle 404 errors (and other HTTP errors with their own status)"""
+    if exc.status_code != 404:
+        return json_response({'error': exc.detail}, exc.status_code)
+    return json_response({
+        'error': 'Endpoint not found',
+        'message': 'Use / to see available endpoints'
+    }, 404)
+
+
+async def server_error(request, exc):
+    """Handle 500 errors"""
+    return json_response({'error': 'Server error'}, 500)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Warm the pool in the background: /ready reports 503 until it is done
+    warm = asyncio.get_running_loop().run_in_executor(None, pool.start)
+    warm.add_done_callback(lambda f: f.cancelled() or f.exception() is None
+                           or logger.error('Process pool warm-up failed: %s', f.exception()))
+    try:
+        yield
+    finally:
+        warm.cancel()
+        await asyncio.to_thread(pool.shutdown)
+        admission_threads.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        Route('/', index, methods=['GET']),
+        Route('/health', health, methods=['GET']),
+        Route('/ready', ready, methods=['GET']),
+        Route('/duplicates', duplicates, methods=['GET', 'POST']),
+        Route('/metrics', metrics, methods=['GET']),
+        Route('/version', version, methods=['GET']),
+        Route('/process', process_aadhaar, methods=['POST']),
+        Route('/process/burst', process_aadhaar_burst, methods=['POST']),
+        Route('/process/stream', process_aadhaar_stream, methods=['POST']),
+    ],
+    exception_handlers={RequestTooLarge: too_large, HTTPException: not_found, 500: server_error},
+    lifespan=lifespan,
+)
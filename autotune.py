@@ -0,0 +1,240 @@
+"""
+Tesseract configuration autotuning.
+
+    python autotune.py corpus/labels.jsonl -o config/tesseract_tuned.json
+
+The corpus is a JSONL file with one labeled card per line; paths are
+relative to the file:
+
+    {"front": "001_front.jpg", "back": "001_back.jpg",
+     "fields": {"name": "...", "dob": "01/02/1990", "gender": "Male",
+                "aadhaar": "234567890124", "pincode": "560001", ...}}
+
+For each zone (tesseract_config.ZONES) every combination of engine mode,
+page segmentation mode, preprocessing and scale in the zone's grid is run
+over the corpus. A page zone's accuracy is the share of the labeled fields
+of its side that parse_ocr_text reads correctly from the pass; the number
+zone's is the share of cards whose digit-only read of the number strip (the
+first variant only) gives the labeled number. The fastest setting (mean time
+per card) whose accuracy reaches the zone's floor is written; when none
+does, the most accurate one, marked "below_floor". The default floor is the
+accuracy of the built-in settings, so tuning never trades accuracy for speed.
+Cards are run one at a time so the timings are not skewed by contention.
+"""
+import itertools
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+import pytesseract
+
+from modules.ocr_parser_new import parse_ocr_text, extract_aadhaar_candidates
+from modules.ocr_reader import extract_ocr_data, find_number_region, ocr_digits_in_region
+from modules.result_model import FIELD_SIDES
+from modules.serialization import dumps_bytes
+from modules.tesseract_config import (
+    TUNED_CONFIG_VERSION, DEFAULT_TUNED_CONFIG_PATH, ZONES, DEFAULT_ZONE_SETTINGS, SETTING_KEYS,
+    PAGE_PREPROCESS, NUMBER_PREPROCESS,
+)
+
+
+# Values swept per zone kind. oem 0/2 need the legacy models, which most installs lack;
+# settings Tesseract rejects are recorded as errors and skipped.
+PAGE_GRID = {"oem": (1, 3), "psm": (3, 4, 6, 11), "preprocess": PAGE_PREPROCESS, "scale": (0.75, 1.0, 1.5)}
+NUMBER_GRID = {"oem": (1, 3), "psm": (7, 8, 13), "preprocess": NUMBER_PREPROCESS, "scale": (1.5, 2.0, 3.0)}
+
+
+def read_corpus(path):
+    """Labeled cards of a corpus file, with absolute image paths"""
+    base = os.path.dirname(os.path.abspath(path))
+    cards = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            card = json.loads(line)
+            if not card.get("fields"):
+                raise ValueError(f"{path}:{n}: card has no labeled fields")
+            for side in ("front", "back"):
+                if card.get(side):
+                    card[side] = os.path.join(base, card[side])
+            cards.append(card)
+    return cards
+
+
+def normalize(field, value):
+    if value is None:
+        return None
+    if field in ("aadhaar", "pincode"):
+        return re.sub(r"\D", "", str(value)) or None
+    return " ".join(str(value).split()).casefold() or None
+
+
+def grid_settings(zone):
+    grid = NUMBER_GRID if zone == "number" else PAGE_GRID
+    for values in itertools.product(*(grid[key] for key in SETTING_KEYS)):
+        yield dict(zip(SETTING_KEYS, values))
+
+
+def zone_samples(cards, zone):
+    """(image path, expected) per card usable for a zone.
+
+    Page zones expect {field: value} for the labeled fields of their side;
+    the number zone expects the number and also needs the strip's box, found
+    by a pass with the built-in front settings.
+    """
+    samples = []
+    for card in cards:
+        if zone != "number":
+            expected = {f: normalize(f, v) for f, v in card["fields"].items()
+                        if FIELD_SIDES.get(f) == zone and normalize(f, v)}
+            if card.get(zone) and expected:
+                samples.append((card[zone], expected))
+            continue
+        number = normalize("aadhaar", card["fields"].get("aadhaar"))
+        if not number or not card.get("front"):
+            continue
+        words = extract_ocr_data(card["front"], settings=DEFAULT_ZONE_SETTINGS["front"], script_aware=False)["words"]
+        box = find_number_region(words)
+        if box is not None:
+            samples.append(((card["front"], box), number))
+    return samples
+
+
+def run_sample(zone, sample, settings):
+    """(seconds, fields right, fields expected) of one card under one setting"""
+    source, expected = sample
+    started = time.perf_counter()
+    if zone == "number":
+        image_path, box = source
+        text = next(ocr_digits_in_region(image_path, box, settings=settings), "")
+        elapsed = time.perf_counter() - started
+        candidates = extract_aadhaar_candidates(text)
+        return elapsed, int(bool(candidates) and candidates[0]["number"] == expected), 1
+    text = extract_ocr_data(source, settings=settings)["text"]
+    elapsed = time.perf_counter() - started
+    details = parse_ocr_text(text)
+    right = sum(1 for f, value in expected.items() if normalize(f, details.get(f)) == value)
+    return elapsed, right, len(expected)
+
+
+def evaluate(zone, samples, settings):
+    """Accuracy and mean time per card of one setting over a zone's samples"""
+    total_s = 0.0
+    right = expected = 0
+    try:
+        for sample in samples:
+            elapsed, r, n = run_sample(zone, sample, settings)
+            total_s += elapsed
+            right += r
+            expected += n
+    except Exception as e:
+        return {**settings, "accuracy": 0.0, "ms": None, "error": str(e)}
+    return {**settings, "accuracy": round(right / expected, 4) if expected else 0.0,
+            "ms": round(total_s / len(samples) * 1000.0, 1)}
+
+
+def pick(results, floor):
+    """Fastest result at or above `floor`, else the most accurate (fastest among ties)"""
+    usable = [r for r in results if r["ms"] is not None]
+    if not usable:
+        return None
+    meeting = [r for r in usable if r["accuracy"] >= floor]
+    if meeting:
+        return {**min(meeting, key=lambda r: r["ms"]), "below_floor": False}
+    return {**min(usable, key=lambda r: (-r["accuracy"], r["ms"])), "below_floor": True}
+
+
+def tune_zone(zone, cards, floor=None, log=None):
+    """Sweep one zone. Returns (chosen entry or None, all results)"""
+    samples = zone_samples(cards, zone)
+    if not samples:
+        return None, []
+    baseline = evaluate(zone, samples, DEFAULT_ZONE_SETTINGS[zone])
+    # The built-in settings compete too: when nothing beats them, they are kept
+    results = [baseline]
+    for settings in grid_settings(zone):
+        result = evaluate(zone, samples, settings)
+        results.append(result)
+        if log is not None:
+            log.write(dumps_bytes({"zone": zone, **result}) + b"\n")
+    floor = baseline["accuracy"] if floor is None else floor
+    chosen = pick(results, floor)
+    if chosen is None:
+        return None, results
+    chosen.pop("error", None)
+    chosen.update({"floor": floor, "cards": len(samples),
+                   "baseline": {"accuracy": baseline["accuracy"], "ms": baseline["ms"]}})
+    return chosen, results
+
+
+def parse_floors(values):
+    """--floor values: "0.95" for every zone or "zone=0.95" for one"""
+    floors = {}
+    for value in values or ():
+        zone, _, number = value.rpartition("=")
+        for z in ([zone] if zone else ZONES):
+            if z not in ZONES:
+                raise ValueError(f"unknown zone {z!r}")
+            floors[z] = float(number)
+    return floors
+
+
+def tesseract_version():
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except Exception:
+        return None
+
+
+def autotune(corpus_path, zones=ZONES, floors=None, log_path=None, previous=None):
+    """Tune the given zones over a corpus. Returns the tuned settings file's dict.
+
+    Zones of `previous` (an earlier tuned settings dict) that are not re-tuned are kept.
+    """
+    cards = read_corpus(corpus_path)
+    floors = floors or {}
+    kept = {}
+    if previous and previous.get("version") == TUNED_CONFIG_VERSION:
+        kept = {z: entry for z, entry in previous.get("zones", {}).items() if z not in zones}
+    config = {"version": TUNED_CONFIG_VERSION, "created": datetime.now().isoformat(),
+              "tesseract": tesseract_version(), "corpus": os.path.abspath(corpus_path), "zones": kept}
+    log = open(log_path, "wb") if log_path else None
+    try:
+        for zone in zones:
+            chosen, _ = tune_zone(zone, cards, floors.get(zone), log)
+            if chosen is not None:
+                config["zones"][zone] = chosen
+    finally:
+        if log is not None:
+            log.close()
+    return config
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pick the fastest Tesseract settings per zone that meet an accuracy floor")
+    parser.add_argument("corpus", help="labeled corpus (JSONL)")
+    parser.add_argument("-o", "--output", default=DEFAULT_TUNED_CONFIG_PATH, help="tuned settings file to write")
+    parser.add_argument("--zones", nargs="+", choices=ZONES, default=list(ZONES))
+    parser.add_argument("--floor", action="append", metavar="[ZONE=]ACCURACY",
+                        help="accuracy floor (0-1), for all zones or one; default: the built-in settings' accuracy")
+    parser.add_argument("--log", default=None, help="write every setting tried to this JSONL file")
+    args = parser.parse_args()
+
+    try:
+        floors = parse_floors(args.floor)
+    except ValueError as e:
+        parser.error(f"--floor: {e}")
+    previous = None
+    if os.path.exists(args.output):
+        with open(args.output, encoding="utf-8") as f:
+            previous = json.load(f)
+    config = autotune(args.corpus, zones=args.zones, floors=floors, log_path=args.log, previous=previous)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    print(json.dumps({"output": args.output, "zones": config["zones"]}, indent=2))
@@ -0,0 +1,237 @@
+"""
+Sharded backfills of an archive of scans.
+
+    # once, anywhere: list the work
+    python backfill.py manifest /archive -o manifest.jsonl
+    # on node i of N (no coordination needed): process its shard
+    python backfill.py run manifest.jsonl --shard i --shards N -o results/
+    # afterwards: merge the shard outputs, one record per job
+    python backfill.py merge results/*.jsonl -o merged.jsonl
+
+The manifest lists every job of the tree (files paired as in ingest.py)
+with each file's path, size and SHA-256. A job's id is the hash of its
+files' contents, so shard membership (job id modulo N) is the same on every
+node and for every run, and copies of the same scan share one id. Shard
+outputs are appended to as jobs finish; re-running a shard skips the jobs
+it already finished.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from ingest import INPUT_EXTENSIONS, plan_jobs
+from main import process_images, process_pdf, assemble_final, resolve_single_scan
+from modules.montage import MontageBatcher
+from modules.serialization import dumps_bytes
+
+
+MANIFEST_VERSION = 1
+
+HASH_CHUNK = 1024 * 1024
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def job_id(file_hashes):
+    """Content id of a job: its files' hashes in job order"""
+    return hashlib.sha256(":".join(file_hashes).encode("ascii")).hexdigest()
+
+
+def shard_of(job_id_hex, shards):
+    return int(job_id_hex[:16], 16) % shards
+
+
+def build_manifest(root, workers=None):
+    """Jobs of an input tree, sorted by id: {"id", "kind", "files": [{"path", "size", "sha256"}]}.
+
+    A job whose files are byte-identical to an earlier one is listed once,
+    with the other paths under "copies".
+    """
+    rels = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for name in filenames:
+            if not name.startswith(".") and name.lower().endswith(INPUT_EXTENSIONS):
+                rels.append(os.path.relpath(os.path.join(dirpath, name), root))
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        hashes = dict(zip(rels, pool.map(lambda rel: file_sha256(os.path.join(root, rel)), rels)))
+
+    jobs = {}
+    for job in plan_jobs({rel: 0.0 for rel in rels}, now=0.0, pair_wait_s=0.0):
+        files = [{"path": rel, "size": os.path.getsize(os.path.join(root, rel)), "sha256": hashes[rel]}
+                 for rel in job["files"]]
+        key = job_id([f["sha256"] for f in files])
+        if key in jobs:
+            jobs[key].setdefault("copies", []).append(job["files"])
+        else:
+            jobs[key] = {"id": key, "kind": job["kind"], "files": files}
+    return [jobs[key] for key in sorted(jobs)]
+
+
+def write_manifest(path, root, jobs):
+    with open(path, "wb") as f:
+        f.write(dumps_bytes({"manifest": MANIFEST_VERSION, "root": os.path.abspath(root),
+                             "created": datetime.now().isoformat(), "jobs": len(jobs)}) + b"\n")
+        for job in jobs:
+            f.write(dumps_bytes(job) + b"\n")
+
+
+def read_manifest(path):
+    """(header, jobs) of a manifest file"""
+    with open(path, encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("manifest") != MANIFEST_VERSION:
+            raise ValueError(f"{path} is not a version {MANIFEST_VERSION} manifest")
+        return header, [json.loads(line) for line in f if line.strip()]
+
+
+def read_records(path):
+    """Records of a shard output; a line cut short by a crash is skipped"""
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def run_job(job, root, work_dir, profile, deadline_ms, montage=None):
+    """Process one manifest job. Returns its output record"""
+    started = time.monotonic()
+    paths = [os.path.join(root, f["path"]) for f in job["files"]]
+    record = {"id": job["id"], "kind": job["kind"], "files": [f["path"] for f in job["files"]]}
+    try:
+        for path, f in zip(paths, job["files"]):
+            if os.path.getsize(path) != f["size"]:
+                raise ValueError(f"{f['path']} changed since the manifest was built")
+        options = {"deadline_ms": deadline_ms, "profile": profile, "montage": montage}
+        # PDF page images and combined-scan splits, removed after the job
+        job_dir = os.path.join(work_dir, job["id"][:16])
+        if job["kind"] == "pdf":
+            result = process_pdf(paths[0], job_dir, **options)
+        elif len(paths) == 2:
+            result = process_images(paths[0], paths[1], **options)
+        else:
+            front, back, _ = resolve_single_scan(paths[0], job_dir)
+            result = process_images(front, back, **options)
+        record["status"] = "ok"
+        record["result"] = assemble_final(result)
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = str(e)
+    finally:
+        shutil.rmtree(os.path.join(work_dir, job["id"][:16]), ignore_errors=True)
+    record["processing_ms"] = round((time.monotonic() - started) * 1000.0, 1)
+    record["ts"] = datetime.now().isoformat()
+    return record
+
+
+def run_shard(manifest_path, shard, shards, out_dir, root=None, workers=None, profile="standard",
+              deadline_ms=None):
+    """Process the jobs of one shard, appending to <out_dir>/shard-<i>-of-<N>.jsonl.
+
+    Jobs with an "ok" record in that file are skipped, so a shard can be
+    re-run after a crash or to retry its failures. Parallel jobs share their
+    weak-field re-reads through one MontageBatcher. Returns counts.
+    """
+    header, jobs = read_manifest(manifest_path)
+    root = root or header["root"]
+    os.makedirs(out_dir, exist_ok=True)
+    out_path = os.path.join(out_dir, f"shard-{shard}-of-{shards}.jsonl")
+    finished = {r["id"] for r in read_records(out_path) if r.get("status") == "ok"}
+    todo = [j for j in jobs if shard_of(j["id"], shards) == shard and j["id"] not in finished]
+    work_dir = os.path.join(out_dir, f"work-{shard}")
+
+    counts = {"shard": shard, "shards": shards, "skipped": len(finished), "ok": 0, "failed": 0}
+    workers = workers or os.cpu_count() or 1
+    # A lone worker has no other cards to share a montage with
+    montage = MontageBatcher() if workers > 1 else None
+    started = time.monotonic()
+    with open(out_path, "ab") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_job, j, root, work_dir, profile, deadline_ms, montage) for j in todo]
+        # Written as they finish, so a crash loses only the jobs in flight
+        for future in as_completed(futures):
+            record = future.result()
+            out.write(dumps_bytes(record) + b"\n")
+            out.flush()
+            counts[record["status"]] += 1
+    elapsed = time.monotonic() - started
+    counts["elapsed_s"] = round(elapsed, 1)
+    counts["jobs_per_min"] = round(len(todo) / elapsed * 60.0, 2) if elapsed > 0 else None
+    if montage is not None:
+        counts["montage"] = montage.stats()
+    return counts
+
+
+def merge_outputs(paths, out_path):
+    """Merge shard outputs into one record per job id ("ok" records win). Returns counts"""
+    merged = {}
+    read = 0
+    for path in paths:
+        for record in read_records(path):
+            read += 1
+            kept = merged.get(record["id"])
+            if kept is None or (kept.get("status") != "ok" and record.get("status") == "ok"):
+                merged[record["id"]] = record
+    with open(out_path, "wb") as f:
+        for key in sorted(merged):
+            f.write(dumps_bytes(merged[key]) + b"\n")
+    return {
+        "read": read,
+        "jobs": len(merged),
+        "duplicates": read - len(merged),
+        "failed": sum(1 for r in merged.values() if r.get("status") != "ok"),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build, run and merge sharded backfills")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("manifest", help="list the jobs of an input tree")
+    p.add_argument("root", help="input tree")
+    p.add_argument("-o", "--output", default="manifest.jsonl")
+    p.add_argument("--workers", type=int, default=None, help="parallel file hashing (default: CPU count)")
+
+    p = commands.add_parser("run", help="process one shard of a manifest")
+    p.add_argument("manifest")
+    p.add_argument("--shard", type=int, required=True, help="shard index, 0 <= shard < shards")
+    p.add_argument("--shards", type=int, required=True, help="number of shards (nodes)")
+    p.add_argument("-o", "--output-dir", default=os.path.join("outputs", "backfill"))
+    p.add_argument("--root", default=None, help="where the input tree is mounted on this node (default: as in the manifest)")
+    p.add_argument("--workers", type=int, default=None, help="parallel jobs (default: CPU count)")
+    p.add_argument("--profile", choices=("minimal", "standard", "debug"), default="standard")
+    p.add_argument("--deadline-ms", type=int, default=None, help="time budget per job")
+
+    p = commands.add_parser("merge", help="merge shard outputs, one record per job")
+    p.add_argument("inputs", nargs="+", help="shard output files")
+    p.add_argument("-o", "--output", default="merged.jsonl")
+
+    args = parser.parse_args()
+    if args.command == "manifest":
+        jobs = build_manifest(args.root, workers=args.workers)
+        write_manifest(args.output, args.root, jobs)
+        summary = {"manifest": args.output, "jobs": len(jobs), "files": sum(len(j["files"]) for j in jobs)}
+    elif args.command == "run":
+        if not 0 <= args.shard < args.shards:
+            parser.error("--shard must be in [0, --shards)")
+        summary = run_shard(args.manifest, args.shard, args.shards, args.output_dir, root=args.root,
+                            workers=args.workers, profile=args.profile, deadline_ms=args.deadline_ms)
+    else:
+        summary = merge_outputs(args.inputs, args.output)
+    print(json.dumps(summary, indent=2))
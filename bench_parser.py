@@ -0,0 +1,123 @@
+"""
+Worst-case benchmark of the OCR text parser.
+
+    python bench_parser.py --budget-ms 50
+
+Runs parse_ocr_text on adversarial and oversized inputs: text shaped to
+make backtracking patterns or per-match rescans blow up (labels repeated
+inside one long name run, long blank tails after a label, thousands of
+number candidates on one line, header/footer noise) and plain card text
+repeated far past the input caps. Each case is generated at sizes below,
+at and above ocr_parser_new.MAX_PARSE_CHARS; the time of a size is the best
+of --repeat runs. Prints one JSON line per case and size and exits with 1
+when any of them exceeds the budget. Since the parser cuts its input to the
+caps, times stop growing once a case is past them.
+"""
+import json
+import random
+import sys
+import time
+
+from modules.ocr_parser_new import parse_ocr_text, MAX_PARSE_CHARS, MAX_LINE_CHARS
+
+
+# Time allowed for one parse_ocr_text call, whatever the input
+DEFAULT_BUDGET_MS = 50.0
+
+DEFAULT_SIZES = (1000, MAX_PARSE_CHARS, 4 * MAX_PARSE_CHARS, 50 * MAX_PARSE_CHARS)
+
+CARD_TEXT = (
+    "Government of India\n"
+    "Ramesh Kumar Sharma\n"
+    "DOB: 01/02/1990\n"
+    "Male / पुरुष\n"
+    "2345 6789 0124\n"
+    "Address: S/O Suresh Sharma, House No 12, MG Road, Bangalore, Karnataka - 560001\n"
+    "C/O: Suresh Sharma, DIST: Bangalore Urban\n"
+    "help@uidai.gov.in www.uidai.gov.in\n"
+)
+
+
+def _repeat(unit, n):
+    return (unit * (n // len(unit) + 1))[:n]
+
+
+def _lines(unit, n):
+    """`unit` repeated into lines as long as the line cap, about n characters in all"""
+    line = _repeat(unit, MAX_LINE_CHARS)
+    return "\n".join([line] * max(1, n // (MAX_LINE_CHARS + 1)))
+
+
+def _noise(n, seed=0):
+    rng = random.Random(seed)
+    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789 .,:/-@|\n"
+    return "".join(rng.choice(alphabet) for _ in range(n))
+
+
+# name -> text of about n characters
+CASES = {
+    # Real card text, repeated
+    "card_repeated": lambda n: _repeat(CARD_TEXT, n),
+    # One guardian name run spanning every line, with the label repeated inside it
+    # and no comma at the end: each label used to rescan the rest of the run.
+    # The closing line is long enough to survive the header/footer filter.
+    "guardian_label_chain": lambda n: _lines("CARE OF Ram FATHER Shyam ", n) + "\nRam 5",
+    "guardian_one_line": lambda n: _repeat("CARE OF Ram FATHER Shyam ", n - 1) + "5",
+    # Every run ends in a label whose separator takes the colon that ended the run
+    "guardian_colon_chain": lambda n: _lines("Father: Ram ", n) + "\nRam 5",
+    # Blank space after a label: the two whitespace runs around an optional colon
+    # used to trade characters (enough letters follow to pass the filter)
+    "gender_blank_run": lambda n: _lines("Gender" + " " * 200 + "x" + "Ramesh" * 30 + " ", n),
+    "gender_one_line": lambda n: "Gender" + " " * (n // 3) + "x" + _repeat("Ramesh ", n - n // 3),
+    "address_blank_tail": lambda n: "Address" + " \n" * (n // 2),
+    # Number candidates packed on lines: each one used to rescan its line
+    "aadhaar_candidates": lambda n: _lines("2345 6789 0124 VID ", n),
+    "aadhaar_one_line": lambda n: _repeat("2345 6789 0124 x ", n),
+    "digit_run": lambda n: _repeat("2345678901", n),
+    # Header/footer phrases and lines the noise filter has to count through
+    "header_footer_noise": lambda n: _lines("UIDAI Government of India help@uidai.gov.in ... ", n),
+    "no_newlines": lambda n: _repeat("Ramesh Kumar DIST: Bangalore Karnataka ", n),
+    "blank_lines": lambda n: "\n" * n,
+    "random_noise": lambda n: _noise(n),
+}
+
+
+def time_parse(text, repeat):
+    """Best time of `repeat` parse_ocr_text calls, in milliseconds"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        parse_ocr_text(text)
+        elapsed = (time.perf_counter() - started) * 1000.0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_benchmark(cases=None, sizes=DEFAULT_SIZES, budget_ms=DEFAULT_BUDGET_MS, repeat=3, out=sys.stdout):
+    """Time every case at every size. Returns the results over budget"""
+    over = []
+    for name in cases or CASES:
+        for size in sizes:
+            text = CASES[name](size)
+            ms = time_parse(text, repeat)
+            result = {"case": name, "chars": len(text), "ms": round(ms, 2), "within_budget": ms <= budget_ms}
+            out.write(json.dumps(result) + "\n")
+            if ms > budget_ms:
+                over.append(result)
+    return over
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check that parse_ocr_text stays within a time budget on adversarial input")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="time allowed per parse")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=None)
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="input sizes in characters")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per size; the best is kept")
+    args = parser.parse_args()
+
+    over = run_benchmark(args.cases, args.sizes, args.budget_ms, args.repeat)
+    print(json.dumps({"budget_ms": args.budget_ms, "max_parse_chars": MAX_PARSE_CHARS,
+                      "max_line_chars": MAX_LINE_CHARS, "over_budget": len(over)}))
+    sys.exit(1 if over else 0)
@@ -0,0 +1,23 @@
+"""
+Gunicorn settings for the OcrVerification API.
+The app is imported once in the master (preload_app) so heavy modules and
+lookup tables are shared copy-on-write; each worker then warms up on its own
+and reports through /ready when it is done.
+"""
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WORKERS", "4"))
+# Threads beyond OCR_SCHEDULER_SLOTS wait in the scheduler lanes (modules/scheduler.py),
+# where interactive requests are served ahead of bulk ones
+worker_class = "gthread"
+threads = int(os.environ.get("THREADS", "8"))
+timeout = 120
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Threads and Tesseract engines do not survive fork; start them per worker
+    from modules.startup import start_warm_up
+
+    start_warm_up()
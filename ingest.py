@@ -0,0 +1,355 @@
+"""
+Watch-folder ingestion daemon.
+
+Partners drop scans anywhere under <root>/inbox. The daemon polls the tree
+(polling also works on NFS/SMB volumes, where inotify does not), claims
+settled files by renaming them into <root>/claimed/<node>/ - a rename is
+atomic, so several daemons on different nodes can share one volume and each
+file is claimed by exactly one of them - pairs front/back files, runs each
+job through the pipeline on a worker pool and moves its files to
+<root>/done or <root>/failed. Results go to the JSONL output sink in
+<root>/results; backlog and throughput go to <root>/status/<node>.json.
+
+    python ingest.py /mnt/scans --workers 4
+"""
+import json
+import os
+import re
+import shutil
+import signal
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import quote, unquote
+
+from main import process_images, process_pdf, assemble_final, resolve_single_scan
+from modules.montage import MontageBatcher
+from modules.output_sink import get_output_sink
+from modules.side_classifier import filename_side
+
+
+INPUT_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp", ".webp", ".pdf")
+
+# Names of files that are still being uploaded
+PARTIAL_SUFFIXES = (".part", ".partial", ".tmp", ".crdownload")
+
+# A file must be unchanged this long before it is claimed
+DEFAULT_SETTLE_S = 5.0
+
+# How long a front or back file waits for its other side before it runs alone
+DEFAULT_PAIR_WAIT_S = 60.0
+
+DEFAULT_POLL_S = 2.0
+
+# Finished jobs kept for the throughput figures
+THROUGHPUT_WINDOW_S = 300.0
+
+# Side tokens filename_side accepts, only as whole tokens: "front"/"back" between
+# non-letters, or the old "aff"/"ab" names on their own ("affidavit" keeps its letters)
+_SIDE_TOKEN_RE = re.compile(r"(?<![a-z])(?:front|back)(?![a-z])|^(?:af+|ab)(?![a-z])")
+
+
+def pair_key(name):
+    """File name without its side token, e.g. "1234_front.jpg" -> "1234" """
+    stem = os.path.splitext(name.lower())[0]
+    return _SIDE_TOKEN_RE.sub("", stem).strip("_-. ")
+
+
+def plan_jobs(files, now, pair_wait_s):
+    """Group settled inbox files into jobs.
+
+    `files` maps inbox-relative paths to the time they were first seen.
+    PDFs and images whose name gives no side are jobs of their own (an
+    unlabelled image may be a combined scan); front/back files of one folder
+    are paired only when their names match once the side is removed (see
+    pair_key), e.g. 1234_front.jpg + 1234_back.jpg. A labelled file without
+    its other side waits `pair_wait_s` before running alone.
+    Returns jobs as {"kind": "pdf" | "pair" | "single", "files": [rel, ...]}.
+    """
+    jobs = []
+    by_dir = {}
+    for rel in sorted(files):
+        by_dir.setdefault(os.path.dirname(rel), []).append(rel)
+
+    for rels in by_dir.values():
+        fronts, backs = {}, {}
+        for rel in rels:
+            name = os.path.basename(rel)
+            side = filename_side(name)
+            if name.lower().endswith(".pdf"):
+                jobs.append({"kind": "pdf", "files": [rel]})
+            elif side == "front":
+                fronts.setdefault(pair_key(name), rel)
+            elif side == "back":
+                backs.setdefault(pair_key(name), rel)
+            else:
+                jobs.append({"kind": "single", "files": [rel]})
+
+        for key in sorted(set(fronts) & set(backs)):
+            jobs.append({"kind": "pair", "files": [fronts.pop(key), backs.pop(key)]})
+        for rel in list(fronts.values()) + list(backs.values()):
+            if now - files[rel] >= pair_wait_s:
+                jobs.append({"kind": "single", "files": [rel]})
+    return jobs
+
+
+class IngestDaemon:
+    """Polls an inbox tree and processes what lands there (see the module docstring)"""
+
+    def __init__(self, root, workers=None, node_id=None, settle_s=DEFAULT_SETTLE_S, pair_wait_s=DEFAULT_PAIR_WAIT_S,
+                 poll_s=DEFAULT_POLL_S, profile="standard", deadline_ms=None):
+        self.root = root
+        self.node_id = node_id or socket.gethostname()
+        self.inbox = os.path.join(root, "inbox")
+        self.claimed = os.path.join(root, "claimed", self.node_id)
+        self.done = os.path.join(root, "done")
+        self.failed = os.path.join(root, "failed")
+        self.status_path = os.path.join(root, "status", f"{self.node_id}.json")
+        for folder in (self.inbox, self.claimed, self.done, self.failed, os.path.dirname(self.status_path)):
+            os.makedirs(folder, exist_ok=True)
+
+        self.workers = workers or os.cpu_count() or 1
+        self.settle_s = settle_s
+        self.pair_wait_s = pair_wait_s
+        self.poll_s = poll_s
+        self.profile = profile
+        self.deadline_ms = deadline_ms
+        self.sink = get_output_sink(os.path.join(root, "results"))
+        # Weak-field re-reads of the jobs in flight share montages
+        self.montage = MontageBatcher() if self.workers > 1 else None
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest")
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # Inbox-relative path -> (size, mtime, first seen)
+        self._seen = {}
+        self.in_flight = 0
+        self.backlog = 0
+        self.waiting_for_pair = 0
+        self.claimed_jobs = 0
+        self.done_jobs = 0
+        self.failed_jobs = 0
+        self.lost_claims = 0
+        self._finished = deque()
+        self.started = datetime.now().isoformat()
+
+    # ---- inbox ----
+
+    def scan(self):
+        """Settled input files in the inbox, {rel: first seen}. Also updates the backlog count"""
+        now = time.monotonic()
+        present = {}
+        for dirpath, dirnames, filenames in os.walk(self.inbox):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for name in filenames:
+                lower = name.lower()
+                if name.startswith(".") or lower.endswith(PARTIAL_SUFFIXES) or not lower.endswith(INPUT_EXTENSIONS):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                rel = os.path.relpath(path, self.inbox)
+                prev = self._seen.get(rel)
+                if prev is None or prev[:2] != (st.st_size, st.st_mtime):
+                    # New or still growing: the settle time starts over
+                    self._seen[rel] = (st.st_size, st.st_mtime, now)
+                present[rel] = self._seen[rel]
+        self._seen = present
+        self.backlog = len(present)
+        return {rel: seen for rel, (size, _, seen) in present.items() if size > 0 and now - seen >= self.settle_s}
+
+    def claim(self, job):
+        """Move a job's files into this node's claimed folder. Returns the claimed paths or None.
+
+        Every node plans a job's files in the same order, so when two daemons
+        race for a pair the loser fails on the first file and leaves the pair alone.
+        """
+        claimed = []
+        for rel in job["files"]:
+            target = os.path.join(self.claimed, quote(rel, safe=""))
+            try:
+                os.rename(os.path.join(self.inbox, rel), target)
+            except FileNotFoundError:
+                if not claimed:
+                    with self._lock:
+                        self.lost_claims += 1
+                    return None
+                continue
+            claimed.append(target)
+            self._seen.pop(rel, None)
+        return claimed
+
+    def requeue_claims(self):
+        """Put back files this node claimed but did not finish (e.g. before a crash)"""
+        for name in os.listdir(self.claimed):
+            path = os.path.join(self.claimed, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            target = os.path.join(self.inbox, unquote(name))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.rename(path, target)
+
+    # ---- jobs ----
+
+    def run_job(self, job, paths):
+        started = time.monotonic()
+        request_id = uuid.uuid4().hex
+        work_dir = os.path.join(self.claimed, request_id)
+        outcome = "failed"
+        try:
+            options = {"deadline_ms": self.deadline_ms, "profile": self.profile, "montage": self.montage}
+            if job["kind"] == "pdf":
+                result = process_pdf(paths[0], work_dir, **options)
+            elif len(paths) == 2:
+                result = process_images(paths[0], paths[1], **options)
+            else:
+                front, back, _ = resolve_single_scan(paths[0], work_dir)
+                result = process_images(front, back, **options)
+            final = assemble_final(result)
+            final["request_id"] = request_id
+            final["ingest"] = {
+                "node": self.node_id,
+                "kind": job["kind"],
+                "files": job["files"],
+                "processing_ms": round((time.monotonic() - started) * 1000.0, 1),
+            }
+            self.sink.submit(final, request_id=request_id, source="ingest")
+            self._move(paths, self.done)
+            outcome = "done"
+        except Exception as e:
+            moved = self._move(paths, self.failed)
+            for path in moved:
+                with open(path + ".error.json", "w", encoding="utf-8") as f:
+                    json.dump({"request_id": request_id, "node": self.node_id, "error": str(e),
+                               "files": job["files"], "ts": datetime.now().isoformat()}, f, indent=2)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            with self._lock:
+                self.in_flight -= 1
+                if outcome == "done":
+                    self.done_jobs += 1
+                else:
+                    self.failed_jobs += 1
+                self._finished.append((time.monotonic(), time.monotonic() - started, len(paths)))
+
+    def _move(self, paths, folder):
+        """Move claimed files to `folder` under their inbox-relative path; returns the new paths"""
+        moved = []
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            rel = unquote(os.path.basename(path))
+            target = os.path.join(folder, rel)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.exists(target):
+                stem, ext = os.path.splitext(target)
+                target = f"{stem}.{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}{ext}"
+            os.rename(path, target)
+            moved.append(target)
+        return moved
+
+    # ---- status ----
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._finished and now - self._finished[0][0] > THROUGHPUT_WINDOW_S:
+                self._finished.popleft()
+            finished = list(self._finished)
+            window_min = THROUGHPUT_WINDOW_S / 60.0
+            return {
+                "node": self.node_id,
+                "started": self.started,
+                "updated": datetime.now().isoformat(),
+                "workers": self.workers,
+                "backlog_files": self.backlog,
+                "waiting_for_pair": self.waiting_for_pair,
+                "in_flight": self.in_flight,
+                "claimed": self.claimed_jobs,
+                "done": self.done_jobs,
+                "failed": self.failed_jobs,
+                "lost_claims": self.lost_claims,
+                "throughput": {
+                    "window_s": THROUGHPUT_WINDOW_S,
+                    "jobs_per_min": round(len(finished) / window_min, 2),
+                    "files_per_min": round(sum(n for _, _, n in finished) / window_min, 2),
+                    "mean_job_s": round(sum(d for _, d, _ in finished) / len(finished), 2) if finished else None,
+                },
+                "output_sink": self.sink.stats(),
+                "montage": self.montage.stats() if self.montage is not None else None,
+            }
+
+    def write_status(self):
+        tmp = self.status_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.stats(), f, indent=2)
+        os.replace(tmp, self.status_path)
+
+    # ---- main loop ----
+
+    def run(self, once=False):
+        """Poll, claim and dispatch until stop() (or, with `once`, until the inbox is drained)"""
+        self.requeue_claims()
+        if once:
+            self.settle_s = 0.0
+            self.pair_wait_s = 0.0
+        try:
+            while not self._stop.is_set():
+                files = self.scan()
+                jobs = plan_jobs(files, time.monotonic(), self.pair_wait_s)
+                self.waiting_for_pair = len(files) - sum(len(j["files"]) for j in jobs)
+                # Claim no more than the pool can start, leaving the rest to other nodes
+                for job in jobs:
+                    if self.in_flight >= self.workers:
+                        break
+                    paths = self.claim(job)
+                    if not paths:
+                        continue
+                    with self._lock:
+                        self.in_flight += 1
+                        self.claimed_jobs += 1
+                    self._pool.submit(self.run_job, job, paths)
+                self.write_status()
+                if once and not jobs and self.in_flight == 0:
+                    break
+                self._stop.wait(self.poll_s)
+        finally:
+            self._pool.shutdown(wait=True)
+            self.sink.flush(timeout=30)
+            self.write_status()
+
+    def stop(self):
+        self._stop.set()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Process Aadhaar scans dropped into <root>/inbox")
+    parser.add_argument("root", help="shared folder holding inbox/, claimed/, done/, failed/, results/ and status/")
+    parser.add_argument("--workers", type=int, default=None, help="parallel jobs (default: CPU count)")
+    parser.add_argument("--node-id", default=None, help="name of this daemon (default: host name)")
+    parser.add_argument("--settle-s", type=float, default=DEFAULT_SETTLE_S,
+                        help=f"seconds a file must be unchanged before it is claimed (default: {DEFAULT_SETTLE_S:g})")
+    parser.add_argument("--pair-wait-s", type=float, default=DEFAULT_PAIR_WAIT_S,
+                        help=f"seconds a front/back file waits for its other side (default: {DEFAULT_PAIR_WAIT_S:g})")
+    parser.add_argument("--poll-s", type=float, default=DEFAULT_POLL_S, help="seconds between inbox scans")
+    parser.add_argument("--profile", choices=("minimal", "standard", "debug"), default="standard",
+                        help="response profile of the stored results (default: standard)")
+    parser.add_argument("--deadline-ms", type=int, default=None, help="time budget per job")
+    parser.add_argument("--once", action="store_true", help="process what is in the inbox now and exit")
+    args = parser.parse_args()
+
+    daemon = IngestDaemon(args.root, workers=args.workers, node_id=args.node_id, settle_s=args.settle_s,
+                          pair_wait_s=args.pair_wait_s, poll_s=args.poll_s, profile=args.profile,
+                          deadline_ms=args.deadline_ms)
+    # Finish the jobs in flight on SIGTERM / Ctrl-C; unclaimed files stay for other nodes
+    signal.signal(signal.SIGTERM, lambda *_: daemon.stop())
+    signal.signal(signal.SIGINT, lambda *_: daemon.stop())
+    daemon.run(once=args.once)
@@ -2,9 +2,28 @@ import json
 import os
 from modules.qr_reader import extract_qr_data
 from modules.xml_parser import parse_aadhaar_xml
-from modules.ocr_reader import extract_text_from_image
-from modules.ocr_parser_new import parse_ocr_text
+from modules.ocr_reader import (
+    extract_ocr_data, find_number_region, ocr_digits_in_region, field_region, ocr_field_variants
+)
+from modules.ocr_parser_new import parse_ocr_text, extract_aadhaar_candidates, is_valid_aadhaar, parse_field
+from modules.confidence import (
+    FIELD_CONFIDENCE_THRESHOLD, field_confidence, value_words, weak_fields, score_fields, confidence_label
+)
 from modules.utils import extract_largest_face_base64
+from modules.deadline import Deadline
+from modules.planner import plan_pipeline, needs_front, needs_back
+from modules.quality import assess_image_quality
+from modules.layout import split_combined_scan
+from modules.side_classifier import assign_sides, filename_side
+from modules.memory import StageMemory
+from modules.result_model import PipelineResult
+from modules.burst import (
+    MAX_BURST_FRAMES, CandidatePool, rank_frames, add_front_candidates, add_back_candidates,
+    identity_validated, address_found, FRONT_FIELDS, BACK_FIELDS,
+)
+from modules.pdf_reader import (
+    is_pdf, read_pdf, rasterize_pdf, has_text_layer, pick_qr_image, pick_photo_image
+)
 
 try:
     from deep_translator import GoogleTranslator
@@ -13,10 +32,17 @@ except:
     TRANSLATOR_AVAILABLE = False
 
 
-def translate_to_english(text):
-    """Translate text to English using Google Translator"""
+def translate_to_english(text, deadline=None):
+    """Translate text to English using Google Translator.
+
+    Translation is optional work: when `deadline` has no room left for it the
+    original text is returned and the skip is recorded on the deadline.
+    """
     if not text or not TRANSLATOR_AVAILABLE:
         return text
+    if deadline is not None and not deadline.allows("translation"):
+        deadline.skip("translation")
+        return text
     try:
         # Limit text to 5000 chars to avoid API issues
         text_to_translate = text[:5000] if len(text) > 5000 else text
@@ -47,7 +73,8 @@ def find_images(folder="images"):
 
     Front name patterns: startswith af, aff, front
     Back name patterns: startswith ab, back
-    Returns tuple (front_path or None, back_path or None)
+    Returns tuple (front_path or None, back_path or None); use
+    sides_labeled() to tell a named pair from the fallback of two unnamed files.
     """
     if not os.path.isdir(folder):
         return None, None
@@ -72,212 +99,751 @@ def find_images(folder="images"):
     return front, back
 
 
-def process_images(front_path, back_path):
-    result = {
-        "front_image": front_path,
-        "back_image": back_path,
-        "qr_raw": None,
-        "xml_data": None,
-        "ocr_text_front": None,
-        "ocr_details_front": None,
-        "ocr_text_back": None,
-        "ocr_details_back": None,
-        "face_image_base64": None,
-    }
+def sides_labeled(front_path, back_path):
+    """True when both file names say their side (see modules.side_classifier.filename_side)"""
+    return (filename_side(os.path.basename(front_path)) == "front"
+            and filename_side(os.path.basename(back_path)) == "back")
+
+
+def recover_aadhaar_number(details, image_path, words, deadline=None):
+    """Re-read the Aadhaar number when OCR gave no checksum-valid candidate.
+
+    Only the strip holding the number (located from the OCR word boxes) is
+    re-OCR'd in digit-only mode. Updates `details` in place when a valid
+    number is found and records where the number came from.
+    """
+    if details.get('aadhaar_valid'):
+        return
+    box = find_number_region(words)
+    if box is None:
+        return
+    if deadline is not None and not deadline.allows("digit_reocr"):
+        deadline.skip("digit_reocr")
+        return
+    try:
+        for text in ocr_digits_in_region(image_path, box, deadline=deadline):
+            candidates = extract_aadhaar_candidates(text)
+            if candidates and candidates[0]['valid']:
+                details['aadhaar'] = candidates[0]['number']
+                details['aadhaar_valid'] = True
+                details['aadhaar_source'] = 'digit_reocr'
+                return
+    except Exception:
+        if deadline is not None and deadline.expired():
+            deadline.skip("digit_reocr")
+
+
+# Fields the weak-field retry loop can re-read per side (the number has its own retry)
+RETRY_FIELDS = {
+    "front": ("name", "dob", "gender"),
+    "back": ("pincode", "state"),
+}
+
+
+def refine_weak_fields(details, image_path, words, fields, deadline=None, threshold=FIELD_CONFIDENCE_THRESHOLD,
+                       montage=None):
+    """Re-read only the low-confidence fields of one side.
+
+    The line of each weak field (located from the OCR word boxes) is re-OCR'd
+    with alternative preprocessing (ocr_field_variants) until its confidence
+    reaches `threshold`, the variants run out or the deadline does. All weak
+    fields of a variant are read in one montage, one Tesseract call; a shared
+    `montage` batcher (batch runs) adds other cards' fields to it. Updates
+    `details` in place and returns {field: final confidence} for the fields
+    that were retried.
+    """
+    boxes = {}
+    best = {}
+    for field in weak_fields(details, words, fields, threshold):
+        box = field_region(words, value_words(words, details[field]))
+        if box is not None:
+            boxes[field] = box
+            best[field] = field_confidence(field, details[field], words)
+    if not boxes:
+        return {}
+
+    variants = ocr_field_variants(image_path, boxes, deadline=deadline, montage=montage)
+    while boxes:
+        if deadline is not None and not deadline.allows("field_reocr"):
+            deadline.skip("field_reocr")
+            break
+        try:
+            reads = next(variants)
+        except StopIteration:
+            break
+        except Exception:
+            if deadline is not None and deadline.expired():
+                deadline.skip("field_reocr")
+            break
+        for field, (text, conf) in reads.items():
+            value = parse_field(field, text)
+            if not value:
+                continue
+            record = field_confidence(field, value, [{"text": t, "conf": conf} for t in value.split()])
+            if record["confidence"] > best[field]["confidence"]:
+                best[field] = record
+                details[field] = value
+                if field == "dob" and len(value) >= 4 and value[-4:].isdigit():
+                    details["yob"] = value[-4:]
+            if best[field]["confidence"] >= threshold:
+                boxes.pop(field, None)
+    return {field: record["confidence"] for field, record in best.items()}
+
+
+def _enhanced(side):
+    """Whether the quality gate routed a side to the enhanced OCR preprocessing"""
+    return bool(side.quality) and side.quality["route"] == "enhance"
+
+
+def _retry_fields(side, plan):
+    """Retryable fields of `side` that the request actually asked for"""
+    return [f for f in RETRY_FIELDS[side] if plan["fields"] is None or f in plan["fields"]]
+
+
+def resolve_single_scan(image_path, out_dir):
+    """Pick front/back inputs when only one image was supplied.
+
+    If the image is a combined scan showing both sides, the two card crops
+    are written to `out_dir` and used as front and back. Otherwise the same
+    image is used for both sides.
+    Returns (front_path, back_path, layout).
+    """
+    try:
+        layout = split_combined_scan(image_path, out_dir)
+    except Exception as e:
+        layout = {"front": None, "back": None, "regions": [], "error": str(e)}
+    if layout["front"] and layout["back"]:
+        return layout["front"], layout["back"], layout
+    return image_path, image_path, layout
+
+
+def process_images(front_path, back_path, deadline_ms=None, fields=None, quality_gate=True, text_layer=None,
+                   profile=None, translate=True, started_at=None, montage=None):
+    """Run QR, OCR, face and translation stages on the front/back images.
+
+    Takes the same arguments as iter_process_images and returns its result
+    once every stage has run.
+    """
+    result = None
+    for _, result in iter_process_images(front_path, back_path, deadline_ms=deadline_ms, fields=fields,
+                                         quality_gate=quality_gate, text_layer=text_layer, profile=profile,
+                                         translate=translate, started_at=started_at, montage=montage):
+        pass
+    return result
+
+
+def iter_process_images(front_path, back_path, deadline_ms=None, fields=None, quality_gate=True, text_layer=None,
+                        profile=None, translate=True, started_at=None, montage=None):
+    """Run the pipeline stage by stage, yielding (stage, result) as each one finishes.
+
+    Stages are "plan" (nothing run yet), "quality", "qr", "ocr_back",
+    "ocr_front", "face" and "translate"; stages the plan leaves out are not
+    yielded. `result` is the same PipelineResult (modules.result_model)
+    every time, each stage filling its own slots; stage_update() turns it
+    into the partial response for a stage. Memory use per stage is recorded
+    in result.memory (a StageMemory).
+
+    `deadline_ms` bounds the whole request: optional work (QR fallback
+    strategies, face crop, translations) is skipped when the budget runs low
+    and OCR is cut off when it runs out. The Deadline is kept in
+    result.deadline so assemble_final can honour it and report truncation.
+    The budget runs from `started_at` (time.time() when the request
+    arrived) when given, so time spent queued is counted, else from now.
+
+    `fields` restricts the request to a subset of fields (see
+    modules.planner.FIELD_STAGES); only the stages and sides they need run.
+    `profile` ("minimal", "standard", "debug") limits the response sections
+    and drops stages that only feed sections it leaves out.
+    The plan is kept in result.plan.
+
+    With `quality_gate`, each side is first scored on a downscaled copy
+    (modules.quality). Rejected sides skip every later stage, sides routed to
+    "enhance" are OCR'd with extra preprocessing. If every side is rejected,
+    result.quality_rejected is set.
+
+    `text_layer` ({"front": str, "back": str}) supplies text that is already
+    known, e.g. from a PDF; those sides are parsed without running OCR.
+
+    With `translate=False` the translation stage is left to the caller
+    (burst mode translates the merged record once, not every frame).
+
+    `montage` (a modules.montage.MontageBatcher) is shared by batch runs so
+    that weak-field re-reads of concurrent cards share Tesseract calls.
+    """
+    deadline = Deadline(deadline_ms, started_at)
+    plan = plan_pipeline(fields, profile)
+    stages = plan["stages"]
+    memory = StageMemory()
+    result = PipelineResult(front_path, back_path, deadline=deadline, plan=plan, memory=memory)
+    front, back = result.front, result.back
+
+    def finished(stage):
+        memory.mark(stage)
+        return stage, result
+
+    yield finished("plan")
+
+    # Cheap quality gate before the QR cascade and OCR
+    if quality_gate:
+        assessed = {}
+        for side, path, needed in ((back, back_path, needs_back(plan)), (front, front_path, needs_front(plan))):
+            if not path or not needed:
+                continue
+            if path not in assessed:
+                try:
+                    assessed[path] = assess_image_quality(path)
+                except Exception as e:
+                    result.quality_error = str(e)
+                    continue
+            side.quality = assessed[path]
+
+        if back.quality and back.quality["route"] == "reject":
+            back_path = None
+        if front.quality and front.quality["route"] == "reject":
+            front_path = None
+        quality = result.quality
+        if quality and all(q["route"] == "reject" for q in quality.values()):
+            result.quality_rejected = True
+        yield finished("quality")
 
     # Process back image first (QR + address/pincode/state)
-    if back_path:
+    if back_path and "qr" in stages:
         try:
-            qr = extract_qr_data(back_path)
-            result["qr_raw"] = qr
+            result.qr_raw = extract_qr_data(back_path, deadline=deadline)
         except Exception as e:
-            result["qr_raw_error"] = str(e)
+            result.qr_error = str(e)
 
-        if result.get("qr_raw"):
+        if result.qr_raw:
             try:
-                result["xml_data"] = parse_aadhaar_xml(result["qr_raw"])
+                result.xml = parse_aadhaar_xml(result.qr_raw)
             except Exception as e:
-                result["xml_data_error"] = str(e)
-
-        # Extract address/pincode/state from back image OCR
-        try:
-            ocr_back = extract_text_from_image(back_path)
-            result["ocr_text_back"] = ocr_back
-            result["ocr_details_back"] = parse_ocr_text(ocr_back)
-        except Exception as e:
-            result["ocr_text_back_error"] = str(e)
+                result.xml_error = str(e)
+        yield finished("qr")
+
+    text_layer = text_layer or {}
+
+    # Extract address/pincode/state from back image OCR
+    if text_layer.get("back") and "ocr_back" in stages:
+        back.text = text_layer["back"]
+        back.details = parse_ocr_text(text_layer["back"])
+        yield finished("ocr_back")
+    elif back_path and "ocr_back" in stages:
+        if deadline.expired():
+            deadline.skip("ocr_back")
+        else:
+            try:
+                ocr_back = extract_ocr_data(back_path, deadline=deadline, enhance=_enhanced(back), zone="back")
+                back.text = ocr_back["text"]
+                back.words = ocr_back["words"]
+                back.details = parse_ocr_text(ocr_back["text"])
+                recover_aadhaar_number(back.details, back_path, back.words, deadline)
+                back.retries = refine_weak_fields(back.details, back_path, back.words,
+                                                  _retry_fields("back", plan), deadline, montage=montage) or None
+            except Exception as e:
+                back.ocr_error = str(e)
+                if deadline.expired():
+                    deadline.skip("ocr_back")
+        yield finished("ocr_back")
 
     # Process front (OCR for name/dob/gender)
-    if front_path:
-        try:
-            ocr_front = extract_text_from_image(front_path)
-            result["ocr_text_front"] = ocr_front
-        except Exception as e:
-            result["ocr_text_front_error"] = str(e)
-
-        if result.get("ocr_text_front"):
+    if text_layer.get("front") and "ocr_front" in stages:
+        front.text = text_layer["front"]
+    elif front_path and "ocr_front" in stages:
+        if deadline.expired():
+            deadline.skip("ocr_front")
+        else:
             try:
-                result["ocr_details_front"] = parse_ocr_text(result["ocr_text_front"])
+                ocr_front = extract_ocr_data(front_path, deadline=deadline, enhance=_enhanced(front), zone="front")
+                front.text = ocr_front["text"]
+                front.words = ocr_front["words"]
             except Exception as e:
-                result["ocr_details_front_error"] = str(e)
+                front.ocr_error = str(e)
+                if deadline.expired():
+                    deadline.skip("ocr_front")
 
-        # Try to extract face image from front photo
+    if front.text:
         try:
-            face_b64 = extract_largest_face_base64(front_path)
-            result["face_image_base64"] = face_b64
+            front.details = parse_ocr_text(front.text)
+            if front.words:
+                recover_aadhaar_number(front.details, front_path, front.words, deadline)
+                front.retries = refine_weak_fields(front.details, front_path, front.words,
+                                                   _retry_fields("front", plan), deadline, montage=montage) or None
         except Exception as e:
-            result["face_image_error"] = str(e)
+            front.parse_error = str(e)
+    if "ocr_front" in stages and (front_path or text_layer.get("front")):
+        yield finished("ocr_front")
+
+    # Try to extract face image from front photo
+    if front_path and "face" in stages:
+        if not deadline.allows("face"):
+            deadline.skip("face")
+        else:
+            try:
+                result.face_b64 = extract_largest_face_base64(front_path)
+            except Exception as e:
+                result.face_error = str(e)
+        yield finished("face")
+
+    # Translations last: they are the slowest optional stage
+    if translate and translation_planned(plan):
+        result.translations = build_translations(result)
+        yield finished("translate")
+
+
+def process_burst(front_frames, back_frames, deadline_ms=None, fields=None, quality_gate=True, profile=None,
+                  max_frames=MAX_BURST_FRAMES, translate=True, started_at=None):
+    """Process a burst of frames per side, best frame first, stopping early.
 
+    Frames are ranked by sharpness (modules.burst.rank_frames) and run
+    through process_images one per side at a time. Field candidates from all
+    processed frames are pooled per side; a side stops taking frames once it is
+    validated (QR decoded, or a checksum-valid number plus name and date of
+    birth for the front, a pincode and state for the back). `deadline_ms`
+    bounds the whole burst, from `started_at` as in iter_process_images.
+
+    Returns a PipelineResult with the merged fields; result.burst describes
+    which frames ran and whether it stopped early. `translate=False` leaves
+    the translations to the caller, as in iter_process_images.
+    """
+    deadline = Deadline(deadline_ms, started_at)
+    plan = plan_pipeline(fields, profile)
+    front_ranked = rank_frames(front_frames, max_frames) if needs_front(plan) else []
+    back_ranked = rank_frames(back_frames, max_frames) if needs_back(plan) else []
+
+    front_pool = CandidatePool()
+    back_pool = CandidatePool()
+    merged = PipelineResult(deadline=deadline, plan=plan)
+    processed = []
+    front_details = {}
+    back_details = {}
+    front_done = not front_ranked
+    back_done = not back_ranked
+
+    for i in range(max(len(front_ranked), len(back_ranked))):
+        front = front_ranked[i]["path"] if not front_done and i < len(front_ranked) else None
+        back = back_ranked[i]["path"] if not back_done and i < len(back_ranked) else None
+        if front is None and back is None:
+            break
+        if deadline.expired():
+            deadline.skip("burst_frames")
+            break
+        remaining = deadline.remaining_ms()
+        frame = process_images(front, back, deadline_ms=None if remaining is None else max(1, int(remaining)),
+                               fields=fields, quality_gate=quality_gate, profile=profile, translate=False)
+        for stage in frame.deadline.truncated:
+            deadline.skip(stage)
+        processed.append({"index": i, "front": front, "back": back, "quality": frame.quality})
+
+        if frame.xml and not merged.xml:
+            merged.qr_raw = frame.qr_raw
+            merged.xml = frame.xml
+        for pool, add, side, merged_side, path in ((front_pool, add_front_candidates, frame.front, merged.front, front),
+                                                   (back_pool, add_back_candidates, frame.back, merged.back, back)):
+            if side.details:
+                add(pool, side.details, side.words, i)
+                if merged_side.text is None:
+                    merged_side.image = path
+                    merged_side.text = side.text
+            if side.quality and merged_side.quality is None:
+                merged_side.quality = side.quality
+        if frame.face_b64 and not merged.face_b64:
+            merged.face_b64 = frame.face_b64
+
+        front_details = front_pool.values(FRONT_FIELDS)
+        front_details["aadhaar_valid"] = is_valid_aadhaar(front_details["aadhaar"])
+        back_details = back_pool.values(BACK_FIELDS)
+        xml = merged.xml or {}
+        front_done = front_done or identity_validated(xml, front_details)
+        back_done = back_done or address_found(xml, back_details)
+        if front_done and back_done:
+            break
+
+    if any(front_details.values()):
+        merged.front.details = front_details
+    if any(back_details.values()):
+        merged.back.details = back_details
+    # Every frame that ran was rejected by the quality gate
+    rejected = [bool(p["quality"]) and all(q["route"] == "reject" for q in p["quality"].values()) for p in processed]
+    if rejected and all(rejected):
+        merged.quality_rejected = True
+
+    if translate and translation_planned(plan):
+        merged.translations = build_translations(merged)
+
+    merged.burst = {
+        "frames": {"front": front_ranked, "back": back_ranked},
+        "processed": processed,
+        "frames_processed": len(processed),
+        "stopped_early": front_done and back_done and len(processed) < max(len(front_ranked), len(back_ranked)),
+        "validated": {"identity": front_done, "address": back_done},
+        "candidates": {"front": front_pool.summary(), "back": back_pool.summary()},
+    }
+    return merged
+
+
+def process_pdf(pdf_path, out_dir, password=None, deadline_ms=None, fields=None, quality_gate=True, profile=None,
+                translate=True, started_at=None, montage=None):
+    """Process an e-Aadhaar PDF.
+
+    The PDF text layer feeds parse_ocr_text directly and the embedded QR and
+    photo images feed extract_qr_data / face extraction, so no OCR runs.
+    Image-only PDFs fall back to rasterizing the page and the normal image
+    pipeline. Raises ValueError for a missing or wrong password.
+    """
+    result = None
+    for _, result in iter_process_pdf(pdf_path, out_dir, password=password, deadline_ms=deadline_ms,
+                                      fields=fields, quality_gate=quality_gate, profile=profile,
+                                      translate=translate, started_at=started_at, montage=montage):
+        pass
     return result
 
 
-def assemble_final(combined):
+def iter_process_pdf(pdf_path, out_dir, password=None, deadline_ms=None, fields=None, quality_gate=True,
+                     profile=None, translate=True, started_at=None, montage=None):
+    """Stage-by-stage version of process_pdf, see iter_process_images.
+
+    The PDF is opened before the first stage is yielded, so a bad password
+    raises ValueError on the first next().
     """
-    Assemble comprehensive JSON output with all data fields.
-    Prefer: QR/XML > Back OCR > Front OCR
-    Personal info (name, DOB, gender, aadhaar) from front OCR
-    Address info (pincode, state, locality, city) from back OCR
+    pdf = read_pdf(pdf_path, out_dir, password=password)
+    if has_text_layer(pdf["text"]):
+        input_type = "pdf_text"
+        stages = iter_process_images(pick_photo_image(pdf["images"]), pick_qr_image(pdf["images"]),
+                                     deadline_ms=deadline_ms, fields=fields, quality_gate=False,
+                                     text_layer={"front": pdf["text"], "back": pdf["text"]}, profile=profile,
+                                     translate=translate, started_at=started_at)
+    else:
+        input_type = "pdf_rasterized"
+        pages = rasterize_pdf(pdf_path, out_dir, password=password)
+        if len(pages) > 1:
+            front, back = pages[0], pages[1]
+        else:
+            front, back, _ = resolve_single_scan(pages[0], out_dir)
+        # Rendered pages are clean, white-backed images the photo quality gate misjudges
+        stages = iter_process_images(front, back, deadline_ms=deadline_ms, fields=fields,
+                                     quality_gate=False, profile=profile, translate=translate,
+                                     started_at=started_at, montage=montage)
+    for stage, result in stages:
+        result.input_type = input_type
+        result.source_pdf = pdf_path
+        yield stage, result
+
+
+def translation_planned(plan):
+    """Whether a plan runs the translation stage (callers that pass translate=False run it themselves)"""
+    return "translate" in plan["stages"] and "translations" in plan["sections"]
+
+
+def build_translations(result):
+    """English translations of the OCR'd address fields (the "translations" section).
+
+    Full-text translations are only added for the "debug" profile.
     """
-    xml = combined.get('xml_data') or {}
-    ocr_front = combined.get('ocr_details_front') or {}
-    ocr_back = combined.get('ocr_details_back') or {}
-
-    # ==== QR/XML Fields (Highest Priority) ====
-    qr_xml_section = {
-        "from_qr": {
-            "uid": mask_aadhaar_number(xml.get('uid')) if xml.get('uid') else None,
-            "name": xml.get('name'),
-            "gender": xml.get('gender'),
-            "yob": xml.get('yob'),
-            "dob": xml.get('dob'),
+    ocr_front = result.front.details or {}
+    ocr_back = result.back.details or {}
+    deadline = result.deadline
+    plan = result.plan or plan_pipeline()
+    translations = {
+        "ocr_front_translated": {
+            "address_english": translate_to_english(ocr_front.get('address'), deadline) if ocr_front.get('address') else None,
         },
-        "address_xml": {
-            "house": xml.get('house'),
-            "street": xml.get('street'),
-            "lm": xml.get('lm'),
-            "loc": xml.get('loc'),
-            "vtc": xml.get('vtc'),
-            "po": xml.get('po'),
-            "dist": xml.get('dist'),
-            "state": xml.get('state'),
-            "pc": xml.get('pc'),
+        "ocr_back_translated": {
+            "address_english": translate_to_english(ocr_back.get('address'), deadline) if ocr_back.get('address') else None,
+            "locality_english": translate_to_english(ocr_back.get('locality'), deadline) if ocr_back.get('locality') else None,
+            "city_english": translate_to_english(ocr_back.get('city'), deadline) if ocr_back.get('city') else None,
         }
     }
+    if plan.get('profile', 'debug') == 'debug':
+        translations["ocr_front_translated"]["full_text_english"] = translate_to_english(result.front.text, deadline) if result.front.text else None
+        translations["ocr_back_translated"]["full_text_english"] = translate_to_english(result.back.text, deadline) if result.back.text else None
+    return translations
 
-    # ==== OCR Front Fields (Personal info) ====
-    ocr_front_section = {
-        "from_ocr_front": {
-            "name": ocr_front.get('name'),
-            "gender": ocr_front.get('gender'),
-            "yob": ocr_front.get('yob'),
-            "dob": ocr_front.get('dob'),
-            "aadhaar_number": mask_aadhaar_number(ocr_front.get('aadhaar')),
-        },
-    }
 
-    # ==== OCR Back Fields (Address info) ====
-    ocr_back_section = {
-        "from_ocr_back": {
-            "full_address": ocr_back.get('address'),
-            "locality": ocr_back.get('locality'),
-            "city": ocr_back.get('city'),
-            "state": ocr_back.get('state'),
-            "pincode": ocr_back.get('pincode'),
-        }
+def _qr_section(result, debug=False):
+    section = {
+        "uid": (result.xml or {}).get('uid'),
+        "vid": (result.xml or {}).get('vid'),
+        "qr_raw_masked": mask_qr_code(result.qr_raw) if result.qr_raw else None,
     }
+    if debug:
+        section["qr_raw"] = result.qr_raw
+    return section
+
+
+def stage_update(stage, result):
+    """Partial response for one finished stage of iter_process_images.
+
+    Holds only what that stage produced, limited to the plan's sections:
+    QR/XML fields after "qr", personal fields after "ocr_front", address
+    fields after "ocr_back", the photo after "face" and the translations
+    section after "translate". assemble_final() gives the merged record.
+    """
+    plan = result.plan
+    sections = plan['sections']
+    update = {}
+    if stage == "plan":
+        update = {"profile": plan['profile'], "stages": sorted(plan['stages']), "sections": sorted(sections)}
+    elif stage == "quality":
+        update = {"quality": result.quality, "rejected": result.quality_rejected}
+    elif stage == "qr":
+        xml = result.xml or {}
+        if "qr_and_xml" in sections:
+            update["qr_and_xml"] = _qr_section(result)
+        if "personal_info" in sections:
+            update["personal_info"] = {key: xml.get(key) for key in ('name', 'gender', 'dob', 'yob')}
+            update["personal_info"]["aadhaar_masked"] = mask_aadhaar_number(xml.get('uid')) if xml.get('uid') else None
+        if "address" in sections:
+            update["address"] = {
+                "house": xml.get('house'),
+                "street": xml.get('street'),
+                "locality": xml.get('loc'),
+                "vtc": xml.get('vtc'),
+                "city": xml.get('dist'),
+                "state": xml.get('state'),
+                "pincode": xml.get('pc'),
+            }
+        update["error"] = result.qr_error or result.xml_error
+    elif stage == "ocr_front":
+        ocr_front = result.front.details or {}
+        if "personal_info" in sections:
+            update["personal_info"] = {key: ocr_front.get(key) for key in ('name', 'gender', 'dob', 'yob')}
+            update["personal_info"]["aadhaar"] = ocr_front.get('aadhaar')
+            update["personal_info"]["aadhaar_masked"] = mask_aadhaar_number(ocr_front.get('aadhaar'))
+            update["personal_info"]["aadhaar_valid"] = ocr_front.get('aadhaar_valid')
+        update["error"] = result.front.error
+    elif stage == "ocr_back":
+        ocr_back = result.back.details or {}
+        if "address" in sections:
+            update["address"] = {
+                "locality": ocr_back.get('locality'),
+                "city": ocr_back.get('city'),
+                "state": ocr_back.get('state'),
+                "pincode": ocr_back.get('pincode'),
+                "full_address": ocr_back.get('address'),
+            }
+        update["error"] = result.back.error
+    elif stage == "face":
+        if "photo" in sections:
+            update["photo"] = {"face_image_base64": result.face_b64}
+        update["error"] = result.face_error
+    elif stage == "translate":
+        update["translations"] = result.translations
+    return update
+
+
+def duplicate_keys(result):
+    """(Aadhaar number, face crop base64) to index a result under for duplicate checks.
+
+    Only checksum-valid numbers are used, so misreads do not create false
+    matches; either value may be None.
+    """
+    xml = result.xml or {}
+    ocr_front = result.front.details or {}
+    aadhaar = next((n for n in (xml.get('uid'), ocr_front.get('aadhaar')) if is_valid_aadhaar(n)), None)
+    return aadhaar, result.face_b64
+
+
+def assemble_final(result):
+    """
+    Assemble comprehensive JSON output with all data fields.
+    Prefer: QR/XML > Back OCR > Front OCR
+    Personal info (name, DOB, gender, aadhaar) from front OCR
+    Address info (pincode, state, locality, city) from back OCR
+    (the merge order of PipelineResult.field).
+    Only the sections in the request plan (see modules.planner) are built;
+    outside the "debug" profile duplicate keys, the raw QR payload and
+    full-text translations are left out.
+    """
+    xml = result.xml or {}
+    ocr_front = result.front.details or {}
+    ocr_back = result.back.details or {}
+    deadline = result.deadline
+    plan = result.plan or plan_pipeline()
+    sections = plan['sections']
+    debug = plan.get('profile', 'debug') == 'debug'
+    value = result.value
 
     # ==== Merged Final Data (Prefer QR → Back OCR → Front OCR) ====
-    aadhaar_full = xml.get('uid') or ocr_front.get('aadhaar')
-    final_data = {
-        "personal_info": {
-            "name": xml.get('name') or ocr_front.get('name'),
-            "gender": xml.get('gender') or ocr_front.get('gender'),
-            "date_of_birth": xml.get('dob') or ocr_front.get('dob'),
-            "year_of_birth": xml.get('yob') or ocr_front.get('yob'),
-            "dob": xml.get('dob') or ocr_front.get('dob'),
-            "yob": xml.get('yob') or ocr_front.get('yob'),
+    final_data = {}
+    if "personal_info" in sections:
+        aadhaar_full = value('aadhaar')
+        personal_info = {
+            "name": value('name'),
+            "gender": value('gender'),
+            "dob": value('dob'),
+            "yob": value('yob'),
             "aadhaar": aadhaar_full,
             "aadhaar_masked": mask_aadhaar_number(aadhaar_full),
-        },
-        "address": {
+        }
+        if debug:
+            personal_info["date_of_birth"] = personal_info["dob"]
+            personal_info["year_of_birth"] = personal_info["yob"]
+        final_data["personal_info"] = personal_info
+    if "address" in sections:
+        final_data["address"] = {
             "house": xml.get('house'),
             "street": xml.get('street'),
-            "locality": xml.get('loc') or ocr_back.get('locality'),
+            "locality": value('locality'),
             "vtc": xml.get('vtc'),
-            "city": xml.get('dist') or ocr_back.get('city'),
-            "state": xml.get('state') or ocr_back.get('state'),
-            "pincode": xml.get('pc') or ocr_back.get('pincode'),
+            "city": value('city'),
+            "state": value('state'),
+            "pincode": value('pincode'),
+            "guardian_name": value('guardian_name'),
             "full_address": ocr_back.get('address') or ocr_front.get('address'),
-        },
-        "qr_and_xml": {
-            "uid": xml.get('uid'),
-            "vid": xml.get('vid'),
-            "qr_raw": combined.get('qr_raw'),
-            "qr_raw_masked": mask_qr_code(combined.get('qr_raw')) if combined.get('qr_raw') else None,
-        },
-        "photo": {
-            "face_image_base64": combined.get('face_image_base64'),
-        },
-    }
-
-    # ==== Raw Data Section ====
-    raw_data = {
-        "sources": {
-            "front_image_path": combined.get('front_image'),
-            "back_image_path": combined.get('back_image'),
-        },
-        "qr_decoding": {
-            "qr_raw_string": mask_qr_code(combined.get('qr_raw')) if combined.get('qr_raw') else None,
-            "qr_decode_error": combined.get('qr_raw_error'),
-        },
-        "xml_parsing": {
-            "xml_parsed_dict": combined.get('xml_data'),
-            "xml_parse_error": combined.get('xml_data_error'),
-        },
-        "ocr_front": {
-            "ocr_raw_text": combined.get('ocr_text_front'),
-            "ocr_parsed_dict": combined.get('ocr_details_front'),
-            "ocr_extract_error": combined.get('ocr_text_front_error'),
-        },
-        "ocr_back": {
-            "ocr_raw_text": combined.get('ocr_text_back'),
-            "ocr_parsed_dict": combined.get('ocr_details_back'),
-            "ocr_extract_error": combined.get('ocr_text_back_error'),
-        },
-        "face_detection": {
-            "face_extract_error": combined.get('face_image_error'),
         }
-    }
+    if "qr_and_xml" in sections:
+        final_data["qr_and_xml"] = _qr_section(result, debug)
+    if "photo" in sections:
+        final_data["photo"] = {
+            "face_image_base64": result.face_b64,
+        }
 
     # Assemble complete output
+    if result.quality_rejected:
+        status = "rejected"
+    else:
+        status = "success" if (xml or ocr_front or ocr_back) else "partial_success"
     final_output = {
-        "status": "success" if (xml or ocr_front or ocr_back) else "partial_success",
+        "status": status,
         "final_data": final_data,
-        "detailed_breakdown": {
-            "qr_xml_extracted": qr_xml_section,
-            "ocr_front_extracted": ocr_front_section,
-            "ocr_back_extracted": ocr_back_section,
-        },
-        "translations": {
-            "ocr_front_translated": {
-                "full_text_english": translate_to_english(combined.get('ocr_text_front')) if combined.get('ocr_text_front') else None,
-                "address_english": translate_to_english(ocr_front.get('address')) if ocr_front.get('address') else None,
+    }
+
+    if "detailed_breakdown" in sections:
+        final_output["detailed_breakdown"] = {
+            # ==== QR/XML Fields (Highest Priority) ====
+            "qr_xml_extracted": {
+                "from_qr": {
+                    "uid": mask_aadhaar_number(xml.get('uid')) if xml.get('uid') else None,
+                    "name": xml.get('name'),
+                    "gender": xml.get('gender'),
+                    "yob": xml.get('yob'),
+                    "dob": xml.get('dob'),
+                },
+                "address_xml": {
+                    "house": xml.get('house'),
+                    "street": xml.get('street'),
+                    "lm": xml.get('lm'),
+                    "loc": xml.get('loc'),
+                    "vtc": xml.get('vtc'),
+                    "po": xml.get('po'),
+                    "dist": xml.get('dist'),
+                    "state": xml.get('state'),
+                    "pc": xml.get('pc'),
+                }
+            },
+            # ==== OCR Front Fields (Personal info) ====
+            "ocr_front_extracted": {
+                "from_ocr_front": {
+                    "name": ocr_front.get('name'),
+                    "gender": ocr_front.get('gender'),
+                    "yob": ocr_front.get('yob'),
+                    "dob": ocr_front.get('dob'),
+                    "aadhaar_number": mask_aadhaar_number(ocr_front.get('aadhaar')),
+                },
+            },
+            # ==== OCR Back Fields (Address info) ====
+            "ocr_back_extracted": {
+                "from_ocr_back": {
+                    "full_address": ocr_back.get('address'),
+                    "locality": ocr_back.get('locality'),
+                    "city": ocr_back.get('city'),
+                    "state": ocr_back.get('state'),
+                    "pincode": ocr_back.get('pincode'),
+                }
             },
-            "ocr_back_translated": {
-                "full_text_english": translate_to_english(combined.get('ocr_text_back')) if combined.get('ocr_text_back') else None,
-                "address_english": translate_to_english(ocr_back.get('address')) if ocr_back.get('address') else None,
-                "locality_english": translate_to_english(ocr_back.get('locality')) if ocr_back.get('locality') else None,
-                "city_english": translate_to_english(ocr_back.get('city')) if ocr_back.get('city') else None,
+        }
+
+    if "translations" in sections:
+        # Normally already translated by the "translate" stage
+        final_output["translations"] = result.translations or build_translations(result)
+
+    # ==== Raw Data Section ====
+    if "raw_sources" in sections:
+        final_output["raw_sources"] = {
+            "sources": {
+                "front_image_path": result.front.image,
+                "back_image_path": result.back.image,
+                "source_pdf": result.source_pdf,
+                "input_type": result.input_type,
+            },
+            "qr_decoding": {
+                "qr_raw_string": mask_qr_code(result.qr_raw) if result.qr_raw else None,
+                "qr_decode_error": result.qr_error,
+            },
+            "xml_parsing": {
+                "xml_parsed_dict": result.xml,
+                "xml_parse_error": result.xml_error,
+            },
+            "ocr_front": {
+                "ocr_raw_text": result.front.text,
+                "ocr_parsed_dict": result.front.details,
+                "ocr_extract_error": result.front.ocr_error,
+            },
+            "ocr_back": {
+                "ocr_raw_text": result.back.text,
+                "ocr_parsed_dict": result.back.details,
+                "ocr_extract_error": result.back.ocr_error,
+            },
+            "face_detection": {
+                "face_extract_error": result.face_error,
             }
-        },
-        "raw_sources": raw_data,
+        }
+
+    # Per-field confidence: source (QR/OCR), word confidences and validators
+    scores = score_fields(result)
+    final_output["confidence"] = {
+        "overall": confidence_label(scores),
+        "fields": {field: {k: v for k, v in record.items() if k != "value"} for field, record in scores.items()},
+        "retried": result.field_retries,
     }
 
+    # Per-stage RSS deltas (and tracemalloc peaks when enabled)
+    if debug and result.memory is not None:
+        final_output["metrics"] = {"memory": result.memory.report()}
+
+    final_output["quality"] = result.quality
+    final_output["truncated_stages"] = list(deadline.truncated) if deadline else []
+
     return final_output
 
 
 if __name__ == "__main__":
-    front, back = find_images("images")
-    combined = process_images(front, back)
-    final = assemble_final(combined)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Extract Aadhaar data from card images or an e-Aadhaar PDF")
+    parser.add_argument("input", nargs="?", default="images",
+                        help="folder with front/back images, a single image or an e-Aadhaar PDF (default: images)")
+    parser.add_argument("--password", help="password for a protected e-Aadhaar PDF")
+    parser.add_argument("--profile", choices=("minimal", "standard", "debug"), default="debug",
+                        help="response profile (default: debug, everything)")
+    parser.add_argument("--duplicates", action="store_true",
+                        help="check the card against earlier submissions and record it (outputs/duplicates.sqlite3)")
+    args = parser.parse_args()
+
+    if os.path.isfile(args.input):
+        front, back = args.input, None
+    else:
+        front, back = find_images(args.input)
+        # Unnamed or contradictorily named pair: order it by content
+        if front and back and front != back and not sides_labeled(front, back):
+            front, back, _ = assign_sides(front, back)
+
+    pdf_input = next((p for p in (front, back) if p and is_pdf(p)), None)
+    if pdf_input:
+        result = process_pdf(pdf_input, os.path.join("outputs", "pdf"), password=args.password, profile=args.profile)
+    else:
+        if bool(front) != bool(back):
+            front, back, _ = resolve_single_scan(front or back, os.path.join("outputs", "splits"))
+        result = process_images(front, back, profile=args.profile)
+    final = assemble_final(result)
+    if args.duplicates:
+        import uuid
+        from modules.duplicate_index import DuplicateIndex
+
+        index = DuplicateIndex("outputs")
+        aadhaar, face_b64 = duplicate_keys(result)
+        request_id = uuid.uuid4().hex
+        final["request_id"] = request_id
+        final["duplicates"] = index.find(aadhaar=aadhaar, face_b64=face_b64)
+        index.add(request_id, aadhaar=aadhaar, face_b64=face_b64)
     print(json.dumps(final, ensure_ascii=False, indent=2))
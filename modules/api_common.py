@@ -0,0 +1,263 @@
+"""
+Request options and response payloads shared by the two serving entry
+points, app.py (Flask, threaded workers) and asgi.py (event loop plus a
+process pool). Nothing here touches a framework: options are read through
+a `get(name, default)` lookup over the form and query string, and payloads
+are returned as (dict, status) for the caller to encode.
+"""
+import glob
+import hmac
+import os
+import shutil
+import time
+import uuid
+
+from main import assemble_final, duplicate_keys
+from .deadline import parse_deadline_ms
+from .duplicate_index import get_duplicate_index
+from .memory import get_memory_budget
+from .output_formatter import format_detailed_response
+from .output_sink import get_output_sink
+from .planner import parse_fields, parse_profile
+from .scheduler import SchedulerBusy, parse_lane, tenant_id
+from .serialization import dumps_bytes
+from .side_classifier import label_conflict
+from .utils import extract_largest_face_base64
+
+
+UPLOAD_FOLDER = 'uploads'
+OUTPUT_FOLDER = 'outputs'
+
+# Largest accepted request body
+MAX_CONTENT_LENGTH = 50 * 1024 * 1024
+
+# Shared secret callers of /duplicates send in X-Duplicates-Token. The endpoint
+# answers whether a number or face was seen before, so it is off without one
+DUPLICATES_TOKEN = os.environ.get('OCR_DUPLICATES_TOKEN', '')
+
+# Response profile used when the request does not pick one: the full response
+# /process always gave (and the CLI default); clients opt down with profile=
+DEFAULT_RESPONSE_PROFILE = 'debug'
+
+API_INFO = {
+    'service': 'OcrVerification API',
+    'version': '1.0.0',
+    'status': 'running',
+    'endpoints': {
+        'GET /': 'API information / Web UI',
+        'GET /health': 'Health check',
+        'GET /ready': 'Readiness check (503 until the worker is warmed up)',
+        'GET|POST /duplicates': 'Earlier submissions of a request, or (POST) of an Aadhaar number or face; needs X-Duplicates-Token',
+        'GET /metrics': 'Scheduler lanes, memory budget and output sink counters of this worker',
+        'GET /version': 'API version',
+        'POST /process': 'Process Aadhaar images (upload front and back) or an e-Aadhaar PDF (pdf, password)',
+        'POST /process/burst': 'Process several frames per side (front/back repeated), best frame first, stopping when validated',
+        'POST /process/stream': 'Same as /process, streaming sections as NDJSON (or SSE) as each stage finishes'
+    },
+    'documentation': 'https://github.com/Ranch12k/OcrVerification'
+}
+
+
+def process_options(get, started_at=None):
+    """Options shared by the /process endpoints. Raises ValueError with the client message.
+
+    `started_at` is time.time() when the request arrived (now if not given).
+    """
+    try:
+        deadline_ms = parse_deadline_ms(get('deadline_ms'))
+    except ValueError:
+        raise ValueError('deadline_ms must be a positive integer')
+    return {
+        # Optional per-request time budget in milliseconds
+        'deadline_ms': deadline_ms,
+        # The budget runs from arrival, so time queued for a slot or a pool worker counts
+        'started_at': time.time() if started_at is None else started_at,
+        # Optional field selection, e.g. fields=aadhaar,name
+        'fields': parse_fields(get('fields')),
+        # Response profile: minimal, standard or debug (default)
+        'profile': parse_profile(get('profile')) or DEFAULT_RESPONSE_PROFILE,
+        # The quality gate can be turned off for images it rejects wrongly
+        'quality_gate': get('quality_gate', '1').lower() not in ('0', 'false', 'no'),
+    }
+
+
+def schedule(get, headers):
+    """(lane, tenant) of a request: X-Priority (or priority) and X-API-Key. Raises ValueError"""
+    lane = parse_lane(headers.get('X-Priority') or get('priority'))
+    return lane, tenant_id(headers.get('X-API-Key'))
+
+
+def wants_side_check(get, front_name, back_name):
+    """Whether the uploads go through the side classifier: sides=auto, or a file name claiming the other side"""
+    return get('sides', 'labels').lower() == 'auto' or label_conflict(front_name, back_name)
+
+
+def sides_info(info):
+    """upload_info['sides'] for an assign_sides() result"""
+    return {
+        'classified': True,
+        'swapped': info['swapped'],
+        'front_upload': {k: info['first'][k] for k in ('side', 'scores')},
+        'back_upload': {k: info['second'][k] for k in ('side', 'scores')},
+    }
+
+
+def index_submission(result, request_id, logger=None):
+    """Record the card in the duplicate index; indexing problems never fail the request"""
+    aadhaar, face_b64 = duplicate_keys(result)
+    try:
+        get_duplicate_index(OUTPUT_FOLDER).add(request_id, aadhaar=aadhaar, face_b64=face_b64)
+    except Exception as e:
+        if logger is not None:
+            logger.warning('Duplicate index update failed: %s', e)
+
+
+def remove_uploads(request_id, paths=()):
+    """Delete a request's uploads and the PDF pages / combined-scan splits derived from them.
+
+    Uploads saved under the request id (<id>_front.jpg, burst/<id>_back_0.jpg,
+    ...) are found by name, so a request that failed halfway through saving
+    them leaves nothing behind either.
+    """
+    named = os.path.join(UPLOAD_FOLDER, glob.escape(request_id))
+    saved = glob.glob(named + '*') + glob.glob(os.path.join(UPLOAD_FOLDER, 'burst', glob.escape(request_id) + '_*'))
+    for path in set(filter(None, paths)) | set(saved):
+        if os.path.isdir(path):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    for derived in ('pdf', 'splits'):
+        shutil.rmtree(os.path.join(UPLOAD_FOLDER, derived, request_id), ignore_errors=True)
+
+
+def face_from_upload(path):
+    """Base64 crop of the largest face in a /duplicates upload, or None when there is none"""
+    return extract_largest_face_base64(path)
+
+
+def duplicates_denied(headers):
+    """(payload, status) refusing a /duplicates call without the right X-Duplicates-Token, else None"""
+    if not DUPLICATES_TOKEN:
+        return {'error': '/duplicates is disabled on this server (OCR_DUPLICATES_TOKEN is not set)'}, 403
+    token = headers.get('X-Duplicates-Token')
+    if not token or not hmac.compare_digest(token, DUPLICATES_TOKEN):
+        return {'error': 'Missing or wrong X-Duplicates-Token'}, 401
+    return None
+
+
+def duplicates_payload(request_id=None, aadhaar=None, face_b64=None, face_uploaded=False):
+    """/duplicates response: matches of an earlier request, or of a number and/or face. (payload, status)
+
+    `face_uploaded` with no `face_b64` means no face was found in the upload (400).
+    """
+    if face_uploaded and face_b64 is None:
+        return {'error': 'No face found in the uploaded image'}, 400
+    index = get_duplicate_index(OUTPUT_FOLDER)
+    if request_id:
+        matches = index.find_for_request(request_id)
+        if matches is None:
+            return {'error': 'Unknown request_id'}, 404
+        return {'request_id': request_id, 'matches': matches, 'index_size': index.count()}, 200
+    aadhaar = (aadhaar or '').replace(' ', '') or None
+    if not aadhaar and not face_b64:
+        return {'error': 'Give a request_id, an aadhaar number or a face image'}, 400
+    return {'matches': index.find(aadhaar=aadhaar, face_b64=face_b64), 'index_size': index.count()}, 200
+
+
+def busy_payload(error, scheduler):
+    """503 payload for a request the scheduler or the memory budget could not admit"""
+    payload = {'status': 'rejected', 'error': f'Server busy: {error}', 'memory': get_memory_budget().stats()}
+    if isinstance(error, SchedulerBusy):
+        payload['scheduler'] = scheduler.stats()
+    return payload, 503
+
+
+def result_payload(result, profile, upload_info, extra=None, logger=None, source='/process'):
+    """The /process response for a pipeline result: (payload, status), 422 when quality-rejected.
+
+    `extra` holds additional top-level keys, e.g. the burst summary. The
+    result is indexed for duplicates and queued for the output sink, which
+    counts drops under `source` (the request path).
+    """
+    quality = result.quality
+    # Every uploaded side failed the quality gate: reject before any expensive stage ran
+    if result.quality_rejected:
+        return {
+            'status': 'rejected',
+            'error': 'Image quality too low',
+            'reasons': {side: q['reason'] for side, q in quality.items()},
+            'quality': quality,
+        }, 422
+
+    final = assemble_final(result)
+    request_id = uuid.uuid4().hex
+    index_submission(result, request_id, logger)
+
+    # Minimal profile: merged fields only, the detailed formatter is skipped
+    if profile == 'minimal':
+        minimal_result = {
+            'status': final['status'],
+            'request_id': request_id,
+            'data': final['final_data'],
+            'quality': quality,
+            'truncated_stages': final['truncated_stages'],
+            'confidence': final['confidence'],
+        }
+        minimal_result.update(extra or {})
+        get_output_sink(OUTPUT_FOLDER).submit(minimal_result, request_id=request_id, source=source)
+        return minimal_result, 200
+
+    # The formatter reads the parsed sides and the QR data straight from the result
+    formatted_result = format_detailed_response(final['final_data'], final.get('translations', {}),
+                                                result.front.details or {}, result.back.details or {},
+                                                result.xml or {}, deadline=result.deadline, plan=result.plan,
+                                                confidence=final['confidence'])
+
+    # Add raw data for advanced users (debug profile)
+    if 'raw_sources' in final:
+        formatted_result['raw_data'] = final['raw_sources']
+
+    # Add upload info
+    formatted_result['upload_info'] = upload_info
+
+    # Quality gate scores per side
+    formatted_result['quality'] = quality
+
+    # Stages skipped or cut short to stay within deadline_ms
+    formatted_result['truncated_stages'] = final['truncated_stages']
+
+    formatted_result.update(extra or {})
+
+    # Queue result for the background writer (rotated JSONL segments in outputs folder)
+    formatted_result['request_id'] = request_id
+    get_output_sink(OUTPUT_FOLDER).submit(formatted_result, request_id=request_id, source=source)
+
+    return formatted_result, 200
+
+
+def burst_summary(burst):
+    """The `burst` key of a /process/burst response"""
+    return {
+        'frames_processed': burst['frames_processed'],
+        'stopped_early': burst['stopped_early'],
+        'validated': burst['validated'],
+        'ranking': {side: [round(f['sharpness'], 2) for f in frames] for side, frames in burst['frames'].items()},
+    }
+
+
+def finish_stream(result, request_id, logger=None):
+    """The "final" event of a stream: the assemble_final record, indexed and queued for the sink"""
+    final = assemble_final(result)
+    final['request_id'] = request_id
+    index_submission(result, request_id, logger)
+    get_output_sink(OUTPUT_FOLDER).submit(final, request_id=request_id, source='/process/stream')
+    return final
+
+
+def encode_event(event, data, sse):
+    """One stream event as an NDJSON line or an SSE message"""
+    if sse:
+        return b'event: ' + event.encode() + b'\ndata: ' + dumps_bytes(data) + b'\n\n'
+    return dumps_bytes({'event': event, 'data': data}) + b'\n'
@@ -0,0 +1,111 @@
+"""
+Multi-frame burst mode helpers.
+A mobile capture sends several frames per side. Frames are ranked by a cheap
+sharpness score and run best-first; field candidates from every processed
+frame are pooled and the best-supported value per field wins, so processing
+can stop as soon as the result is validated.
+"""
+from .quality import sharpness_score
+
+
+MAX_BURST_FRAMES = 8
+
+# Confidence of values that come from the signed QR payload
+QR_CONFIDENCE = 1.0
+
+# Weight of an Aadhaar number whose checksum does not validate
+INVALID_NUMBER_WEIGHT = 0.3
+
+# Used when a frame has no OCR word confidences (e.g. text layer input)
+DEFAULT_OCR_CONFIDENCE = 0.5
+
+FRONT_FIELDS = ("name", "gender", "dob", "yob", "aadhaar", "address")
+BACK_FIELDS = ("address", "locality", "city", "state", "pincode")
+
+
+def rank_frames(paths, max_frames=MAX_BURST_FRAMES):
+    """Sort frames sharpest first. Returns [{"path", "sharpness"}], at most `max_frames`"""
+    ranked = [{"path": path, "sharpness": sharpness_score(path)} for path in paths]
+    ranked.sort(key=lambda frame: frame["sharpness"], reverse=True)
+    return ranked[:max_frames]
+
+
+def ocr_confidence(words):
+    """Mean Tesseract word confidence of a frame as 0..1"""
+    confs = [w["conf"] for w in words or () if w.get("conf", -1) >= 0]
+    if not confs:
+        return DEFAULT_OCR_CONFIDENCE
+    return sum(confs) / len(confs) / 100.0
+
+
+class CandidatePool:
+    """Field candidates collected across the frames of one burst.
+
+    The same value seen on several frames accumulates confidence, so a value
+    read consistently beats a single lucky read.
+    """
+
+    def __init__(self):
+        self._scores = {}
+        self._frames = {}
+
+    def add(self, field, value, confidence, frame):
+        if not value:
+            return
+        scores = self._scores.setdefault(field, {})
+        scores[value] = scores.get(value, 0.0) + confidence
+        self._frames.setdefault(field, {}).setdefault(value, []).append(frame)
+
+    def best(self, field):
+        """Best value for `field` or None"""
+        scores = self._scores.get(field)
+        if not scores:
+            return None
+        return max(scores.items(), key=lambda item: item[1])[0]
+
+    def values(self, fields):
+        return {field: self.best(field) for field in fields}
+
+    def summary(self):
+        """Per field: chosen value, its score and the frames that produced it"""
+        out = {}
+        for field, scores in self._scores.items():
+            value = self.best(field)
+            out[field] = {
+                "value": value,
+                "score": round(scores[value], 3),
+                "frames": self._frames[field][value],
+                "alternatives": len(scores) - 1,
+            }
+        return out
+
+
+def add_front_candidates(pool, details, words, frame):
+    """Pool the parsed front-side fields of one frame"""
+    confidence = ocr_confidence(words)
+    for field in FRONT_FIELDS:
+        weight = confidence
+        if field == "aadhaar" and not details.get("aadhaar_valid"):
+            weight *= INVALID_NUMBER_WEIGHT
+        pool.add(field, details.get(field), weight, frame)
+
+
+def add_back_candidates(pool, details, words, frame):
+    """Pool the parsed back-side address fields of one frame"""
+    confidence = ocr_confidence(words)
+    for field in BACK_FIELDS:
+        pool.add(field, details.get(field), confidence, frame)
+
+
+def identity_validated(xml, front):
+    """QR decoded, or a checksum-valid number plus name and date/year of birth"""
+    if xml.get("uid"):
+        return True
+    return bool(front.get("aadhaar_valid") and front.get("name") and (front.get("dob") or front.get("yob")))
+
+
+def address_found(xml, back):
+    """QR decoded, or a pincode and state read from the back"""
+    if xml.get("uid"):
+        return True
+    return bool(back.get("pincode") and back.get("state"))
@@ -0,0 +1,148 @@
+"""
+Per-field confidence scores.
+Each extracted field gets a 0..1 confidence built from its source (the
+signed QR payload beats OCR), the Tesseract confidences of the words it was
+read from and a field validator (checksum, date sanity, gazetteer, pincode
+format). Fields below the threshold are re-read by the retry loop in
+main.refine_weak_fields.
+"""
+import re
+from datetime import date
+
+from .india_states_districts import validate_state, fuzzy_match_district
+from .ocr_parser_new import is_valid_aadhaar
+from .result_model import PERSONAL_FIELDS, ADDRESS_FIELDS
+
+
+# Fields below this confidence are retried and reported as weak
+FIELD_CONFIDENCE_THRESHOLD = 0.7
+
+# Used when the words a value was read from cannot be found (e.g. text layer)
+DEFAULT_OCR_CONFIDENCE = 0.5
+
+# A failed validator keeps this share of the OCR confidence
+FAILED_CHECK_WEIGHT = 0.4
+
+# Weakest field at or above this (but below the threshold) is "Medium" overall
+MEDIUM_CONFIDENCE = 0.4
+
+_GENDERS = ("Male", "Female", "Other")
+_NAME_SYMBOLS = set("|&/~()[]@:;,_=+*#")
+_DATE_RE = re.compile(r"^(\d{2})[/-](\d{2})[/-](\d{4})$")
+_PINCODE_RE = re.compile(r"^[1-9]\d{5}$")
+
+
+def _normalize(token):
+    return re.sub(r"[^0-9a-z]", "", token.lower())
+
+
+def value_words(words, value):
+    """OCR words that make up `value` (matched token by token)"""
+    tokens = {_normalize(t) for t in str(value).split()}
+    tokens.discard("")
+    return [w for w in words or () if _normalize(w["text"]) in tokens]
+
+
+def _valid_year(year):
+    return 1900 <= year <= date.today().year
+
+
+def validate_field(field, value):
+    """Run the validator for `field`. Returns (check name, True/False) or (None, None)"""
+    value = str(value).strip()
+    if field == "aadhaar":
+        return "checksum", is_valid_aadhaar(value)
+    if field == "dob":
+        m = _DATE_RE.match(value)
+        if not m:
+            return "date", value.isdigit() and len(value) == 4 and _valid_year(int(value))
+        day, month, year = (int(g) for g in m.groups())
+        try:
+            return "date", _valid_year(year) and date(year, month, day) <= date.today()
+        except ValueError:
+            return "date", False
+    if field == "yob":
+        return "date", value.isdigit() and len(value) == 4 and _valid_year(int(value))
+    if field == "gender":
+        return "gender", value in _GENDERS
+    if field == "name":
+        ok = (2 <= len(value) <= 60 and len(value.split()) <= 6
+              and not any(c.isdigit() or c in _NAME_SYMBOLS for c in value))
+        return "name_format", ok
+    if field == "state":
+        return "gazetteer", validate_state(value)
+    if field == "city":
+        return "gazetteer", fuzzy_match_district(value)[1] is not None
+    if field == "pincode":
+        return "pincode", bool(_PINCODE_RE.match(value))
+    return None, None
+
+
+def field_confidence(field, value, words=None, source="ocr"):
+    """Confidence record for one field value, or None when the value is missing.
+
+    Returns {"value", "confidence", "source", "checks": {name: bool}}.
+    """
+    if not value:
+        return None
+    check, ok = validate_field(field, value)
+    checks = {check: bool(ok)} if check else {}
+    if source == "qr":
+        return {"value": value, "confidence": 1.0, "source": "qr", "checks": checks}
+
+    matched = value_words(words, value)
+    confs = [w["conf"] for w in matched if w["conf"] >= 0]
+    confidence = sum(confs) / len(confs) / 100.0 if confs else DEFAULT_OCR_CONFIDENCE
+    if ok is True:
+        # A passed check closes half the gap to certain; a checksum all of it
+        confidence = 0.95 if check == "checksum" else confidence + (1.0 - confidence) / 2.0
+    elif ok is False:
+        confidence *= FAILED_CHECK_WEIGHT
+    return {"value": value, "confidence": round(confidence, 3), "source": source, "checks": checks}
+
+
+def score_fields(result):
+    """Per-field confidences of a PipelineResult, following the QR > OCR merge
+    order of PipelineResult.field (fields re-read by the retry loop keep the
+    confidence of the re-read).
+
+    Returns {field: record} for every field that has a value.
+    """
+    scores = {}
+    for field in PERSONAL_FIELDS + ADDRESS_FIELDS:
+        value, source = result.field(field)
+        if source == "qr":
+            record = field_confidence(field, value, source="qr")
+        elif source:
+            side = result.side(source[len("ocr_"):])
+            record = field_confidence(field, value, side.words, source)
+            # A re-read field is scored by the re-read, not the first pass
+            if field in (side.retries or {}):
+                record["confidence"] = side.retries[field]
+        else:
+            record = None
+        if record:
+            scores[field] = record
+    return scores
+
+
+def confidence_label(scores):
+    """Overall High/Medium/Low label from the weakest field"""
+    if not scores:
+        return "Low"
+    weakest = min(record["confidence"] for record in scores.values())
+    if weakest >= FIELD_CONFIDENCE_THRESHOLD:
+        return "High"
+    if weakest >= MEDIUM_CONFIDENCE:
+        return "Medium"
+    return "Low"
+
+
+def weak_fields(details, words, fields, threshold=FIELD_CONFIDENCE_THRESHOLD):
+    """Fields of one side's parsed details whose confidence is below `threshold`"""
+    weak = []
+    for field in fields:
+        record = field_confidence(field, details.get(field), words)
+        if record and record["confidence"] < threshold:
+            weak.append(field)
+    return weak
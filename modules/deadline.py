@@ -0,0 +1,79 @@
+"""
+Per-request time budget shared by the pipeline stages.
+Stages ask the deadline whether there is enough time left before starting
+optional work and record what they skipped, so the response can report it.
+"""
+import time
+
+
+# Rough cost of each optional stage on a typical card photo (milliseconds).
+# A stage is skipped when the remaining budget is below its estimate.
+STAGE_COST_MS = {
+    "qr_fallback": 1500,
+    "ocr": 800,
+    "digit_reocr": 300,
+    "field_reocr": 300,
+    # Script detection (OSD) of a side's weak lines, then each re-read with the detected model
+    "script_osd": 200,
+    "script_ocr": 300,
+    "face": 250,
+    "translation": 700,
+}
+
+
+class Deadline:
+    """Remaining time budget of a single request.
+
+    A deadline created with budget_ms=None never runs out, so stages can
+    consult it unconditionally. `started_at` (a time.time() stamp) is when
+    the request arrived; time spent before the pipeline started, queued for
+    a slot or a pool worker, then counts against the budget.
+    """
+
+    def __init__(self, budget_ms=None, started_at=None):
+        self.budget_ms = budget_ms
+        self.started = time.monotonic()
+        if started_at is not None:
+            # Wall clock, so the stamp can be taken in another process
+            self.started -= max(0.0, time.time() - started_at)
+        self.truncated = []
+
+    def elapsed_ms(self):
+        return (time.monotonic() - self.started) * 1000.0
+
+    def remaining_ms(self):
+        """Milliseconds left, or None when there is no budget"""
+        if self.budget_ms is None:
+            return None
+        return max(0.0, self.budget_ms - self.elapsed_ms())
+
+    def remaining_s(self):
+        """Seconds left (for subprocess timeouts), or None when unlimited"""
+        remaining = self.remaining_ms()
+        return None if remaining is None else remaining / 1000.0
+
+    def expired(self):
+        remaining = self.remaining_ms()
+        return remaining is not None and remaining <= 0
+
+    def allows(self, stage):
+        """True if the estimated cost of `stage` still fits in the budget"""
+        remaining = self.remaining_ms()
+        if remaining is None:
+            return True
+        return remaining >= STAGE_COST_MS.get(stage, 0)
+
+    def skip(self, stage):
+        """Record that `stage` was cut short to respect the deadline"""
+        if stage not in self.truncated:
+            self.truncated.append(stage)
+
+
+def parse_deadline_ms(value):
+    """Parse a deadline_ms request option. Returns int or None, raises ValueError"""
+    if value is None or str(value).strip() == "":
+        return None
+    deadline_ms = int(value)
+    if deadline_ms <= 0:
+        raise ValueError("deadline_ms must be a positive integer")
+    return deadline_ms
@@ -0,0 +1,235 @@
+"""
+Near-duplicate submission index.
+Every processed card records a 64-bit perceptual hash (dHash) of its face
+crop and a salted HMAC of its Aadhaar number in a local SQLite file. Face
+lookups use multi-index hashing: the hash is split into FACE_CHUNKS
+16-bit chunks, each stored in an indexed column, so by the pigeonhole
+principle any hash within FACE_CHUNKS - 1 bits shares at least one chunk
+exactly. A lookup touches a few index buckets instead of scanning, which
+keeps it sub-millisecond at millions of entries.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import sqlite3
+import threading
+from datetime import datetime
+from io import BytesIO
+
+from PIL import Image
+
+
+INDEX_FILENAME = "duplicates.sqlite3"
+SALT_FILENAME = "duplicates.salt"
+
+HASH_BITS = 64
+# The schema below has one indexed column per chunk (face_c0 .. face_c3)
+FACE_CHUNKS = 4
+CHUNK_BITS = HASH_BITS // FACE_CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+# Largest Hamming distance the multi-index lookup is guaranteed to find. 3 of
+# 64 bits only matches near-identical crops: the same photo re-uploaded,
+# recompressed or resized. A new capture of the same card (other angle,
+# light, framing) usually lands further away, so face matches flag a reused
+# image, not the same person
+MAX_FACE_DISTANCE = FACE_CHUNKS - 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    request_id TEXT,
+    ts TEXT,
+    aadhaar_hash TEXT,
+    face_hash INTEGER,
+    face_c0 INTEGER,
+    face_c1 INTEGER,
+    face_c2 INTEGER,
+    face_c3 INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_request ON submissions (request_id);
+CREATE INDEX IF NOT EXISTS idx_aadhaar ON submissions (aadhaar_hash);
+CREATE INDEX IF NOT EXISTS idx_face_c0 ON submissions (face_c0);
+CREATE INDEX IF NOT EXISTS idx_face_c1 ON submissions (face_c1);
+CREATE INDEX IF NOT EXISTS idx_face_c2 ON submissions (face_c2);
+CREATE INDEX IF NOT EXISTS idx_face_c3 ON submissions (face_c3);
+"""
+
+
+def dhash(pil_img):
+    """64-bit difference hash: brightness gradients of a 9x8 grayscale thumbnail"""
+    small = pil_img.convert("L").resize((9, 8), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def face_hash_from_base64(face_b64):
+    """dHash of a base64 face crop (as returned by extract_largest_face_base64), or None"""
+    if not face_b64:
+        return None
+    try:
+        with Image.open(BytesIO(base64.b64decode(face_b64))) as img:
+            return dhash(img)
+    except Exception:
+        return None
+
+
+def _chunks(value):
+    return [(value >> (CHUNK_BITS * i)) & CHUNK_MASK for i in range(FACE_CHUNKS)]
+
+
+def _to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def _to_unsigned(value):
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+def _load_salt(directory):
+    """Salt for Aadhaar hashes: OCR_DUPLICATE_SALT, else a random one kept next to the index"""
+    configured = os.environ.get("OCR_DUPLICATE_SALT")
+    if configured:
+        return configured.encode("utf-8")
+    path = os.path.join(directory, SALT_FILENAME)
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    salt = secrets.token_bytes(32)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another worker created it first
+        with open(path, "rb") as f:
+            return f.read()
+    with os.fdopen(fd, "wb") as f:
+        f.write(salt)
+    return salt
+
+
+class DuplicateIndex:
+    """File-backed index of face hashes and salted Aadhaar hashes.
+
+    Safe to share between threads (one SQLite connection per thread) and
+    between worker processes (SQLite WAL mode).
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, INDEX_FILENAME)
+        self._salt = _load_salt(directory)
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def aadhaar_hash(self, number):
+        if not number:
+            return None
+        return hmac.new(self._salt, number.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def add(self, request_id, aadhaar=None, face_b64=None, face_hash=None):
+        """Record one submission. Returns False when there was nothing to index"""
+        aadhaar_hash = self.aadhaar_hash(aadhaar)
+        if face_hash is None:
+            face_hash = face_hash_from_base64(face_b64)
+        if aadhaar_hash is None and face_hash is None:
+            return False
+        chunks = _chunks(face_hash) if face_hash is not None else [None] * FACE_CHUNKS
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO submissions (request_id, ts, aadhaar_hash, face_hash, face_c0, face_c1, face_c2, face_c3)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (request_id, datetime.now().isoformat(), aadhaar_hash,
+                 _to_signed(face_hash) if face_hash is not None else None, *chunks))
+        return True
+
+    def find(self, aadhaar=None, face_b64=None, face_hash=None, max_distance=MAX_FACE_DISTANCE,
+             exclude_request_id=None, limit=50):
+        """Earlier submissions with the same Aadhaar number or a near-identical face.
+
+        Returns {"aadhaar": [{"request_id", "ts"}], "face": [{"request_id",
+        "ts", "distance"}]}, face matches closest first. Distances above
+        MAX_FACE_DISTANCE are not guaranteed to be found.
+        """
+        conn = self._conn()
+        matches = {"aadhaar": [], "face": []}
+        aadhaar_hash = self.aadhaar_hash(aadhaar)
+        if aadhaar_hash is not None:
+            rows = conn.execute(
+                "SELECT request_id, ts FROM submissions WHERE aadhaar_hash = ? ORDER BY id LIMIT ?",
+                (aadhaar_hash, limit + 1)).fetchall()
+            matches["aadhaar"] = [{"request_id": r, "ts": ts} for r, ts in rows if r != exclude_request_id][:limit]
+
+        if face_hash is None:
+            face_hash = face_hash_from_base64(face_b64)
+        if face_hash is not None:
+            # Union of the exact-chunk buckets, then the exact Hamming distance
+            query = " UNION ".join(
+                f"SELECT request_id, ts, face_hash FROM submissions WHERE face_c{i} = ?" for i in range(FACE_CHUNKS))
+            found = []
+            for request_id, ts, stored in conn.execute(query, _chunks(face_hash)):
+                if request_id == exclude_request_id:
+                    continue
+                distance = bin(_to_unsigned(stored) ^ face_hash).count("1")
+                if distance <= max_distance:
+                    found.append({"request_id": request_id, "ts": ts, "distance": distance})
+            found.sort(key=lambda m: (m["distance"], m["ts"]))
+            matches["face"] = found[:limit]
+        return matches
+
+    def hashes_for(self, request_id):
+        """(aadhaar_hash, face_hash) stored for a request, or None"""
+        row = self._conn().execute(
+            "SELECT aadhaar_hash, face_hash FROM submissions WHERE request_id = ? ORDER BY id DESC LIMIT 1",
+            (request_id,)).fetchone()
+        if row is None:
+            return None
+        return row[0], _to_unsigned(row[1]) if row[1] is not None else None
+
+    def find_for_request(self, request_id, **kwargs):
+        """Submissions that duplicate an already indexed request, or None if it is unknown"""
+        hashes = self.hashes_for(request_id)
+        if hashes is None:
+            return None
+        aadhaar_hash, face_hash = hashes
+        matches = self.find(face_hash=face_hash, exclude_request_id=request_id, **kwargs)
+        if aadhaar_hash is not None:
+            rows = self._conn().execute(
+                "SELECT request_id, ts FROM submissions WHERE aadhaar_hash = ? AND request_id != ? ORDER BY id",
+                (aadhaar_hash, request_id)).fetchall()
+            matches["aadhaar"] = [{"request_id": r, "ts": ts} for r, ts in rows]
+        return matches
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM submissions").fetchone()[0]
+
+
+_default_index = None
+_default_lock = threading.Lock()
+
+
+def get_duplicate_index(directory):
+    """Process-wide index, created on first use (after any fork)"""
+    global _default_index
+    with _default_lock:
+        if _default_index is None:
+            _default_index = DuplicateIndex(directory)
+    return _default_index
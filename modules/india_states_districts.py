@@ -2,6 +2,7 @@
 India States and Districts Database
 Used for validating and standardizing state and district names extracted from Aadhaar documents
 """
+import re
 
 INDIA_STATES_DISTRICTS = {
     "Andhra Pradesh": [
@@ -196,6 +197,37 @@ INDIA_STATES_DISTRICTS = {
 }
 
 
+# Lookup indexes, built once per process (see build_indexes). Each keeps the
+# order of INDIA_STATES_DISTRICTS, which decides the match when several apply.
+_STATE_INDEX = None
+_STATE_PATTERNS = None
+_DISTRICTS_UPPER = None
+
+
+def build_indexes():
+    """Build the upper-cased names and the per-state regexes.
+
+    Called at worker start-up so the first request does not pay for it.
+    """
+    global _STATE_INDEX, _STATE_PATTERNS, _DISTRICTS_UPPER
+    if _STATE_INDEX is None:
+        _STATE_PATTERNS = [(state, re.compile(r"\b" + re.escape(state) + r"\b", re.IGNORECASE))
+                           for state in INDIA_STATES_DISTRICTS]
+        _DISTRICTS_UPPER = {state: [(district, district.upper()) for district in districts]
+                            for state, districts in INDIA_STATES_DISTRICTS.items()}
+        _STATE_INDEX = {state.upper(): state for state in INDIA_STATES_DISTRICTS}
+    return _STATE_INDEX
+
+
+def find_state_in_text(text: str) -> str:
+    """First state (in table order) whose name appears in `text` as a word, case-insensitive, or None"""
+    build_indexes()
+    for state, pattern in _STATE_PATTERNS:
+        if pattern.search(text):
+            return state
+    return None
+
+
 def validate_state(state_name: str) -> bool:
     """Check if a state name is valid"""
     return state_name.strip() in INDIA_STATES_DISTRICTS
@@ -224,16 +256,15 @@ def fuzzy_match_state(state_input: str) -> str:
     Returns the matched state name or None if no match found
     """
     state_input = state_input.strip().upper()
-    states = get_all_states()
     
     # Exact match (case-insensitive)
-    for state in states:
-        if state.upper() == state_input:
-            return state
+    state_index = build_indexes()
+    if state_input in state_index:
+        return state_index[state_input]
     
     # Partial match
-    for state in states:
-        if state.upper().startswith(state_input) or state_input in state.upper():
+    for state_upper, state in state_index.items():
+        if state_upper.startswith(state_input) or state_input in state_upper:
             return state
     
     return None
@@ -245,18 +276,18 @@ def fuzzy_match_district(district_input: str, state_name: str = None) -> tuple:
     Returns (state, district) tuple or (None, None) if no match found
     """
     district_input = district_input.strip().upper()
+    build_indexes()
     
     # If state is provided, search within that state first
     if state_name and validate_state(state_name):
-        districts = get_districts_for_state(state_name)
-        for district in districts:
-            if district.upper() == district_input or district.upper().startswith(district_input):
+        for district, district_upper in _DISTRICTS_UPPER[state_name.strip()]:
+            if district_upper.startswith(district_input):
                 return (state_name, district)
     
     # Search all states
-    for state, districts in INDIA_STATES_DISTRICTS.items():
-        for district in districts:
-            if district.upper() == district_input or district.upper().startswith(district_input):
+    for state, districts in _DISTRICTS_UPPER.items():
+        for district, district_upper in districts:
+            if district_upper.startswith(district_input):
                 return (state, district)
     
     return (None, None)
@@ -0,0 +1,138 @@
+"""
+Layout stage for single scans that contain both sides of the card.
+Detects up to two card rectangles in one page, classifies each crop as
+front (photo present) or back (QR / address block) and writes the crops so
+each one only goes through its own stages.
+"""
+import os
+import uuid
+import cv2
+import numpy as np
+
+from .utils import detect_faces
+
+
+LAYOUT_MAX_SIDE = 1000
+
+# ID-1 cards are 85.6 x 54 mm (aspect ~1.59); allow for perspective and loose crops
+CARD_ASPECT_MIN = 1.25
+CARD_ASPECT_MAX = 1.95
+
+# A card must cover at least this fraction of the page
+CARD_MIN_AREA_FRACTION = 0.04
+
+
+def _downscale(img, max_side=LAYOUT_MAX_SIDE):
+    h, w = img.shape[:2]
+    scale = 1.0
+    if max(w, h) > max_side:
+        scale = max_side / float(max(w, h))
+        img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    return img, scale
+
+
+def _overlaps(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    return ix * iy > 0.2 * min(aw * ah, bw * bh)
+
+
+def detect_card_regions(img, max_cards=2):
+    """Find up to `max_cards` card-shaped rectangles in a BGR page image.
+
+    Returns bounding boxes (x, y, w, h) in full-resolution coordinates,
+    largest first.
+    """
+    small, scale = _downscale(img)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    edged = cv2.Canny(blurred, 30, 120)
+    edged = cv2.morphologyEx(edged, cv2.MORPH_CLOSE, np.ones((7, 7), np.uint8), iterations=2)
+    contours, _ = cv2.findContours(edged, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    page_area = float(small.shape[0] * small.shape[1])
+    boxes = []
+    for cnt in sorted(contours, key=cv2.contourArea, reverse=True)[:20]:
+        x, y, w, h = cv2.boundingRect(cnt)
+        if w * h < CARD_MIN_AREA_FRACTION * page_area or w * h > 0.95 * page_area:
+            continue
+        aspect = max(w, h) / float(min(w, h))
+        if not CARD_ASPECT_MIN <= aspect <= CARD_ASPECT_MAX:
+            continue
+        if any(_overlaps((x, y, w, h), b) for b in boxes):
+            continue
+        boxes.append((x, y, w, h))
+        if len(boxes) == max_cards:
+            break
+
+    inv = 1.0 / scale
+    return [(int(x * inv), int(y * inv), int(w * inv), int(h * inv)) for x, y, w, h in boxes]
+
+
+def classify_card_side(crop):
+    """Classify a card crop as "front", "back" or None (undecided).
+
+    Front: a face is present. Back: a QR code is present.
+    """
+    small, _ = _downscale(crop, 600)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    try:
+        has_face = len(detect_faces(gray)) > 0
+    except Exception:
+        has_face = False
+
+    try:
+        has_qr, _ = cv2.QRCodeDetector().detect(small)
+    except Exception:
+        has_qr = False
+
+    if has_face and not has_qr:
+        return "front"
+    if has_qr and not has_face:
+        return "back"
+    return None
+
+
+def split_combined_scan(image_path, out_dir):
+    """Split a single page that shows both card sides into front/back crops.
+
+    Returns {"front": path or None, "back": path or None, "regions": [...]}
+    where each region has its "box" and assigned "side". When fewer than two
+    cards are found, front and back are None and the caller should keep
+    using the whole page. Crops are written to `out_dir` under names unique
+    to the call.
+    """
+    layout = {"front": None, "back": None, "regions": []}
+    img = cv2.imread(image_path)
+    if img is None:
+        return layout
+
+    boxes = detect_card_regions(img)
+    if len(boxes) < 2:
+        return layout
+
+    # Reading order (top-to-bottom, left-to-right) breaks ties
+    boxes.sort(key=lambda b: (b[1], b[0]))
+    crops = [img[y:y + h, x:x + w] for x, y, w, h in boxes]
+    sides = [classify_card_side(c) for c in crops]
+
+    if sides[0] is None and sides[1] is None:
+        sides = ["front", "back"]
+    elif sides[0] is None or sides[1] is None or sides[0] == sides[1]:
+        # One side is known (or both claim the same side): the other gets the rest
+        known = 0 if sides[0] is not None else 1
+        sides[1 - known] = "back" if sides[known] == "front" else "front"
+
+    os.makedirs(out_dir, exist_ok=True)
+    # Uploads of concurrent requests can share a name (and out_dir): each split gets its own crop names
+    stem = os.path.splitext(os.path.basename(image_path))[0] + "_" + uuid.uuid4().hex[:12]
+    for box, crop, side in zip(boxes, crops, sides):
+        crop_path = os.path.join(out_dir, f"{stem}_{side}.png")
+        cv2.imwrite(crop_path, crop)
+        layout[side] = crop_path
+        layout["regions"].append({"box": list(box), "side": side})
+
+    return layout
@@ -0,0 +1,216 @@
+"""
+Memory accounting and memory-aware admission control.
+StageMemory records the RSS change (and, when enabled, the tracemalloc
+peak) of every pipeline stage. MemoryBudget is a process-wide budget:
+requests reserve the estimated decoded size of their images before any
+stage runs, wait in a short queue while the worker is over budget and are
+rejected when the wait runs out, instead of the worker being OOM-killed.
+"""
+import os
+import threading
+import time
+import tracemalloc
+
+from PIL import Image
+
+from .pdf_reader import is_pdf
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+
+MB = 1024 * 1024
+
+# Process-wide budget for admitted requests (per gunicorn worker)
+DEFAULT_MEMORY_BUDGET_MB = int(os.environ.get("OCR_MEMORY_BUDGET_MB", "1024"))
+
+# How long a request may wait for budget, and how many may wait at once
+DEFAULT_ADMISSION_TIMEOUT_S = float(os.environ.get("OCR_ADMISSION_TIMEOUT_S", "5"))
+DEFAULT_MAX_WAITING = int(os.environ.get("OCR_ADMISSION_MAX_WAITING", "4"))
+
+# Set OCR_TRACEMALLOC=1 to add Python-heap peaks to the per-stage numbers
+TRACEMALLOC_ENABLED = os.environ.get("OCR_TRACEMALLOC", "0").lower() in ("1", "true", "yes")
+
+# Working copies of a decoded image the pipeline holds at peak
+# (colour decode, grayscale, enhanced/upscaled copy, filter output)
+DECODE_OVERHEAD_FACTOR = 4
+
+# Decoded size assumed for a PDF: two A4 pages rasterized at 200 dpi
+PDF_DECODED_BYTES = 2 * 1654 * 2339 * 3
+
+# Charged when an image header cannot be read
+UNKNOWN_IMAGE_BYTES = 4000 * 3000 * 3
+
+
+class MemoryBudgetExceeded(Exception):
+    """A request could not be admitted within the memory budget"""
+
+
+def rss_bytes():
+    """Current resident set size of this process, or None when unknown"""
+    if PSUTIL_AVAILABLE:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class StageMemory:
+    """Per-stage memory measurements of one request.
+
+    mark(stage) closes the stage that ran since the previous mark. RSS is
+    process-wide, so with concurrent requests the deltas are approximate;
+    tracemalloc peaks are exact for Python allocations but slow things down.
+    """
+
+    def __init__(self, use_tracemalloc=None):
+        self.use_tracemalloc = TRACEMALLOC_ENABLED if use_tracemalloc is None else use_tracemalloc
+        if self.use_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.stages = {}
+        self._start_rss = self._last_rss = rss_bytes()
+        self._peak_rss = self._start_rss
+        if self.use_tracemalloc:
+            tracemalloc.reset_peak()
+
+    def mark(self, stage):
+        rss = rss_bytes()
+        entry = {}
+        if rss is not None:
+            entry["rss_mb"] = round(rss / MB, 1)
+            entry["rss_delta_mb"] = round((rss - self._last_rss) / MB, 1)
+            self._last_rss = rss
+            self._peak_rss = max(self._peak_rss, rss)
+        if self.use_tracemalloc:
+            entry["py_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / MB, 1)
+            tracemalloc.reset_peak()
+        self.stages[stage] = entry
+
+    def report(self):
+        if self._start_rss is None:
+            return {"stages": self.stages, "rss_available": False}
+        return {
+            "stages": self.stages,
+            "start_rss_mb": round(self._start_rss / MB, 1),
+            "peak_rss_mb": round(self._peak_rss / MB, 1),
+            "rss_delta_mb": round((self._last_rss - self._start_rss) / MB, 1),
+        }
+
+
+def estimate_decoded_bytes(paths):
+    """Estimated peak memory of processing `paths`, from image headers only"""
+    total = 0
+    for path in dict.fromkeys(p for p in paths if p):
+        if is_pdf(path):
+            total += PDF_DECODED_BYTES * DECODE_OVERHEAD_FACTOR
+            continue
+        try:
+            with Image.open(path) as img:
+                w, h = img.size
+                channels = len(img.getbands())
+            total += w * h * max(channels, 3) * DECODE_OVERHEAD_FACTOR
+        except Exception:
+            total += UNKNOWN_IMAGE_BYTES * DECODE_OVERHEAD_FACTOR
+    return total
+
+
+class MemoryBudget:
+    """Process-wide memory budget shared by concurrent requests.
+
+    admit() reserves the estimate of one request for the duration of a
+    with-block. A request that does not fit waits (at most `max_waiting`
+    requests at a time, each for at most `timeout_s`) and is then rejected
+    with MemoryBudgetExceeded.
+    """
+
+    def __init__(self, limit_bytes=DEFAULT_MEMORY_BUDGET_MB * MB, timeout_s=DEFAULT_ADMISSION_TIMEOUT_S,
+                 max_waiting=DEFAULT_MAX_WAITING):
+        self.limit_bytes = limit_bytes
+        self.timeout_s = timeout_s
+        self.max_waiting = max_waiting
+        self.in_use = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes, timeout_s=None):
+        timeout_s = self.timeout_s if timeout_s is None else timeout_s
+        # A single request larger than the whole budget is only run on an idle worker
+        nbytes = min(nbytes, self.limit_bytes)
+        with self._cond:
+            if self.in_use + nbytes > self.limit_bytes:
+                if self.waiting >= self.max_waiting:
+                    self.rejected += 1
+                    raise MemoryBudgetExceeded("memory budget exceeded, admission queue full")
+                self.waiting += 1
+                self.queued += 1
+                end = time.monotonic() + timeout_s
+                try:
+                    while self.in_use + nbytes > self.limit_bytes:
+                        remaining = end - time.monotonic()
+                        if remaining <= 0:
+                            self.rejected += 1
+                            raise MemoryBudgetExceeded("memory budget exceeded, timed out waiting for memory")
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.in_use += nbytes
+            self.admitted += 1
+        return nbytes
+
+    def release(self, nbytes):
+        with self._cond:
+            self.in_use = max(0, self.in_use - nbytes)
+            self._cond.notify_all()
+
+    def admit(self, nbytes, timeout_s=None):
+        """Context manager reserving `nbytes` for the block"""
+        return _Reservation(self, nbytes, timeout_s)
+
+    def stats(self):
+        rss = rss_bytes()
+        return {
+            "limit_mb": round(self.limit_bytes / MB, 1),
+            "in_use_mb": round(self.in_use / MB, 1),
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "rss_mb": round(rss / MB, 1) if rss is not None else None,
+        }
+
+
+class _Reservation:
+    def __init__(self, budget, nbytes, timeout_s):
+        self.budget = budget
+        self.nbytes = nbytes
+        self.timeout_s = timeout_s
+        self.reserved = 0
+
+    def __enter__(self):
+        self.reserved = self.budget.acquire(self.nbytes, self.timeout_s)
+        return self
+
+    def __exit__(self, *exc):
+        self.budget.release(self.reserved)
+        return False
+
+
+_default_budget = None
+_default_lock = threading.Lock()
+
+
+def get_memory_budget():
+    """Process-wide budget, created on first use (after any fork)"""
+    global _default_budget
+    with _default_lock:
+        if _default_budget is None:
+            _default_budget = MemoryBudget()
+    return _default_budget
@@ -0,0 +1,182 @@
+"""
+Montage batching for small OCR crops.
+Field crops (name, DOB, PIN, address lines, ... from one card or from many
+cards) are stacked into one white page with known offsets, the page is
+OCR'd with a single Tesseract call and each word is mapped back to the crop
+it came from. A page holds as many crops as fit in MONTAGE_MAX_HEIGHT, so
+per-field OCR costs one engine call per page instead of one per field.
+Batch runs (backfill.py, ingest.py) share a MontageBatcher between their
+worker threads, so the crops of cards processed at the same time are read
+together.
+"""
+import threading
+import time
+
+import pytesseract
+from PIL import Image
+
+
+# Blank space between stacked crops; keeps Tesseract from joining lines across crops
+MONTAGE_GAP = 24
+MONTAGE_MARGIN = 16
+MONTAGE_MAX_HEIGHT = 4000
+
+# One crop per row, read as a block of lines
+MONTAGE_OCR_CONFIG = "--psm 6"
+
+# A shared montage is read once this many crops from concurrent cards are waiting
+MONTAGE_BATCH_CROPS = 48
+
+# How long a card's crops wait for other cards' crops to join them
+MONTAGE_BATCH_WAIT_S = 0.05
+
+
+def pack_crops(crops, gap=MONTAGE_GAP, margin=MONTAGE_MARGIN, max_height=MONTAGE_MAX_HEIGHT):
+    """Stack crops top to bottom into montage pages.
+
+    `crops` is a list of (key, PIL image). Returns a list of pages, each
+    (PIL image, [{"key", "x", "y", "w", "h"}]). A crop taller than
+    `max_height` gets a page of its own.
+    """
+    pages = []
+    current = []
+    height = margin
+    for key, crop in crops:
+        w, h = crop.size
+        if current and height + h + margin > max_height:
+            pages.append(current)
+            current = []
+            height = margin
+        current.append({"key": key, "crop": crop, "x": margin, "y": height, "w": w, "h": h})
+        height += h + gap
+    if current:
+        pages.append(current)
+
+    result = []
+    for placements in pages:
+        width = max(p["w"] for p in placements) + 2 * margin
+        page_height = placements[-1]["y"] + placements[-1]["h"] + margin
+        page = Image.new("L", (width, page_height), 255)
+        for p in placements:
+            page.paste(p.pop("crop").convert("L"), (p["x"], p["y"]))
+        result.append((page, placements))
+    return result
+
+
+def _owner(placements, x, y, w, h):
+    """Placement containing the centre of a word box, or None"""
+    cx, cy = x + w / 2.0, y + h / 2.0
+    for p in placements:
+        if p["y"] - MONTAGE_GAP / 2.0 <= cy <= p["y"] + p["h"] + MONTAGE_GAP / 2.0 and p["x"] <= cx <= p["x"] + p["w"]:
+            return p
+    return None
+
+
+def ocr_crops(crops, lang="eng", config=MONTAGE_OCR_CONFIG, timeout=None):
+    """OCR many crops with one Tesseract call per montage page.
+
+    `crops` is a list of (key, PIL image); keys can be anything hashable,
+    e.g. a field name or (card_id, field) in batch mode. Returns
+    {key: {"text": str, "conf": mean word confidence, "words": [{"text",
+    "conf", "box"}]}} with boxes in the coordinates of the key's crop.
+    Crops with no words read still get an entry with empty text.
+    """
+    out = {key: {"text": "", "conf": 0.0, "words": []} for key, _ in crops}
+    for page, placements in pack_crops(crops):
+        kwargs = {"lang": lang, "config": config, "output_type": pytesseract.Output.DICT}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        data = pytesseract.image_to_data(page, **kwargs)
+        for i, text in enumerate(data["text"]):
+            text = (text or "").strip()
+            if not text:
+                continue
+            x, y, w, h = data["left"][i], data["top"][i], data["width"][i], data["height"][i]
+            owner = _owner(placements, x, y, w, h)
+            if owner is None:
+                continue
+            out[owner["key"]]["words"].append({
+                "text": text,
+                "conf": float(data["conf"][i]),
+                "box": (x - owner["x"], y - owner["y"], w, h),
+            })
+
+    for entry in out.values():
+        # Crops are stacked one per row, so Tesseract's order is each crop's reading order
+        entry["text"] = " ".join(w["text"] for w in entry["words"])
+        confs = [w["conf"] for w in entry["words"] if w["conf"] >= 0]
+        entry["conf"] = sum(confs) / len(confs) if confs else 0.0
+    return out
+
+
+class MontageBatcher:
+    """Pools ocr_crops calls made by concurrent threads into shared montage pages.
+
+    Each call waits up to `wait_s` for calls from other threads (other
+    cards) with the same language and config, or until `max_crops` crops are
+    pending; the thread that ends the wait reads the whole batch with one
+    ocr_crops call and hands every caller its own entries. The batch gets
+    the shortest timeout of its callers and a failure is raised in all of them.
+    """
+
+    def __init__(self, max_crops=MONTAGE_BATCH_CROPS, wait_s=MONTAGE_BATCH_WAIT_S):
+        self.max_crops = max_crops
+        self.wait_s = wait_s
+        self._cond = threading.Condition()
+        # (lang, config) -> calls waiting for the next montage
+        self._pending = {}
+        self.calls = 0
+        self.batches = 0
+        self.crops = 0
+
+    def ocr_crops(self, crops, lang="eng", config=MONTAGE_OCR_CONFIG, timeout=None):
+        """Same as montage.ocr_crops, read together with other threads' crops"""
+        call = {"crops": crops, "timeout": timeout, "taken": False, "done": False, "result": None, "error": None}
+        group = (lang, config)
+        batch = None
+        with self._cond:
+            self._pending.setdefault(group, []).append(call)
+            self._cond.notify_all()
+            wait_until = time.monotonic() + self.wait_s
+            while not call["taken"]:
+                pending = self._pending[group]
+                left = wait_until - time.monotonic()
+                if left <= 0 or sum(len(c["crops"]) for c in pending) >= self.max_crops:
+                    batch = self._pending.pop(group)
+                    for c in batch:
+                        c["taken"] = True
+                else:
+                    self._cond.wait(left)
+
+        if batch is not None:
+            self._read(batch, lang, config)
+        with self._cond:
+            while not call["done"]:
+                self._cond.wait()
+        if call["error"] is not None:
+            raise call["error"]
+        return call["result"]
+
+    def _read(self, batch, lang, config):
+        keyed = [((i, key), crop) for i, c in enumerate(batch) for key, crop in c["crops"]]
+        timeouts = [c["timeout"] for c in batch if c["timeout"] is not None]
+        read, error = None, None
+        try:
+            read = ocr_crops(keyed, lang=lang, config=config, timeout=min(timeouts) if timeouts else None)
+        except Exception as e:
+            error = e
+        with self._cond:
+            for i, c in enumerate(batch):
+                if error is None:
+                    c["result"] = {key: read[(i, key)] for key, _ in c["crops"]}
+                c["error"] = error
+                c["done"] = True
+            self.calls += len(batch)
+            self.batches += 1
+            self.crops += len(keyed)
+            self._cond.notify_all()
+
+    def stats(self):
+        """Calls served, shared montage reads and crops read"""
+        with self._cond:
+            return {"calls": self.calls, "batches": self.batches, "crops": self.crops}
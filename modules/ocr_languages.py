@@ -0,0 +1,109 @@
+"""
+Script detection and per-region OCR language selection.
+English-only zones are read with the small "eng" model; only regions whose
+script is detected as Devanagari/Odia pay for the larger language models.
+Engines are cached per worker thread when tesserocr is installed, so a
+language model is loaded once instead of once per Tesseract call.
+"""
+import re
+import threading
+
+import pytesseract
+
+try:
+    from tesserocr import PyTessBaseAPI, PSM, RIL, iterate_level
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+
+PRIMARY_LANG = "eng"
+
+# Tesseract OSD script name -> smallest language set for a card region
+SCRIPT_LANGS = {
+    "Latin": "eng",
+    "Devanagari": "hin+eng",
+    "Oriya": "ori+eng",
+    "Bengali": "ben+eng",
+}
+
+# Used when OSD cannot decide (too little text in the sample)
+FALLBACK_SCRIPT = "Devanagari"
+
+_available_langs = None
+_engines = threading.local()
+
+
+def available_languages():
+    """Installed Tesseract languages, queried once per process"""
+    global _available_langs
+    if _available_langs is None:
+        try:
+            _available_langs = frozenset(pytesseract.get_languages(config=""))
+        except Exception:
+            _available_langs = frozenset({PRIMARY_LANG})
+    return _available_langs
+
+
+def languages_for_script(script):
+    """Language string for a script, limited to installed models"""
+    wanted = SCRIPT_LANGS.get(script or FALLBACK_SCRIPT, PRIMARY_LANG).split("+")
+    installed = [lang for lang in wanted if lang in available_languages()]
+    return "+".join(installed) or PRIMARY_LANG
+
+
+def detect_script(pil_img, timeout=None):
+    """Detect the dominant script of an image sample with Tesseract OSD.
+
+    Returns the OSD script name (e.g. "Latin", "Devanagari") or None when
+    OSD is unavailable or the sample has too little text.
+    """
+    kwargs = {"config": "--psm 0"}
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    try:
+        osd = pytesseract.image_to_osd(pil_img, **kwargs)
+    except Exception:
+        return None
+    m = re.search(r"Script:\s*(\w+)", osd)
+    return m.group(1) if m else None
+
+
+def _get_engine(lang):
+    """tesserocr engine for `lang`, created once per worker thread"""
+    engines = getattr(_engines, "by_lang", None)
+    if engines is None:
+        engines = _engines.by_lang = {}
+    if lang not in engines:
+        engines[lang] = PyTessBaseAPI(lang=lang, psm=PSM.SINGLE_BLOCK)
+    return engines[lang]
+
+
+def ocr_region(pil_img, lang, timeout=None):
+    """OCR one region crop with `lang`. Returns words as (text, conf, (x, y, w, h))"""
+    if TESSEROCR_AVAILABLE:
+        api = _get_engine(lang)
+        api.SetImage(pil_img)
+        # Same contract as pytesseract: give up once `timeout` seconds have passed
+        if not api.Recognize(max(1, int(timeout * 1000)) if timeout is not None else 0):
+            raise RuntimeError("Tesseract process timeout")
+        words = []
+        for r in iterate_level(api.GetIterator(), RIL.WORD):
+            text = (r.GetUTF8Text(RIL.WORD) or "").strip()
+            if not text:
+                continue
+            x1, y1, x2, y2 = r.BoundingBox(RIL.WORD)
+            words.append((text, float(r.Confidence(RIL.WORD)), (x1, y1, x2 - x1, y2 - y1)))
+        return words
+
+    kwargs = {"lang": lang, "config": "--psm 6", "output_type": pytesseract.Output.DICT}
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    data = pytesseract.image_to_data(pil_img, **kwargs)
+    words = []
+    for i, text in enumerate(data["text"]):
+        text = (text or "").strip()
+        if text:
+            words.append((text, float(data["conf"][i]),
+                          (data["left"][i], data["top"][i], data["width"][i], data["height"][i])))
+    return words
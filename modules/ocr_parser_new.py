@@ -1,38 +1,89 @@
+import bisect
+import os
 import re
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from .india_states_districts import (
     validate_state, validate_district, fuzzy_match_state, 
-    fuzzy_match_district, get_all_states
+    fuzzy_match_district, find_state_in_text
 )
 
 
+# Input caps: OCR of a card side is a few hundred characters, so text far
+# longer than this is noise and is cut before any pattern runs on it.
+# Every pattern below runs in time linear in its input, so the caps bound
+# the parse time.
+MAX_PARSE_CHARS = int(os.environ.get("OCR_PARSE_MAX_CHARS", "20000"))
+MAX_LINE_CHARS = int(os.environ.get("OCR_PARSE_MAX_LINE_CHARS", "400"))
+
+# Header and footer phrases, removed in this order
+_HEADER_FOOTER_RES = tuple(re.compile(p, re.IGNORECASE) for p in (
+    r'Government\s+of\s+India',
+    r'Unique\s+Identification\s+Authority',
+    r'UIDAI',
+    r'My\s+Aadhaar',
+    r'Mera\s+Aadhaar',
+    r'UIDAI\s+Mobile\s+Number',
+    r'@aadhaar',
+    r'@india\.gov\.in',
+    r'help\.aadhaar@uidai\.net\.in',
+    r'uidai\.gov\.in',
+    r'www\.uidai\.gov\.in',
+    r'Aadhaar\s+Number',
+    r'AADHAAR\s+NUMBER',
+    r'Logo\s+of\s+Aadhaar',
+    r'Issued\s+by\s+UIDAI',
+    r'Ministry\s+of\s+Electronics',
+    r'Government\s+Logo',
+    r'India\s+Government',
+))
+
+# Guardian labels, in order of preference, up to the first letter of the name
+_GUARDIAN_LABEL_RES = tuple(re.compile(label + r"[:\s]+(?=[A-Z])", re.IGNORECASE)
+                            for label in (r"C/O", r"CARE\s+OF", r"F/O", r"FATHER"))
+
+# Characters a guardian name can span
+_NAME_RUN_RE = re.compile(r"[A-Za-z\s\.]+", re.IGNORECASE)
+
+# "Address" label with the blank space and optional colon after it
+_ADDRESS_LABEL_RE = re.compile(r"Address(\s*)(:?)\s*", re.IGNORECASE)
+
+# Gender shorthand after a label, e.g. "Gender: F"
+_GENDER_FEMALE_RE = re.compile(r"(?:Gender|लिंग)(?:\s*:)?\s*[F/](?:\s|$|,)", re.IGNORECASE)
+_GENDER_MALE_RE = re.compile(r"(?:Gender|लिंग)(?:\s*:)?\s*[M/](?:\s|$|,)", re.IGNORECASE)
+
+
+def bound_ocr_text(text: str) -> str:
+    """Text cut to the input caps: MAX_PARSE_CHARS in all, MAX_LINE_CHARS per line"""
+    text = (text or "")[:MAX_PARSE_CHARS]
+    if len(text) > MAX_LINE_CHARS:
+        text = "\n".join(line[:MAX_LINE_CHARS] for line in text.split("\n"))
+    return text
+
+
+def _address_after_label(text: str) -> Optional[str]:
+    r"""Rest of the line after the first "Address" label, or None.
+
+    Same capture as r"Address\s*:?\s*(.+?)(?:$|\n)", which backtracks
+    quadratically when only blank space follows the label.
+    """
+    m = _ADDRESS_LABEL_RE.search(text)
+    if m is None:
+        return None
+    if m.end() < len(text):
+        line_end = text.find("\n", m.end())
+        return text[m.end():line_end if line_end != -1 else len(text)]
+    # Only blank space (and the colon) left: that pattern took a blank that is
+    # not a newline, else the colon, else nothing
+    if m.group(2):
+        return "" if text[m.end(2):].strip("\n") else ":"
+    return "" if m.group(1).strip("\n") else None
+
+
 def _filter_aadhaar_headers_footers(text: str) -> str:
     """Remove common Aadhaar document headers and footers"""
-    # Patterns to ignore/remove
-    ignore_patterns = [
-        r'Government\s+of\s+India',
-        r'Unique\s+Identification\s+Authority',
-        r'UIDAI',
-        r'My\s+Aadhaar',
-        r'Mera\s+Aadhaar',
-        r'UIDAI\s+Mobile\s+Number',
-        r'@aadhaar',
-        r'@india\.gov\.in',
-        r'help\.aadhaar@uidai\.net\.in',
-        r'uidai\.gov\.in',
-        r'www\.uidai\.gov\.in',
-        r'Aadhaar\s+Number',
-        r'AADHAAR\s+NUMBER',
-        r'Logo\s+of\s+Aadhaar',
-        r'Issued\s+by\s+UIDAI',
-        r'Ministry\s+of\s+Electronics',
-        r'Government\s+Logo',
-        r'India\s+Government',
-    ]
-    
     result = text
-    for pattern in ignore_patterns:
-        result = re.sub(pattern, '', result, flags=re.IGNORECASE)
+    for pattern in _HEADER_FOOTER_RES:
+        result = pattern.sub('', result)
     
     # Also remove lines that are mostly these patterns
     lines = result.splitlines()
@@ -59,10 +110,9 @@ def _clean_lines(text: str):
 
 def _fuzzy_match_state_from_text(text: str) -> Optional[str]:
     """Find valid state name in text using fuzzy matching"""
-    all_states = get_all_states()
-    for state in all_states:
-        if re.search(r"\b" + re.escape(state) + r"\b", text, flags=re.IGNORECASE):
-            return state
+    state = find_state_in_text(text)
+    if state:
+        return state
     # Try fuzzy match on each line
     lines = _clean_lines(text)
     for line in lines:
@@ -72,15 +122,91 @@ def _fuzzy_match_state_from_text(text: str) -> Optional[str]:
     return None
 
 
+# Verhoeff checksum tables (Aadhaar numbers carry a Verhoeff check digit)
+_VERHOEFF_D = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9),
+    (1, 2, 3, 4, 0, 6, 7, 8, 9, 5),
+    (2, 3, 4, 0, 1, 7, 8, 9, 5, 6),
+    (3, 4, 0, 1, 2, 8, 9, 5, 6, 7),
+    (4, 0, 1, 2, 3, 9, 5, 6, 7, 8),
+    (5, 9, 8, 7, 6, 0, 4, 3, 2, 1),
+    (6, 5, 9, 8, 7, 1, 0, 4, 3, 2),
+    (7, 6, 5, 9, 8, 2, 1, 0, 4, 3),
+    (8, 7, 6, 5, 9, 3, 2, 1, 0, 4),
+    (9, 8, 7, 6, 5, 4, 3, 2, 1, 0),
+)
+_VERHOEFF_P = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9),
+    (1, 5, 7, 6, 2, 8, 3, 0, 9, 4),
+    (5, 8, 0, 3, 7, 9, 6, 1, 4, 2),
+    (8, 9, 1, 6, 0, 4, 3, 5, 2, 7),
+    (9, 4, 5, 3, 1, 2, 6, 8, 7, 0),
+    (4, 2, 8, 6, 5, 7, 3, 9, 0, 1),
+    (2, 7, 9, 3, 8, 0, 6, 4, 1, 5),
+    (7, 0, 4, 6, 9, 1, 3, 2, 5, 8),
+)
+
+# 12 digits as 4-4-4 groups, each gap a space, a hyphen or nothing on its own
+# (OCR often loses one separator), not part of a longer run (e.g. a 16-digit VID)
+_AADHAAR_CANDIDATE_RE = re.compile(r"(?<!\d)(?<!\d )(?<!\d-)(\d{4})([ -]?)(\d{4})([ -]?)(\d{4})(?![ -]?\d)")
+
+
+def verhoeff_valid(number: str) -> bool:
+    """Check the Verhoeff check digit of a numeric string"""
+    if not number or not number.isdigit():
+        return False
+    c = 0
+    for i, digit in enumerate(reversed(number)):
+        c = _VERHOEFF_D[c][_VERHOEFF_P[i % 8][int(digit)]]
+    return c == 0
+
+
+def is_valid_aadhaar(number: Optional[str]) -> bool:
+    """12 digits, not starting with 0 or 1, with a valid Verhoeff check digit"""
+    return bool(number) and len(number) == 12 and number[0] not in "01" and verhoeff_valid(number)
+
+
+def extract_aadhaar_candidates(text: str) -> List[Dict]:
+    """Collect every 12-digit candidate in the text, best first.
+
+    Each candidate is {"number", "valid", "score"}. Checksum-valid numbers
+    rank first; numbers printed in the 4-4-4 card format rank above run-on
+    digits; numbers on a VID line rank last.
+    """
+    candidates = {}
+    offset = 0
+    # Candidates never span lines, so each line is scanned (and labeled) once
+    for line in bound_ocr_text(text).split("\n"):
+        line_score = None
+        for m in _AADHAAR_CANDIDATE_RE.finditer(line):
+            if line_score is None:
+                line_score = 0.0
+                if re.search(r"\bVID\b", line, flags=re.IGNORECASE):
+                    line_score -= 5.0
+                if re.search(r"Aadhaar|आधार", line, flags=re.IGNORECASE):
+                    line_score += 1.0
+            number = m.group(1) + m.group(3) + m.group(5)
+
+            valid = is_valid_aadhaar(number)
+            score = line_score
+            if valid:
+                score += 10.0
+            if m.group(2) == m.group(4) == " ":
+                score += 2.0
+
+            if number not in candidates or candidates[number]["score"] < score:
+                candidates[number] = {"number": number, "valid": valid, "score": score,
+                                      "position": offset + m.start()}
+        offset += len(line) + 1
+
+    ranked = sorted(candidates.values(), key=lambda c: (-c["score"], c["position"]))
+    return [{"number": c["number"], "valid": c["valid"], "score": c["score"]} for c in ranked]
+
+
 def extract_aadhaar_number(text: str) -> Optional[str]:
-    # Match 12 digits with optional spaces
-    m = re.search(r"\b(\d{4}\s?\d{4}\s?\d{4})\b", text)
-    if m:
-        return re.sub(r"\s+", "", m.group(1))
-    m2 = re.search(r"\b(\d{12})\b", text)
-    if m2:
-        return m2.group(1)
-    return None
+    """Best 12-digit candidate, preferring checksum-valid numbers"""
+    candidates = extract_aadhaar_candidates(text)
+    return candidates[0]["number"] if candidates else None
 
 
 def extract_dob(text: str) -> Optional[str]:
@@ -124,10 +250,10 @@ def extract_gender(text: str) -> Optional[str]:
         return 'Male'
     
     # Shorthand M/F with Gender label
-    if re.search(r"(?:Gender|लिंग)\s*:?\s*[F/](?:\s|$|,)", context_text, flags=re.IGNORECASE):
+    if _GENDER_FEMALE_RE.search(context_text):
         return 'Female'
     
-    if re.search(r"(?:Gender|लिंग)\s*:?\s*[M/](?:\s|$|,)", context_text, flags=re.IGNORECASE):
+    if _GENDER_MALE_RE.search(context_text):
         return 'Male'
     
     return None
@@ -193,18 +319,25 @@ def extract_name(text: str) -> Optional[str]:
 
 def extract_guardian_name(text: str) -> Optional[str]:
     """Extract guardian/father/parent name from 'C/O:' or 'Care of:' pattern"""
-    # Look for C/O, Care of, Father, Parent patterns
-    patterns = [
-        r"C/O[:\s]+([A-Z][A-Za-z\s\.]+?)(?:,|$)",  # C/O: Name,
-        r"CARE\s+OF[:\s]+([A-Z][A-Za-z\s\.]+?)(?:,|$)",  # CARE OF: Name,
-        r"F/O[:\s]+([A-Z][A-Za-z\s\.]+?)(?:,|$)",  # F/O: Name,
-        r"FATHER[:\s]+([A-Z][A-Za-z\s\.]+?)(?:,|$)",  # FATHER: Name,
-    ]
-    
-    for pattern in patterns:
-        m = re.search(pattern, text, re.IGNORECASE)
-        if m:
-            name = m.group(1).strip()
+    # Look for C/O, Care of, Father, Parent patterns. The name is the run of
+    # letters, spaces and dots after the label, taken only when a comma or the
+    # end of the text follows it. Run ends are looked up in one table of
+    # maximal runs: scanning forward from each label is quadratic on text
+    # that repeats a label inside a long run.
+    run_starts = run_ends = None
+    for pattern in _GUARDIAN_LABEL_RES:
+        name = None
+        for m in pattern.finditer(text):
+            if run_starts is None:
+                runs = [r.span() for r in _NAME_RUN_RE.finditer(text)]
+                run_starts = [start for start, _ in runs]
+                run_ends = [end for _, end in runs]
+            end = run_ends[bisect.bisect_right(run_starts, m.end()) - 1]
+            if end - m.end() >= 2 and (end == len(text) or text[end] == ','):
+                name = text[m.end():end]
+                break
+        if name:
+            name = name.strip()
             # Clean up the name
             if name and len(name) > 2:
                 return name
@@ -217,9 +350,9 @@ def extract_address_components(text: str) -> Dict[str, Optional[str]]:
     result = {"address": None, "locality": None, "city": None, "state": None, "pincode": None}
 
     # Strategy 1: Look for explicit "Address:" pattern - MOST ACCURATE
-    addr_match = re.search(r"Address\s*:?\s*(.+?)(?:$|\n)", text, re.IGNORECASE | re.MULTILINE)
-    if addr_match:
-        full_addr = addr_match.group(1).strip()
+    addr_line = _address_after_label(text)
+    if addr_line is not None:
+        full_addr = addr_line.strip()
         result['address'] = full_addr
         
         # Extract pincode from address
@@ -279,6 +412,7 @@ def extract_address_components(text: str) -> Dict[str, Optional[str]]:
 
 def parse_ocr_text(text: str) -> Dict[str, Optional[str]]:
     """Return parsed fields from OCR text: name, dob, yob, gender, aadhaar, address components, guardian name."""
+    text = bound_ocr_text(text)
     # First, filter out common headers and footers
     cleaned_text = _filter_aadhaar_headers_footers(text)
     
@@ -298,8 +432,32 @@ def parse_ocr_text(text: str) -> Dict[str, Optional[str]]:
     extracted['gender'] = gender
 
     extracted['aadhaar'] = extract_aadhaar_number(cleaned_text)
+    extracted['aadhaar_valid'] = is_valid_aadhaar(extracted['aadhaar'])
 
     addr = extract_address_components(cleaned_text)
     extracted.update(addr)
 
     return extracted
+
+
+def parse_field(field: str, text: str) -> Optional[str]:
+    """Parse a single field from the text of a re-read field region.
+
+    Used by the weak-field retry loop, where the text is just the line that
+    held the field. Returns None when the field cannot be read from it.
+    """
+    text = bound_ocr_text(text).strip()
+    if not text:
+        return None
+    if field == "dob":
+        return extract_dob(text)
+    if field == "gender":
+        return extract_gender(text)
+    if field == "name":
+        return text if sum(c.isdigit() for c in text) == 0 else None
+    if field == "pincode":
+        m = re.search(r"\b([1-9]\d{5})\b", text)
+        return m.group(1) if m else None
+    if field == "state":
+        return find_state_in_text(text)
+    return None
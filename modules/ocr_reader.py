@@ -1,9 +1,387 @@
+import cv2
 import pytesseract
 from PIL import Image
 
-# Apna installed path daalo:
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+from .ocr_languages import PRIMARY_LANG, detect_script, languages_for_script, ocr_region
+from .montage import ocr_crops
+from .startup import resolve_tesseract_cmd
+from .tesseract_config import tesseract_args, zone_settings
 
-def extract_text_from_image(image_path):
-    img = Image.open(image_path)
-    return pytesseract.image_to_string(img)
+# TESSERACT_CMD env var, PATH, or the usual install locations
+pytesseract.pytesseract.tesseract_cmd = resolve_tesseract_cmd()
+
+
+def enhance_for_ocr(image_path, min_width=1400):
+    """Heavier preprocessing for low-quality photos: upscale, CLAHE, unsharp mask.
+
+    Returns a PIL image ready for Tesseract.
+    """
+    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return Image.open(image_path)
+
+    h, w = img.shape[:2]
+    if w < min_width:
+        scale = min_width / float(w)
+        img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_CUBIC)
+    return Image.fromarray(_sharpen(img))
+
+
+def _sharpen(gray, tile_grid=(8, 8)):
+    """CLAHE followed by an unsharp mask"""
+    img = cv2.createCLAHE(clipLimit=2.0, tileGridSize=tile_grid).apply(gray)
+    return cv2.addWeighted(img, 1.5, cv2.GaussianBlur(img, (0, 0), 3), -0.5, 0)
+
+
+def _rescale(img, scale):
+    if scale == 1.0:
+        return img
+    h, w = img.shape[:2]
+    interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_CUBIC
+    return cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=interpolation)
+
+
+def prepare_page(image_path, settings):
+    """Load a page with a zone setting's preprocessing and scale (see tesseract_config).
+
+    "none" keeps the colors, "gray", "clahe" and "otsu" convert to
+    grayscale first. Returns a PIL image.
+    """
+    preprocess = settings["preprocess"]
+    if preprocess == "none" and settings["scale"] == 1.0:
+        return Image.open(image_path)
+    img = cv2.imread(image_path, cv2.IMREAD_COLOR if preprocess == "none" else cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return Image.open(image_path)
+    img = _rescale(img, settings["scale"])
+    if preprocess == "none":
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    elif preprocess == "clahe":
+        img = _sharpen(img)
+    elif preprocess == "otsu":
+        img = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    return Image.fromarray(img)
+
+
+def _tesseract_timeout(deadline):
+    """Seconds left for a Tesseract call, None for no limit"""
+    timeout = deadline.remaining_s() if deadline is not None else None
+    if timeout is not None and timeout <= 0:
+        # pytesseract treats timeout=0 as "no limit"
+        raise RuntimeError("Tesseract process timeout")
+    return timeout
+
+
+def _words_to_text(words):
+    """Rebuild plain text (one line per Tesseract line, blank line between blocks)"""
+    lines = []
+    current = None
+    last_block = None
+    for w in words:
+        key = w["line"]
+        if key != current:
+            if last_block is not None and key[0] != last_block:
+                lines.append("")
+            lines.append(w["text"])
+            current = key
+            last_block = key[0]
+        else:
+            lines[-1] += " " + w["text"]
+    return "\n".join(lines)
+
+
+# Lines read by the English pass with a lower mean confidence are checked for another script
+LOW_CONFIDENCE_LINE = 60.0
+
+# Above this many weak lines, re-read their union in one call instead of line by line
+MAX_SCRIPT_REGIONS = 4
+
+
+def _group_lines(words):
+    lines = {}
+    for w in words:
+        lines.setdefault(w["line"], []).append(w)
+    return lines
+
+
+def _union_box(words, pad=0, limit=None):
+    x1 = min(w["box"][0] for w in words) - pad
+    y1 = min(w["box"][1] for w in words) - pad
+    x2 = max(w["box"][0] + w["box"][2] for w in words) + pad
+    y2 = max(w["box"][1] + w["box"][3] for w in words) + pad
+    x1, y1 = max(0, x1), max(0, y1)
+    if limit is not None:
+        x2, y2 = min(limit[0], x2), min(limit[1], y2)
+    return (x1, y1, x2 - x1, y2 - y1)
+
+
+def _mean_conf(words):
+    confs = [w["conf"] for w in words if w["conf"] >= 0]
+    return sum(confs) / len(confs) if confs else 0.0
+
+
+def _region_words(img, box, lang, base_line, deadline=None):
+    """OCR a crop with `lang`; returns word dicts in image coordinates"""
+    x, y, w, h = box
+    raw = ocr_region(img.crop((x, y, x + w, y + h)), lang, timeout=_tesseract_timeout(deadline))
+    raw.sort(key=lambda r: (r[2][1], r[2][0]))
+    words = []
+    sub_line = 0
+    last_mid = None
+    for text, conf, (wx, wy, ww, wh) in raw:
+        mid = wy + wh / 2.0
+        if last_mid is not None and abs(mid - last_mid) > wh / 2.0:
+            sub_line += 1
+        last_mid = mid
+        words.append({"text": text, "conf": conf, "box": (x + wx, y + wy, ww, wh),
+                      "line": base_line + (sub_line,)})
+    return words
+
+
+def refine_script_regions(img, words, deadline=None):
+    """Re-read low-confidence lines of an English pass with the right script model.
+
+    The union of weak lines is used as the sample for script detection; if
+    it is Latin (or no other model is installed) nothing else runs. Weak
+    lines are then re-OCR'd with the detected language set and replaced
+    when the re-read is more confident. With a `deadline`, detection and
+    each re-read only start while the budget still covers their estimated
+    cost (deadline.STAGE_COST_MS); the rest is reported as "script_ocr".
+    """
+    lines = _group_lines(words)
+    weak = [key for key, line_words in lines.items() if _mean_conf(line_words) < LOW_CONFIDENCE_LINE]
+    if not weak:
+        return words
+
+    # Optional passes: skip them when the budget cannot cover detection
+    if deadline is not None and not deadline.allows("script_osd"):
+        deadline.skip("script_ocr")
+        return words
+
+    weak_words = [w for key in weak for w in lines[key]]
+    sample_box = _union_box(weak_words, pad=4, limit=img.size)
+    sx, sy, sw, sh = sample_box
+    script = detect_script(img.crop((sx, sy, sx + sw, sy + sh)), timeout=_tesseract_timeout(deadline))
+    if script == "Latin":
+        return words
+    lang = languages_for_script(script)
+    if lang == PRIMARY_LANG:
+        return words
+
+    if len(weak) > MAX_SCRIPT_REGIONS:
+        regions = [(weak, sample_box)]
+    else:
+        regions = [([key], _union_box(lines[key], pad=4, limit=img.size)) for key in weak]
+
+    for keys, box in regions:
+        if deadline is not None and not deadline.allows("script_ocr"):
+            deadline.skip("script_ocr")
+            break
+        old = [w for key in keys for w in lines[key]]
+        new = _region_words(img, box, lang, keys[0], deadline)
+        if not new or _mean_conf(new) <= _mean_conf(old):
+            continue
+        # Splice the re-read words in where the old line(s) started
+        first = next(i for i, w in enumerate(words) if w is old[0])
+        drop = set(id(w) for w in old)
+        words = [w for w in words[:first] if id(w) not in drop] + new + \
+                [w for w in words[first:] if id(w) not in drop]
+    return words
+
+
+def _page_image(image_path, enhance, settings):
+    """(PIL image, factor from its coordinates back to the original image's)"""
+    if enhance:
+        img = enhance_for_ocr(image_path)
+    elif settings is not None:
+        img = prepare_page(image_path, settings)
+    else:
+        return Image.open(image_path), 1.0
+    if not enhance and settings["scale"] == 1.0:
+        return img, 1.0
+    with Image.open(image_path) as original:
+        return img, original.size[0] / float(img.size[0])
+
+
+def extract_ocr_data(image_path, deadline=None, enhance=False, config="", script_aware=True,
+                     zone=None, settings=None):
+    """OCR the whole image and keep word boxes and confidences.
+
+    The page is read with the English model; with `script_aware`, weak lines
+    are then re-read with the language set of their detected script (see
+    refine_script_regions). With a `zone` ("front" or "back") the page is
+    read with that zone's tuned settings (engine mode, page segmentation,
+    preprocessing, scale); `settings` gives them explicitly (autotune.py).
+    `enhance` replaces the tuned preprocessing.
+
+    Returns {"text": str, "words": [{"text", "conf", "box": (x, y, w, h),
+    "line": (block, paragraph, line, ...)}]}. Box coordinates refer to the
+    original image even when `enhance` or the setting rescaled it.
+    """
+    if settings is None and zone is not None:
+        settings = zone_settings(zone)
+    if settings is not None:
+        config = tesseract_args(settings, config)
+    img, scale = _page_image(image_path, enhance, settings)
+
+    timeout = _tesseract_timeout(deadline)
+    kwargs = {"lang": PRIMARY_LANG, "config": config, "output_type": pytesseract.Output.DICT}
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    data = pytesseract.image_to_data(img, **kwargs)
+
+    words = []
+    for i, text in enumerate(data["text"]):
+        text = (text or "").strip()
+        if not text:
+            continue
+        words.append({
+            "text": text,
+            "conf": float(data["conf"][i]),
+            "box": (data["left"][i], data["top"][i], data["width"][i], data["height"][i]),
+            "line": (data["block_num"][i], data["par_num"][i], data["line_num"][i]),
+        })
+
+    if script_aware and words:
+        try:
+            words = refine_script_regions(img, words, deadline)
+        except Exception:
+            # Keep the English pass if the script pass fails (e.g. timeout)
+            pass
+
+    if scale != 1.0:
+        for w in words:
+            w["box"] = tuple(int(v * scale) for v in w["box"])
+    return {"text": _words_to_text(words), "words": words}
+
+
+def extract_text_from_image(image_path, deadline=None, enhance=False, zone=None):
+    """OCR the whole image. With a `deadline`, Tesseract is killed when the budget runs out.
+
+    `enhance=True` runs enhance_for_ocr first (used for images the quality
+    gate routed to the enhancement path). With a `zone` the zone's tuned
+    settings are used, as in extract_ocr_data.
+    """
+    settings = zone_settings(zone) if zone is not None else None
+    img, _ = _page_image(image_path, enhance, settings)
+    kwargs = {"config": tesseract_args(settings)} if settings is not None else {}
+    timeout = _tesseract_timeout(deadline)
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    return pytesseract.image_to_string(img, **kwargs)
+
+
+def find_number_region(words, pad=6):
+    """Bounding box (x, y, w, h) of the line that looks like the Aadhaar number.
+
+    Picks the line with the most digits among lines holding at least two
+    digit groups, so only that strip needs re-OCR. Returns None if no line
+    qualifies.
+    """
+    lines = _group_lines(words)
+
+    best = None
+    best_digits = 0
+    for line_words in lines.values():
+        groups = [w for w in line_words if sum(c.isdigit() for c in w["text"]) >= 3]
+        digits = sum(sum(c.isdigit() for c in w["text"]) for w in groups)
+        if len(groups) >= 2 and digits > best_digits:
+            # Keep the whole line: a misread group may hold few digits
+            best, best_digits = line_words, digits
+    if not best:
+        return None
+
+    return _union_box(best, pad=pad)
+
+
+def field_region(words, field_words, pad=6):
+    """Bounding box (x, y, w, h) of the whole line(s) holding `field_words`, or None"""
+    keys = {w["line"] for w in field_words}
+    line_words = [w for w in words if w["line"] in keys]
+    if not line_words:
+        return None
+    return _union_box(line_words, pad=pad)
+
+
+DIGIT_WHITELIST = "-c tessedit_char_whitelist=0123456789"
+
+# Variants tried after the zone's own preprocessing, in this order
+DIGIT_FALLBACK_PREPROCESS = ("gray", "otsu")
+
+
+def _digit_variant(crop, preprocess):
+    if preprocess == "otsu":
+        return cv2.threshold(crop, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    if preprocess == "adaptive":
+        return cv2.adaptiveThreshold(crop, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 10)
+    return crop
+
+
+def ocr_digits_in_region(image_path, box, deadline=None, settings=None):
+    """Digit-only OCR of one small region, trying a couple of binarizations.
+
+    The crop is scaled and read as the "number" zone's settings say (or
+    `settings`), its own preprocessing first, then the fallback variants.
+    Yields the text read for each variant, so the caller can stop as soon
+    as one is good enough.
+    """
+    settings = settings or zone_settings("number")
+    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return
+    x, y, w, h = box
+    crop = img[y:y + h, x:x + w]
+    if crop.size == 0:
+        return
+    crop = _rescale(crop, settings["scale"])
+
+    config = tesseract_args(settings, DIGIT_WHITELIST)
+    order = [settings["preprocess"]] + [p for p in DIGIT_FALLBACK_PREPROCESS if p != settings["preprocess"]]
+    for preprocess in order:
+        timeout = _tesseract_timeout(deadline)
+        kwargs = {"config": config}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        yield pytesseract.image_to_string(Image.fromarray(_digit_variant(crop, preprocess)), **kwargs)
+
+
+def _field_variants(crop):
+    """Alternative preprocessings of an upscaled field crop, cheapest first"""
+    return (
+        lambda: crop,
+        lambda: _sharpen(crop, tile_grid=(4, 4)),
+        lambda: cv2.threshold(crop, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1],
+        lambda: cv2.adaptiveThreshold(crop, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 10),
+    )
+
+
+def ocr_field_variants(image_path, boxes, deadline=None, montage=None):
+    """Re-OCR several field regions with alternative preprocessing.
+
+    `boxes` maps a key (e.g. the field name) to its (x, y, w, h) region.
+    Tries an upscaled crop, a CLAHE-sharpened crop, Otsu and adaptive
+    binarization in that order; for each variant all crops are packed into
+    one montage and read with a single Tesseract call (modules.montage).
+    Yields {key: (text, mean word confidence)} per variant. Keys the caller
+    removes from `boxes` between variants are not read again. With a
+    `montage` (a montage.MontageBatcher), the crops share montages with
+    other cards read at the same time.
+    """
+    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return
+    crops = {}
+    for key, (x, y, w, h) in boxes.items():
+        crop = img[y:y + h, x:x + w]
+        if crop.size:
+            crops[key] = _field_variants(cv2.resize(crop, (w * 2, h * 2), interpolation=cv2.INTER_CUBIC))
+    if not crops:
+        return
+
+    for i in range(len(next(iter(crops.values())))):
+        pending = [(key, Image.fromarray(variants[i]())) for key, variants in crops.items() if key in boxes]
+        if not pending:
+            return
+        read_crops = montage.ocr_crops if montage is not None else ocr_crops
+        read = read_crops(pending, lang=PRIMARY_LANG, timeout=_tesseract_timeout(deadline))
+        yield {key: (entry["text"], entry["conf"]) for key, entry in read.items()}
@@ -88,13 +88,17 @@ def count_non_empty(d):
     return len([v for v in d.values() if v and v != "None"])
 
 
-def translate_field(text):
+def translate_field(text, deadline=None):
     """
     Translate a single field to English
     Uses the translation module if available
+    Skipped (original text returned) when the request deadline is running out
     """
     if not text:
         return None
+    if deadline is not None and not deadline.allows("translation"):
+        deadline.skip("translation")
+        return text
     
     try:
         from deep_translator import GoogleTranslator
@@ -114,13 +118,26 @@ def format_error_response(error_message):
     }
 
 
-def format_detailed_response(final_data, translations, ocr_details_front, ocr_details_back, qr_data):
+def format_detailed_response(final_data, translations, ocr_details_front, ocr_details_back, qr_data, deadline=None,
+                             plan=None, confidence=None):
     """
     Format JSON response with 2 sections:
     1. FRONT IMAGE - Name, DOB, Gender, Aadhaar
     2. BACK IMAGE - Aadhaar, Address, Pincode, State
     3. DATA_SOURCE - Where each field was extracted from
+    With a request `plan` (see modules.planner), sections for stages that
+    did not run are left out and translations are only done when requested.
+    `confidence` is assemble_final's per-field confidence block; without it
+    the summary falls back to the old name-based guess.
     """
+    stages = plan["stages"] if plan else None
+    want_front = stages is None or "ocr_front" in stages
+    want_back = stages is None or "ocr_back" in stages
+    want_qr = stages is None or "qr" in stages
+    want_translation = stages is None or "translate" in stages
+
+    def translate(text):
+        return translate_field(text, deadline) if want_translation else None
     
     # Map fields to their source
     data_source_map = {
@@ -148,78 +165,85 @@ def format_detailed_response(final_data, translations, ocr_details_front, ocr_de
     formatted = {
         "status": "success",
         "message": "Aadhaar data extracted successfully",
-        
-        # ===== SECTION 1: FRONT IMAGE =====
-        "front_image": {
+    }
+    data_source = {}
+    
+    # ===== SECTION 1: FRONT IMAGE =====
+    if want_front:
+        formatted["front_image"] = {
             "section": "Front Side",
             "data": clean_dict({
                 "name": ocr_details_front.get('name'),
-                "name_english": translate_field(ocr_details_front.get('name')),
+                "name_english": translate(ocr_details_front.get('name')),
                 "gender": ocr_details_front.get('gender'),
                 "date_of_birth": ocr_details_front.get('dob'),
                 "year_of_birth": ocr_details_front.get('yob'),
                 "aadhaar_number": ocr_details_front.get('aadhaar'),
                 "aadhaar_number_masked": mask_aadhaar(ocr_details_front.get('aadhaar')),
             })
-        },
-        
-        # ===== SECTION 2: BACK IMAGE =====
-        "back_image": {
+        }
+        data_source["front_image"] = {
+            "name": data_source_map.get("name") if ocr_details_front.get('name') else None,
+            "gender": data_source_map.get("gender") if ocr_details_front.get('gender') else None,
+            "date_of_birth": data_source_map.get("date_of_birth") if ocr_details_front.get('dob') else None,
+            "year_of_birth": data_source_map.get("year_of_birth") if ocr_details_front.get('yob') else None,
+            "aadhaar_number": data_source_map.get("aadhaar_front") if ocr_details_front.get('aadhaar') else None,
+        }
+    
+    # ===== SECTION 2: BACK IMAGE =====
+    if want_back:
+        formatted["back_image"] = {
             "section": "Back Side",
             "data": clean_dict({
                 "guardian_name": ocr_details_back.get('guardian_name'),
-                "guardian_name_english": translate_field(ocr_details_back.get('guardian_name')),
+                "guardian_name_english": translate(ocr_details_back.get('guardian_name')),
                 "aadhaar_number": ocr_details_back.get('aadhaar'),
                 "aadhaar_number_masked": mask_aadhaar(ocr_details_back.get('aadhaar')),
                 "full_address": ocr_details_back.get('address'),
-                "full_address_english": translate_field(ocr_details_back.get('address')),
+                "full_address_english": translate(ocr_details_back.get('address')),
                 "locality": ocr_details_back.get('locality'),
-                "locality_english": translate_field(ocr_details_back.get('locality')),
+                "locality_english": translate(ocr_details_back.get('locality')),
                 "city": ocr_details_back.get('city'),
-                "city_english": translate_field(ocr_details_back.get('city')),
+                "city_english": translate(ocr_details_back.get('city')),
                 "state": ocr_details_back.get('state'),
-                "state_english": translate_field(ocr_details_back.get('state')),
+                "state_english": translate(ocr_details_back.get('state')),
                 "pincode": ocr_details_back.get('pincode'),
             })
-        },
-        
-        # ===== SECTION 3: QR CODE DATA (Optional) =====
-        "qr_code": clean_dict({
+        }
+        data_source["back_image"] = {
+            "guardian_name": data_source_map.get("guardian_name") if ocr_details_back.get('guardian_name') else None,
+            "aadhaar_number": data_source_map.get("aadhaar_back") if ocr_details_back.get('aadhaar') else None,
+            "full_address": data_source_map.get("full_address") if ocr_details_back.get('address') else None,
+            "locality": data_source_map.get("locality") if ocr_details_back.get('locality') else None,
+            "city": data_source_map.get("city") if ocr_details_back.get('city') else None,
+            "state": data_source_map.get("state") if ocr_details_back.get('state') else None,
+            "pincode": data_source_map.get("pincode") if ocr_details_back.get('pincode') else None,
+        }
+    
+    # ===== SECTION 3: QR CODE DATA (Optional) =====
+    if want_qr:
+        formatted["qr_code"] = clean_dict({
             "uid": qr_data.get('uid') if qr_data else None,
             "vid": qr_data.get('vid') if qr_data else None,
-        }) if qr_data else None,
-        
-        # ===== SECTION 4: DATA SOURCE TRACKING =====
-        "data_source": {
-            "front_image": {
-                "name": data_source_map.get("name") if ocr_details_front.get('name') else None,
-                "gender": data_source_map.get("gender") if ocr_details_front.get('gender') else None,
-                "date_of_birth": data_source_map.get("date_of_birth") if ocr_details_front.get('dob') else None,
-                "year_of_birth": data_source_map.get("year_of_birth") if ocr_details_front.get('yob') else None,
-                "aadhaar_number": data_source_map.get("aadhaar_front") if ocr_details_front.get('aadhaar') else None,
-            },
-            "back_image": {
-                "guardian_name": data_source_map.get("guardian_name") if ocr_details_back.get('guardian_name') else None,
-                "aadhaar_number": data_source_map.get("aadhaar_back") if ocr_details_back.get('aadhaar') else None,
-                "full_address": data_source_map.get("full_address") if ocr_details_back.get('address') else None,
-                "locality": data_source_map.get("locality") if ocr_details_back.get('locality') else None,
-                "city": data_source_map.get("city") if ocr_details_back.get('city') else None,
-                "state": data_source_map.get("state") if ocr_details_back.get('state') else None,
-                "pincode": data_source_map.get("pincode") if ocr_details_back.get('pincode') else None,
-            },
-            "qr_code": {
-                "uid": data_source_map.get("uid") if qr_data and qr_data.get('uid') else None,
-                "vid": data_source_map.get("vid") if qr_data and qr_data.get('vid') else None,
-            } if qr_data else None
-        },
-        
-        "summary": {
-            "total_fields_extracted": count_non_empty(ocr_details_front) + count_non_empty(ocr_details_back),
-            "front_fields": count_non_empty(ocr_details_front),
-            "back_fields": count_non_empty(ocr_details_back),
-            "confidence": "High" if ocr_details_front.get('name') else "Medium"
-        }
+        }) if qr_data else None
+        data_source["qr_code"] = {
+            "uid": data_source_map.get("uid") if qr_data and qr_data.get('uid') else None,
+            "vid": data_source_map.get("vid") if qr_data and qr_data.get('vid') else None,
+        } if qr_data else None
+    
+    # ===== SECTION 4: DATA SOURCE TRACKING =====
+    formatted["data_source"] = data_source
+    
+    formatted["summary"] = {
+        "total_fields_extracted": count_non_empty(ocr_details_front) + count_non_empty(ocr_details_back),
+        "front_fields": count_non_empty(ocr_details_front),
+        "back_fields": count_non_empty(ocr_details_back),
+        "confidence": confidence["overall"] if confidence else ("High" if ocr_details_front.get('name') else "Medium")
     }
+    if confidence:
+        formatted["summary"]["field_confidence"] = {
+            field: record["confidence"] for field, record in confidence["fields"].items()
+        }
     
     return formatted
 
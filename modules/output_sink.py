@@ -0,0 +1,300 @@
+"""
+Asynchronous output sink.
+Results are queued in a bounded in-memory buffer and written by a background
+thread as gzip-compressed JSONL segments that rotate by size and age. Each
+batch is one gzip member, and a per-process SQLite index maps every request
+id to where it landed, so single results are read back with one indexed
+lookup. With a segment limit, the oldest segments of a sink are deleted
+together with their index rows.
+"""
+import atexit
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from .serialization import dumps_bytes
+
+
+DEFAULT_MAX_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_SEGMENT_AGE_S = 3600
+DEFAULT_BUFFER_SIZE = 1000
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_FLUSH_INTERVAL_S = 1.0
+
+# How long submit() waits for room in a full buffer before dropping the record
+DEFAULT_SUBMIT_WAIT_S = float(os.environ.get("OCR_OUTPUT_SINK_WAIT_S", "0.5"))
+
+# How often flush() checks that the writer thread is still running
+FLUSH_POLL_S = 0.5
+
+# Segments a sink keeps; older ones are deleted with their index rows (0 keeps all)
+DEFAULT_MAX_SEGMENTS = int(os.environ.get("OCR_OUTPUT_SINK_MAX_SEGMENTS", "0"))
+
+_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    request_id TEXT NOT NULL,
+    ts TEXT,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    line INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_request_id ON records (request_id);
+CREATE INDEX IF NOT EXISTS records_segment ON records (segment);
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class JsonlOutputSink:
+    """Background writer of rotated, compressed JSONL result segments.
+
+    submit() waits up to `submit_wait_s` for room in a full buffer, then
+    drops the record; every drop is logged and counted per source (the
+    request path that submitted it). flush() waits until everything
+    submitted so far is on disk, close() flushes and stops the writer thread.
+    With `max_segments`, only that many of the sink's newest segments are kept.
+    """
+
+    def __init__(self, directory, max_segment_bytes=DEFAULT_MAX_SEGMENT_BYTES,
+                 max_segment_age_s=DEFAULT_MAX_SEGMENT_AGE_S, buffer_size=DEFAULT_BUFFER_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE, flush_interval_s=DEFAULT_FLUSH_INTERVAL_S,
+                 submit_wait_s=DEFAULT_SUBMIT_WAIT_S, max_segments=DEFAULT_MAX_SEGMENTS):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age_s = max_segment_age_s
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.submit_wait_s = submit_wait_s
+        self.max_segments = max_segments
+        self._queue = queue.Queue(maxsize=buffer_size)
+        self._segment = None
+        self._segment_file = None
+        self._segment_opened = 0.0
+        # Opened by the writer thread, which is the only one using it
+        self._index = None
+        self._kept_segments = []
+        self._closed = False
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.dropped_by_source = {}
+        self.segments = 0
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="output-sink", daemon=True)
+        self._thread.start()
+
+    # ---- request path ----
+
+    def submit(self, record, request_id=None, source=None):
+        """Queue a result for writing. Returns False if it had to be dropped.
+
+        `source` (e.g. the request path) is what drops are counted under.
+        """
+        if self._closed:
+            self._dropped(1, source, "sink closed", request_id)
+            return False
+        item = {"request_id": request_id, "ts": datetime.now().isoformat(), "result": record}
+        try:
+            self._queue.put(item, timeout=self.submit_wait_s)
+            return True
+        except queue.Full:
+            self._dropped(1, source, "buffer full", request_id)
+            return False
+
+    def _dropped(self, count, source, reason, request_id=None):
+        with self._lock:
+            self.dropped += count
+            key = source or "unknown"
+            self.dropped_by_source[key] = self.dropped_by_source.get(key, 0) + count
+        logger.warning("Output sink dropped %d result(s) from %s (%s)%s", count, source or "unknown", reason,
+                       f": request {request_id}" if request_id else "")
+
+    def flush(self, timeout=None):
+        """Block until everything submitted before this call is written.
+
+        Returns False on timeout, or at once when the writer thread has stopped.
+        """
+        if self._closed or not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait_s = FLUSH_POLL_S if end is None else min(FLUSH_POLL_S, end - time.monotonic())
+            if done.wait(max(wait_s, 0.0)):
+                return True
+            # A writer that died never sets the event
+            if not self._thread.is_alive() or (end is not None and time.monotonic() >= end):
+                return False
+
+    def close(self, timeout=10.0):
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            dropped_by_source = dict(self.dropped_by_source)
+        return {
+            "buffered": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "dropped_by_source": dropped_by_source,
+            "segments": self.segments,
+            "current_segment": os.path.basename(self._segment) if self._segment else None,
+        }
+
+    # ---- writer thread ----
+
+    def _run(self):
+        while True:
+            batch = []
+            waiters = []
+            stop = False
+            deadline = time.monotonic() + self.flush_interval_s
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0 and (batch or waiters):
+                    break
+                try:
+                    item = self._queue.get(timeout=max(timeout, 0.05))
+                except queue.Empty:
+                    if batch or waiters:
+                        break
+                    deadline = time.monotonic() + self.flush_interval_s
+                    continue
+                if item is None:
+                    stop = True
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    self._dropped(len(batch), "writer", f"write failed: {e}")
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                self._close_files()
+                return
+
+    def _open_segment(self):
+        self._close_segment()
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self._segment = os.path.join(self.directory, f"results_{stamp}_{os.getpid()}_{self.segments:04d}.jsonl.gz")
+        self._segment_file = open(self._segment, "ab")
+        self._segment_opened = time.monotonic()
+        if self._index is None:
+            self._index = sqlite3.connect(os.path.join(self.directory, f"index_{os.getpid()}.sqlite3"))
+            self._index.execute("PRAGMA journal_mode=WAL")
+            self._index.executescript(_INDEX_SCHEMA)
+        self.segments += 1
+        self._kept_segments.append(os.path.basename(self._segment))
+        if self.max_segments > 0:
+            self._prune(self._kept_segments[:-self.max_segments])
+
+    def _prune(self, segments):
+        """Delete old segments and their index rows"""
+        for segment in segments:
+            with self._index:
+                self._index.execute("DELETE FROM records WHERE segment = ?", (segment,))
+            try:
+                os.remove(os.path.join(self.directory, segment))
+            except OSError:
+                pass
+            self._kept_segments.remove(segment)
+
+    def _close_segment(self):
+        if self._segment_file is not None:
+            self._segment_file.close()
+        self._segment_file = None
+
+    def _close_files(self):
+        self._close_segment()
+        if self._index is not None:
+            self._index.close()
+        self._index = None
+
+    def _write_batch(self, batch):
+        if (self._segment_file is None
+                or self._segment_file.tell() >= self.max_segment_bytes
+                or time.monotonic() - self._segment_opened >= self.max_segment_age_s):
+            self._open_segment()
+
+        lines = [dumps_bytes(item) for item in batch]
+        offset = self._segment_file.tell()
+        self._segment_file.write(gzip.compress(b"\n".join(lines) + b"\n"))
+        self._segment_file.flush()
+
+        segment = os.path.basename(self._segment)
+        with self._index:
+            self._index.executemany(
+                "INSERT INTO records (request_id, ts, segment, offset, line) VALUES (?, ?, ?, ?, ?)",
+                [(item["request_id"], item["ts"], segment, offset, line_no)
+                 for line_no, item in enumerate(batch) if item["request_id"]])
+        self.written += len(batch)
+
+
+def read_record(directory, request_id):
+    """Look a result up by request id through the indexes. Returns the stored record or None"""
+    for index_path in glob.glob(os.path.join(directory, "index_*.sqlite3")):
+        conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+        try:
+            row = conn.execute("SELECT segment, offset, line FROM records WHERE request_id = ? "
+                               "ORDER BY rowid DESC LIMIT 1", (request_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            continue
+        segment, offset, line = row
+        try:
+            with open(os.path.join(directory, segment), "rb") as seg:
+                seg.seek(offset)
+                # Decompress just the one gzip member holding this batch
+                decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                data = b""
+                while not decomp.eof:
+                    chunk = seg.read(64 * 1024)
+                    if not chunk:
+                        break
+                    data += decomp.decompress(chunk)
+        except FileNotFoundError:
+            # Pruned after the lookup
+            continue
+        return json.loads(data.decode("utf-8").splitlines()[line])
+    return None
+
+
+_default_sink = None
+_default_lock = threading.Lock()
+
+
+def get_output_sink(directory):
+    """Process-wide sink, created on first use (after any fork) and flushed at exit"""
+    global _default_sink
+    with _default_lock:
+        if _default_sink is None or _default_sink._closed:
+            _default_sink = JsonlOutputSink(directory)
+            atexit.register(_default_sink.close)
+    return _default_sink
@@ -0,0 +1,112 @@
+"""
+e-Aadhaar PDF ingestion.
+Reads the selectable text layer and the embedded images (QR code, photo)
+straight from the PDF, so downloaded e-Aadhaar files skip OCR entirely.
+Pages are only rasterized when the PDF has no usable text layer.
+"""
+import os
+
+try:
+    import fitz  # PyMuPDF
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+
+
+# Fewer alphanumeric characters than this means a scanned (image-only) PDF
+MIN_TEXT_LAYER_CHARS = 40
+
+
+def is_pdf(path):
+    """Check the file signature rather than trusting the extension"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(5) == b'%PDF-'
+    except OSError:
+        return False
+
+
+def has_text_layer(text):
+    return bool(text) and sum(c.isalnum() for c in text) >= MIN_TEXT_LAYER_CHARS
+
+
+def _open(pdf_path, password=None):
+    if not PDF_AVAILABLE:
+        raise RuntimeError("PDF support requires PyMuPDF (pip install pymupdf)")
+    doc = fitz.open(pdf_path)
+    if doc.needs_pass:
+        if not password:
+            doc.close()
+            raise ValueError("PDF is password protected; supply a password")
+        if not doc.authenticate(password):
+            doc.close()
+            raise ValueError("Incorrect PDF password")
+    return doc
+
+
+def read_pdf(pdf_path, out_dir, password=None):
+    """Extract the text layer and embedded images of a PDF.
+
+    Embedded images are written to `out_dir`. Returns
+    {"text": str, "pages": int, "images": [{"path", "width", "height"}]}.
+    Raises ValueError for a missing/wrong password.
+    """
+    doc = _open(pdf_path, password)
+    os.makedirs(out_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+
+    texts = []
+    images = []
+    seen = set()
+    try:
+        for page_no, page in enumerate(doc):
+            texts.append(page.get_text("text"))
+            for img in page.get_images(full=True):
+                xref = img[0]
+                if xref in seen:
+                    continue
+                seen.add(xref)
+                extracted = doc.extract_image(xref)
+                if not extracted or not extracted.get("image"):
+                    continue
+                path = os.path.join(out_dir, f"{stem}_p{page_no}_x{xref}.{extracted.get('ext', 'png')}")
+                with open(path, 'wb') as f:
+                    f.write(extracted["image"])
+                images.append({"path": path, "width": extracted.get("width", 0), "height": extracted.get("height", 0)})
+        pages = doc.page_count
+    finally:
+        doc.close()
+
+    return {"text": "\n".join(texts), "pages": pages, "images": images}
+
+
+def rasterize_pdf(pdf_path, out_dir, password=None, dpi=300):
+    """Render each page to PNG (OCR fallback for image-only PDFs). Returns the paths"""
+    doc = _open(pdf_path, password)
+    os.makedirs(out_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    paths = []
+    try:
+        for page_no, page in enumerate(doc):
+            path = os.path.join(out_dir, f"{stem}_page{page_no}.png")
+            page.get_pixmap(dpi=dpi).save(path)
+            paths.append(path)
+    finally:
+        doc.close()
+    return paths
+
+
+def pick_qr_image(images):
+    """Largest roughly square embedded image - the Secure QR code"""
+    square = [i for i in images if i["height"] and 0.9 <= i["width"] / float(i["height"]) <= 1.1]
+    if not square:
+        return None
+    return max(square, key=lambda i: i["width"] * i["height"])["path"]
+
+
+def pick_photo_image(images):
+    """Largest portrait-shaped embedded image - the holder's photo"""
+    portrait = [i for i in images if i["height"] and 0.6 <= i["width"] / float(i["height"]) < 0.9]
+    if not portrait:
+        return None
+    return max(portrait, key=lambda i: i["width"] * i["height"])["path"]
@@ -0,0 +1,135 @@
+"""
+Field-selective pipeline planner.
+Maps the fields a caller asked for onto the smallest set of pipeline stages
+and response sections, so unneeded stages never run and unneeded sections
+are never built.
+"""
+
+# Stages that can produce each requestable field
+FIELD_STAGES = {
+    # The QR uid is preferred when the code is read
+    "aadhaar": {"qr", "ocr_front"},
+    "name": {"ocr_front"},
+    "gender": {"ocr_front"},
+    "dob": {"ocr_front"},
+    "yob": {"ocr_front"},
+    "guardian_name": {"ocr_back"},
+    "address": {"ocr_back"},
+    "locality": {"ocr_back"},
+    "city": {"ocr_back"},
+    "state": {"ocr_back"},
+    "pincode": {"ocr_back"},
+    "qr": {"qr"},
+    "photo": {"face"},
+    # Translations are of the OCR'd text
+    "translations": {"translate", "ocr_front", "ocr_back"},
+    "raw": set(),
+}
+
+# Response sections each field needs
+FIELD_SECTIONS = {
+    "aadhaar": {"personal_info"},
+    "name": {"personal_info"},
+    "gender": {"personal_info"},
+    "dob": {"personal_info"},
+    "yob": {"personal_info"},
+    "guardian_name": {"address"},
+    "address": {"address"},
+    "locality": {"address"},
+    "city": {"address"},
+    "state": {"address"},
+    "pincode": {"address"},
+    "qr": {"qr_and_xml", "personal_info", "address"},
+    "photo": {"photo"},
+    "translations": {"translations"},
+    "raw": {"detailed_breakdown", "raw_sources"},
+}
+
+ALL_STAGES = frozenset({"qr", "ocr_front", "ocr_back", "face", "translate"})
+ALL_SECTIONS = frozenset({"personal_info", "address", "qr_and_xml", "photo",
+                          "detailed_breakdown", "translations", "raw_sources"})
+
+# Response profiles: which sections each one may contain
+PROFILE_SECTIONS = {
+    "minimal": frozenset({"personal_info", "address", "qr_and_xml"}),
+    "standard": frozenset({"personal_info", "address", "qr_and_xml", "photo", "translations"}),
+    "debug": ALL_SECTIONS,
+}
+DEFAULT_PROFILE = "debug"
+
+# Stages whose output only lands in one optional section
+STAGE_SECTIONS = {
+    "face": "photo",
+    "translate": "translations",
+}
+
+# Stages that run on each side of the card
+FRONT_STAGES = frozenset({"ocr_front", "face"})
+BACK_STAGES = frozenset({"qr", "ocr_back"})
+
+
+def parse_fields(value):
+    """Parse a comma-separated `fields` option. Returns a set or None (all fields)
+
+    Raises ValueError for unknown field names.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    fields = {f.strip().lower() for f in value if f and f.strip()}
+    if not fields:
+        return None
+    unknown = fields - set(FIELD_STAGES)
+    if unknown:
+        raise ValueError("Unknown fields: " + ", ".join(sorted(unknown)))
+    return fields
+
+
+def parse_profile(value):
+    """Validate a `profile` option. Returns the profile name, raises ValueError"""
+    if value is None or not str(value).strip():
+        return None
+    profile = str(value).strip().lower()
+    if profile not in PROFILE_SECTIONS:
+        raise ValueError("Unknown profile: %s (use %s)" % (profile, ", ".join(PROFILE_SECTIONS)))
+    return profile
+
+
+def plan_pipeline(fields=None, profile=None):
+    """Build the execution plan for a set of requested fields and a response profile.
+
+    Returns a dict with the requested "fields" (None = everything), the
+    "profile", the "stages" to run and the response "sections" to build.
+    Stages that only feed sections the profile leaves out are not run.
+    """
+    profile = profile or DEFAULT_PROFILE
+    if not fields:
+        stages = set(ALL_STAGES)
+        sections = set(ALL_SECTIONS)
+    else:
+        stages = set()
+        sections = set()
+        for field in fields:
+            stages |= FIELD_STAGES[field]
+            sections |= FIELD_SECTIONS[field]
+
+    sections &= PROFILE_SECTIONS[profile]
+    for stage, section in STAGE_SECTIONS.items():
+        if section not in sections:
+            stages.discard(stage)
+
+    return {
+        "fields": frozenset(fields) if fields else None,
+        "profile": profile,
+        "stages": frozenset(stages),
+        "sections": frozenset(sections),
+    }
+
+
+def needs_front(plan):
+    return bool(plan["stages"] & FRONT_STAGES)
+
+
+def needs_back(plan):
+    return bool(plan["stages"] & BACK_STAGES)
@@ -0,0 +1,235 @@
+"""
+Warm process pool for the CPU-bound pipeline stages.
+asgi.py keeps uploads, translations and output writes on its event loop and
+sends the quality gate, QR, OCR, face and side classification work here.
+Each pool worker is started with forkserver (spawn where that is missing,
+never fork: the serving process runs threads), runs the same warm-up as a
+gunicorn worker (modules.startup.warm_up) and then takes pipeline calls;
+results come back pickled. Stage generators run with stream(), which hands
+each stage's update back as soon as the worker finishes it. A worker that
+dies (e.g. a crash in native code) breaks the pool; it is replaced on the
+next call.
+"""
+import asyncio
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+# Worker processes, i.e. pipelines running at once per container
+DEFAULT_POOL_WORKERS = int(os.environ.get("OCR_PROCESS_POOL_WORKERS", str(os.cpu_count() or 1)))
+
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# Imported once in the fork server, so each worker starts with them loaded
+FORKSERVER_PRELOAD = ["main"]
+
+# How often a stream checks that its worker is still alive while waiting for an update
+EVENT_POLL_S = 0.5
+
+
+def _init_worker():
+    from .startup import warm_up
+
+    try:
+        warm_up()
+    except Exception as e:
+        # A cold worker is slower on its first call, not broken
+        print(f"Pool worker warm-up failed: {e}", file=sys.stderr)
+
+
+def _worker_pid():
+    return os.getpid()
+
+
+def _run_stages(stage_fn, args, kwargs, events):
+    """Run a stage generator in a worker, putting (stage, stage_update) on `events` after each stage"""
+    from main import stage_update
+
+    result = None
+    try:
+        for stage, result in stage_fn(*args, **kwargs):
+            events.put((stage, stage_update(stage, result)))
+    finally:
+        events.put(None)
+    return result
+
+
+def _next_event(events, future):
+    """Next stage update, or None when the worker is done (or died without saying so)"""
+    while True:
+        try:
+            return events.get(timeout=EVENT_POLL_S)
+        except queue.Empty:
+            if future.done():
+                return None
+
+
+class ProcessPool:
+    """Pipeline calls in warm worker processes, awaitable from an event loop.
+
+    run() awaits one call; stream() runs a stage generator
+    (iter_process_images / iter_process_pdf) and yields its updates. A
+    caller that is cancelled still waits for its worker to finish, so the
+    slot it holds is not handed out while the worker is busy.
+    """
+
+    def __init__(self, workers=DEFAULT_POOL_WORKERS):
+        self.workers = max(1, workers)
+        self._context = multiprocessing.get_context(START_METHOD)
+        if START_METHOD == "forkserver":
+            self._context.set_forkserver_preload(FORKSERVER_PRELOAD)
+        self._executor = None
+        self._manager = None
+        self._lock = threading.Lock()
+        # Threads blocked on stream event queues, about one per running stream
+        self._waiters = ThreadPoolExecutor(max_workers=self.workers * 2, thread_name_prefix="pool-events")
+        self.ready = False
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.restarts = 0
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=self._context,
+                                                     initializer=_init_worker)
+            return self._executor
+
+    def _replace(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+                self.restarts += 1
+
+    def _done(self, executor, future):
+        with self._lock:
+            self.in_flight -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._replace(executor)
+
+    def submit(self, fn, *args, **kwargs):
+        """Start `fn(*args, **kwargs)` in a worker; returns a concurrent.futures.Future"""
+        executor = self._pool()
+        try:
+            future = executor.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            self._replace(executor)
+            executor = self._pool()
+            future = executor.submit(fn, *args, **kwargs)
+        with self._lock:
+            self.in_flight += 1
+        future.add_done_callback(lambda f: self._done(executor, f))
+        return future
+
+    def start(self):
+        """Start and warm up every worker (blocks until they answer). Returns their pids"""
+        # Workers are spawned on demand; while the first ones are warming up,
+        # each further call starts a new one
+        futures = [self.submit(_worker_pid) for _ in range(self.workers)]
+        pids = sorted(set(f.result() for f in futures))
+        self.ready = True
+        return pids
+
+    async def wait(self, future):
+        waiter = asyncio.wrap_future(future)
+        try:
+            return await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            # The worker cannot be interrupted: keep the caller (and its slot) until it is done
+            await asyncio.wait([waiter])
+            raise
+
+    async def run(self, fn, *args, **kwargs):
+        return await self.wait(self.submit(fn, *args, **kwargs))
+
+    def _events_queue(self):
+        with self._lock:
+            if self._manager is None:
+                self._manager = self._context.Manager()
+            return self._manager.Queue()
+
+    def stream(self, stage_fn, *args, **kwargs):
+        """Run a stage generator in a worker. Returns a StageStream"""
+        events = self._events_queue()
+        return StageStream(self, self.submit(_run_stages, stage_fn, args, kwargs, events), events)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "start_method": START_METHOD,
+                "ready": self.ready,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "failed": self.failed,
+                "restarts": self.restarts,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            manager, self._manager = self._manager, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        if manager is not None:
+            manager.shutdown()
+        self._waiters.shutdown(wait=False)
+
+
+class StageStream:
+    """Async iterator over the (stage, stage_update) pairs of a generator running in a pool worker.
+
+    Once iteration ends, `result` holds the PipelineResult; an exception the
+    generator raised is raised from the iteration instead. aclose() waits for
+    the worker when the consumer stops early.
+    """
+
+    def __init__(self, pool, future, events):
+        self.pool = pool
+        self.future = future
+        self.events = events
+        self.result = None
+        self._finished = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._finished:
+            raise StopAsyncIteration
+        loop = asyncio.get_running_loop()
+        item = await loop.run_in_executor(self.pool._waiters, _next_event, self.events, self.future)
+        if item is None:
+            self._finished = True
+            self.result = await self.pool.wait(self.future)
+            raise StopAsyncIteration
+        return item
+
+    async def aclose(self):
+        self._finished = True
+        if not self.future.done():
+            await asyncio.wait([asyncio.wrap_future(self.future)])
+
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+def get_process_pool():
+    """Process-wide pool, created on first use (workers start on the first call or start())"""
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = ProcessPool()
+    return _default_pool
@@ -0,0 +1,224 @@
+"""
+On-demand request profiling.
+A request is profiled when it carries a valid X-Profile-Token header (see
+OCR_PROFILE_TOKEN) or is picked by the OCR_PROFILE_SAMPLE_RATE sampling
+rate. Both modes write folded stacks ("a;b;c count" lines, the input
+format of flamegraph.pl / speedscope / inferno): sample counts for the
+sampling profiler, microseconds rebuilt from the cProfile call graph for
+the deterministic mode, which also writes its cProfile stats. Both also
+write a per-stage summary. When
+profiling is off, the only cost per request is requested_mode().
+"""
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+
+PROFILE_TOKEN = os.environ.get("OCR_PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.environ.get("OCR_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.environ.get("OCR_PROFILE_DIR", os.path.join("outputs", "profiles"))
+
+# Sampling interval of the sampling profiler
+SAMPLE_INTERVAL_S = 0.005
+
+MODES = ("sample", "deterministic")
+
+# Pipeline functions whose time makes up the per-stage summary
+STAGE_FUNCTIONS = {
+    "assess_image_quality": "quality",
+    "extract_qr_data": "qr",
+    "extract_ocr_data": "ocr",
+    "recover_aadhaar_number": "digit_reocr",
+    "refine_weak_fields": "field_reocr",
+    "parse_ocr_text": "parse",
+    "extract_largest_face_base64": "face",
+    "build_translations": "translate",
+    "assemble_final": "assemble",
+    "format_detailed_response": "format",
+}
+
+
+def requested_mode(headers):
+    """Profiler mode for a request, or None when it is not profiled"""
+    if PROFILE_TOKEN:
+        token = headers.get("X-Profile-Token")
+        if token and hmac.compare_digest(token, PROFILE_TOKEN):
+            mode = headers.get("X-Profile", "sample").lower()
+            return mode if mode in MODES else "sample"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "sample"
+    return None
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+# Stack paths of the deterministic profile below this weight are dropped
+MIN_STACK_US = 1.0
+
+
+def _stats_label(func):
+    """_frame_label of a pstats (filename, line, name) key"""
+    filename, line, name = func
+    if filename == "~":
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def folded_stacks(stats):
+    """Folded stacks {"a;b;c": microseconds} from pstats data.
+
+    cProfile keeps only caller -> callee edges, so each path's time is the
+    callee's time split across its callers in proportion to the time spent
+    under each of them; recursion is cut at the first repeat.
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, (_, _, _, edge_ct) in callers.items():
+            callees.setdefault(caller, []).append((func, edge_ct))
+    stacks = {}
+
+    def walk(func, path, share_s):
+        _, _, tt, ct, _ = stats[func]
+        scale = share_s / ct if ct > 0 else 0.0
+        path = path + [_stats_label(func)]
+        own_us = tt * scale * 1e6
+        if own_us >= MIN_STACK_US:
+            key = ";".join(path)
+            stacks[key] = stacks.get(key, 0.0) + own_us
+        for child, edge_ct in callees.get(func, ()):
+            child_share = edge_ct * scale
+            if child in stats and child_share * 1e6 >= MIN_STACK_US and _stats_label(child) not in path:
+                walk(child, path, child_share)
+
+    for func, (_, _, _, ct, callers) in stats.items():
+        if not callers:
+            walk(func, [], ct)
+    return {stack: int(round(us)) for stack, us in stacks.items() if us >= MIN_STACK_US}
+
+
+class _Sampler:
+    """Samples the stack of one thread from a background thread"""
+
+    def __init__(self, thread_id, interval_s=SAMPLE_INTERVAL_S):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.stacks = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+
+
+class RequestProfile:
+    """Profile of one request, written to `directory` by write()"""
+
+    def __init__(self, mode, label, directory=PROFILE_DIR):
+        self.mode = mode
+        self.label = label
+        self.directory = directory
+        self.started = None
+        self.wall_ms = None
+        self._sampler = None
+        self._profiler = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        if self.mode == "deterministic":
+            self._profiler = cProfile.Profile()
+            try:
+                self._profiler.enable()
+            except ValueError:
+                # Another request already holds the (process-wide) profiler
+                self._profiler = None
+                self.mode = "sample"
+        if self.mode == "sample":
+            self._sampler = _Sampler(threading.get_ident())
+            self._sampler.start()
+
+    def stop(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+        self.wall_ms = round((time.perf_counter() - self.started) * 1000.0, 1)
+
+    def stage_summary(self):
+        """Milliseconds spent inside each pipeline stage function"""
+        summary = {}
+        if self._sampler is not None:
+            per_sample_ms = self._sampler.interval_s * 1000.0
+            for stack, count in self._sampler.stacks.items():
+                seen = set()
+                for label in stack.split(";"):
+                    stage = STAGE_FUNCTIONS.get(label.split(" ", 1)[0])
+                    if stage and stage not in seen:
+                        seen.add(stage)
+                        summary[stage] = summary.get(stage, 0.0) + count * per_sample_ms
+        elif self._profiler is not None:
+            stats = pstats.Stats(self._profiler).stats
+            for (_, _, name), (_, _, _, cumulative, _) in stats.items():
+                stage = STAGE_FUNCTIONS.get(name)
+                if stage:
+                    summary[stage] = summary.get(stage, 0.0) + cumulative * 1000.0
+        return {stage: round(ms, 1) for stage, ms in sorted(summary.items(), key=lambda item: -item[1])}
+
+    def write(self):
+        """Write the profile and its summary. Returns the written paths"""
+        os.makedirs(self.directory, exist_ok=True)
+        stem = os.path.join(self.directory, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{self.label}")
+        paths = []
+        stacks = None
+        if self._sampler is not None:
+            stacks = self._sampler.stacks
+        elif self._profiler is not None:
+            stacks = folded_stacks(pstats.Stats(self._profiler).stats)
+        if stacks is not None:
+            path = stem + ".collapsed"
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in sorted(stacks.items()):
+                    f.write(f"{stack} {count}\n")
+            paths.append(path)
+        if self._profiler is not None:
+            path = stem + ".prof"
+            self._profiler.dump_stats(path)
+            paths.append(path)
+
+        summary_path = stem + ".summary.json"
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "label": self.label,
+                "mode": self.mode,
+                "wall_ms": self.wall_ms,
+                "samples": self._sampler.samples if self._sampler is not None else None,
+                "stages_ms": self.stage_summary(),
+                "files": [os.path.basename(p) for p in paths],
+            }, f, indent=2)
+        paths.append(summary_path)
+        return paths
@@ -28,7 +28,7 @@ def _try_cv2(img_cv):
     return None
 
 
-def extract_qr_data(image_path):
+def extract_qr_data(image_path, deadline=None):
     """Attempt to decode QR/barcode data from an image using multiple strategies.
 
     Strategy order:
@@ -36,6 +36,9 @@ def extract_qr_data(image_path):
     2. OpenCV QRCodeDetector on original image
     3. Preprocessed grayscale/threshold + rotations with both decoders
 
+    Strategies after 2 are optional: when a `deadline` is given and its
+    budget runs out they are skipped and recorded as "qr_fallback".
+
     Returns the first payload string found, or None.
     """
     try:
@@ -54,6 +57,10 @@ def extract_qr_data(image_path):
     if result:
         return result
 
+    if deadline is not None and not deadline.allows("qr_fallback"):
+        deadline.skip("qr_fallback")
+        return None
+
     # 3) Try stronger preprocessing: denoise, adaptive threshold, contour-based warp
     gray = cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY)
 
@@ -108,6 +115,9 @@ def extract_qr_data(image_path):
     if warped is not None:
         # try detectors on the warped area (and a resized version)
         for scale in (1.0, 1.5, 2.0):
+            if deadline is not None and deadline.expired():
+                deadline.skip("qr_fallback")
+                return None
             try:
                 h, w = warped.shape[:2]
                 resized = cv2.resize(warped, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_LINEAR)
@@ -137,6 +147,9 @@ def extract_qr_data(image_path):
             proc_thresh = proc
 
         for angle in (0, 90, 180, 270):
+            if deadline is not None and deadline.expired():
+                deadline.skip("qr_fallback")
+                return None
             if angle != 0:
                 (h, w) = proc_thresh.shape[:2]
                 M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
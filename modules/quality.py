@@ -0,0 +1,194 @@
+"""
+Fast image quality gate.
+Runs on a downscaled grayscale copy before the QR cascade and OCR, so that
+blurry, dark or glare-ridden photos are rejected (or routed to the heavier
+enhancement path) in milliseconds instead of seconds. Brightness and glare
+are measured on the card found in the frame, so white paper or a flatbed
+around the card does not count as overexposure.
+"""
+import cv2
+import numpy as np
+from PIL import Image
+
+
+QUALITY_MAX_SIDE = 640
+
+# Frames of a burst are only ranked, so a smaller decode is enough
+SHARPNESS_MAX_SIDE = 320
+
+# Laplacian variance of the downscaled image
+BLUR_REJECT_VARIANCE = 15.0
+BLUR_ENHANCE_VARIANCE = 60.0
+
+# Mean brightness (0-255)
+DARK_REJECT_MEAN = 35.0
+DARK_ENHANCE_MEAN = 70.0
+BRIGHT_REJECT_MEAN = 235.0
+
+# Fraction of the card covered by near-saturated blobs that do not touch its
+# edge (white background reaching the edge of the crop is not glare)
+GLARE_LEVEL = 250
+GLARE_ENHANCE_FRACTION = 0.04
+GLARE_REJECT_FRACTION = 0.25
+
+# Largest card-like contour as a fraction of the frame
+CARD_AREA_MIN_FRACTION = 0.12
+
+# Smallest contour taken as the card region for brightness and glare (a card on an A4 scan is ~0.1)
+CARD_REGION_MIN_FRACTION = 0.03
+
+# Reason codes, worst first
+REASON_CODES = ("unreadable_image", "too_blurry", "too_dark", "overexposed", "glare", "card_too_small")
+
+
+def read_downscaled_gray(image_path, max_side=QUALITY_MAX_SIDE):
+    """Decode the image as grayscale at reduced size.
+
+    The header is read first (no full decode) to pick the JPEG reduced
+    decoding mode, which avoids decoding large photos at full resolution.
+    """
+    try:
+        with Image.open(image_path) as probe:
+            w, h = probe.size
+    except Exception:
+        return None
+
+    flag = cv2.IMREAD_GRAYSCALE
+    longest = max(w, h)
+    if longest >= max_side * 8:
+        flag = cv2.IMREAD_REDUCED_GRAYSCALE_8
+    elif longest >= max_side * 4:
+        flag = cv2.IMREAD_REDUCED_GRAYSCALE_4
+    elif longest >= max_side * 2:
+        flag = cv2.IMREAD_REDUCED_GRAYSCALE_2
+
+    gray = cv2.imread(image_path, flag)
+    if gray is None:
+        return None
+
+    h, w = gray.shape[:2]
+    if max(w, h) > max_side:
+        scale = max_side / float(max(w, h))
+        gray = cv2.resize(gray, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    return gray
+
+
+def _card_region(gray):
+    """(area fraction, (x, y, w, h)) of the largest quadrilateral-ish contour, or (0.0, None)"""
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    edged = cv2.Canny(blurred, 50, 150)
+    edged = cv2.dilate(edged, None, iterations=2)
+    contours, _ = cv2.findContours(edged, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return 0.0, None
+    largest = max(contours, key=cv2.contourArea)
+    (_, _), (rw, rh), _ = cv2.minAreaRect(largest)
+    return float(rw * rh) / float(gray.shape[0] * gray.shape[1]), cv2.boundingRect(largest)
+
+
+def _glare_fraction(region):
+    """Share of `region` in saturated blobs that do not touch its border"""
+    mask = (region >= GLARE_LEVEL).astype(np.uint8)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    h, w = region.shape[:2]
+    glare = 0
+    for i in range(1, count):
+        x, y, bw, bh, area = stats[i]
+        if x > 0 and y > 0 and x + bw < w and y + bh < h:
+            glare += area
+    return float(glare) / float(h * w)
+
+
+def sharpness_score(image_path, max_side=SHARPNESS_MAX_SIDE):
+    """Laplacian variance of a small grayscale decode, for ranking frames of a burst.
+
+    Much cheaper than assess_image_quality; returns 0.0 for unreadable files.
+    """
+    gray = read_downscaled_gray(image_path, max_side)
+    if gray is None:
+        return 0.0
+    return round(float(cv2.Laplacian(gray, cv2.CV_64F).var()), 2)
+
+
+def assess_image_quality(image_path, max_side=QUALITY_MAX_SIDE):
+    """Score an image before the expensive stages.
+
+    Returns a dict:
+      route    - "normal", "enhance" (run OCR with extra preprocessing) or "reject"
+      reason   - the worst reason code (see REASON_CODES) or None
+      reasons  - every issue found
+      metrics  - blur_variance, mean_brightness, dark_fraction,
+                 bright_fraction, glare_fraction, card_area_fraction
+
+    Brightness and glare refer to the card region when one is found (then
+    also "card_region": True); otherwise to the whole frame, where a bright
+    image is only routed to enhancement, not rejected.
+    """
+    gray = read_downscaled_gray(image_path, max_side)
+    if gray is None:
+        return {"route": "reject", "reason": "unreadable_image", "reasons": ["unreadable_image"], "metrics": {}}
+
+    card_fraction, box = _card_region(gray)
+    region = gray
+    if box is not None and card_fraction >= CARD_REGION_MIN_FRACTION:
+        x, y, w, h = box
+        region = gray[y:y + h, x:x + w]
+    on_card = region is not gray
+
+    hist = cv2.calcHist([region], [0], None, [256], [0, 256]).ravel()
+    total = float(hist.sum()) or 1.0
+    levels = np.arange(256)
+
+    metrics = {
+        "blur_variance": round(float(cv2.Laplacian(gray, cv2.CV_64F).var()), 2),
+        "mean_brightness": round(float((hist * levels).sum() / total), 2),
+        "dark_fraction": round(float(hist[:30].sum() / total), 4),
+        "bright_fraction": round(float(hist[226:].sum() / total), 4),
+        "glare_fraction": round(_glare_fraction(region), 4),
+        "card_area_fraction": round(card_fraction, 4),
+        "card_region": on_card,
+    }
+
+    rejects = []
+    enhances = []
+    if metrics["blur_variance"] < BLUR_REJECT_VARIANCE:
+        rejects.append("too_blurry")
+    elif metrics["blur_variance"] < BLUR_ENHANCE_VARIANCE:
+        enhances.append("too_blurry")
+
+    if metrics["mean_brightness"] < DARK_REJECT_MEAN:
+        rejects.append("too_dark")
+    elif metrics["mean_brightness"] < DARK_ENHANCE_MEAN:
+        enhances.append("too_dark")
+
+    if metrics["mean_brightness"] > BRIGHT_REJECT_MEAN:
+        # Without a card region the brightness may be the paper around it
+        (rejects if on_card else enhances).append("overexposed")
+
+    if metrics["glare_fraction"] > GLARE_REJECT_FRACTION:
+        rejects.append("glare")
+    elif metrics["glare_fraction"] > GLARE_ENHANCE_FRACTION:
+        enhances.append("glare")
+
+    # A small card in a big frame is still readable after enhancement
+    if metrics["card_area_fraction"] < CARD_AREA_MIN_FRACTION:
+        enhances.append("card_too_small")
+
+    if rejects:
+        route = "reject"
+        reasons = rejects + enhances
+    elif enhances:
+        route = "enhance"
+        reasons = enhances
+    else:
+        route = "normal"
+        reasons = []
+
+    primary = rejects or enhances
+    reason = None
+    for code in REASON_CODES:
+        if code in primary:
+            reason = code
+            break
+
+    return {"route": route, "reason": reason, "reasons": reasons, "metrics": metrics}
@@ -0,0 +1,104 @@
+"""
+Typed result of one pipeline run.
+Every stage of main.iter_process_images fills its own slots once: the
+quality gate sets SideResult.quality, QR decoding qr_raw/xml, OCR a side's
+text/words/details, the face stage face_b64 and the last stage translations.
+Response builders (assemble_final, stage_update, the formatter) read the
+slots directly; field() gives the merged value of a field together with the
+source it came from. Slotted classes keep a result to a few fixed-size
+objects instead of a dict per request and per side.
+"""
+
+# XML attribute holding each field when the QR was decoded
+XML_KEYS = {
+    "name": "name", "gender": "gender", "dob": "dob", "yob": "yob", "aadhaar": "uid",
+    "locality": "loc", "city": "dist", "state": "state", "pincode": "pc",
+}
+
+PERSONAL_FIELDS = ("name", "gender", "dob", "yob", "aadhaar")
+ADDRESS_FIELDS = ("locality", "city", "state", "pincode")
+
+# Side whose OCR supplies a field when the QR does not (the guardian is read from the address block)
+FIELD_SIDES = {**{f: "front" for f in PERSONAL_FIELDS}, **{f: "back" for f in ADDRESS_FIELDS},
+               "guardian_name": "back"}
+
+
+class SideResult:
+    """What the pipeline read from one side of the card.
+
+    `details` is the parse_ocr_text dict; `retries` maps fields re-read by
+    main.refine_weak_fields to their new confidence.
+    """
+
+    __slots__ = ("image", "quality", "text", "words", "details", "retries", "ocr_error", "parse_error")
+
+    def __init__(self, image=None):
+        self.image = image
+        self.quality = None
+        self.text = None
+        self.words = None
+        self.details = None
+        self.retries = None
+        self.ocr_error = None
+        self.parse_error = None
+
+    @property
+    def error(self):
+        return self.ocr_error or self.parse_error
+
+
+class PipelineResult:
+    """Result of process_images / process_pdf / process_burst"""
+
+    __slots__ = ("front", "back", "qr_raw", "qr_error", "xml", "xml_error", "face_b64", "face_error",
+                 "translations", "quality_error", "quality_rejected", "deadline", "plan", "memory",
+                 "input_type", "source_pdf", "burst")
+
+    def __init__(self, front_image=None, back_image=None, deadline=None, plan=None, memory=None):
+        self.front = SideResult(front_image)
+        self.back = SideResult(back_image)
+        self.qr_raw = None
+        self.qr_error = None
+        self.xml = None
+        self.xml_error = None
+        self.face_b64 = None
+        self.face_error = None
+        self.translations = None
+        self.quality_error = None
+        self.quality_rejected = False
+        self.deadline = deadline
+        self.plan = plan
+        self.memory = memory
+        self.input_type = "image"
+        self.source_pdf = None
+        self.burst = None
+
+    def side(self, name):
+        return self.front if name == "front" else self.back
+
+    def sides(self):
+        return (("front", self.front), ("back", self.back))
+
+    @property
+    def quality(self):
+        """Quality gate scores per assessed side"""
+        return {name: side.quality for name, side in self.sides() if side.quality is not None}
+
+    @property
+    def field_retries(self):
+        """Fields re-read per side, with the confidence of the re-read"""
+        return {name: side.retries for name, side in self.sides() if side.retries}
+
+    def field(self, name):
+        """(value, source) of a merged field: the QR value, else the OCR value
+        of the field's side. Source is "qr", "ocr_front", "ocr_back" or None."""
+        xml_key = XML_KEYS.get(name)
+        if xml_key and self.xml and self.xml.get(xml_key):
+            return self.xml[xml_key], "qr"
+        side = FIELD_SIDES[name]
+        details = self.side(side).details
+        value = details.get(name) if details else None
+        return value, ("ocr_" + side) if value else None
+
+    def value(self, name):
+        return self.field(name)[0]
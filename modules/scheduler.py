@@ -0,0 +1,304 @@
+"""
+Fair request scheduling.
+Each worker runs at most OCR_SCHEDULER_SLOTS pipelines at a time; other
+requests wait in a priority lane ("interactive" or "bulk"). Free slots go
+to the lanes by weighted fair queuing (stride scheduling over the lane
+weights), and within a lane round-robin over tenants (the API keys listed
+in OCR_API_KEYS; every other request shares one anonymous tenant), each
+tenant limited to OCR_TENANT_MAX_CONCURRENT running requests. Bulk work
+never takes the last OCR_INTERACTIVE_RESERVED_SLOTS slots, so an
+interactive request never waits behind a full worker of backfill jobs, while
+bulk still gets all the capacity interactive traffic leaves free.
+"""
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import deque
+
+
+# Pipelines run at once per worker; gunicorn threads beyond this wait in the lanes
+DEFAULT_SLOTS = int(os.environ.get("OCR_SCHEDULER_SLOTS", "2"))
+
+# Running requests allowed per tenant (API key) per worker
+DEFAULT_TENANT_MAX_CONCURRENT = int(os.environ.get("OCR_TENANT_MAX_CONCURRENT", "2"))
+
+# Slots bulk requests may never occupy
+DEFAULT_INTERACTIVE_RESERVED_SLOTS = int(os.environ.get("OCR_INTERACTIVE_RESERVED_SLOTS", "1"))
+
+# Share of free slots per lane, e.g. "interactive:8,bulk:1"
+DEFAULT_LANE_WEIGHTS = os.environ.get("OCR_LANE_WEIGHTS", "interactive:8,bulk:1")
+
+# Longest wait in the queue and most waiting requests, per lane
+LANE_TIMEOUT_S = {"interactive": 10.0, "bulk": 120.0}
+LANE_MAX_QUEUED = {"interactive": 16, "bulk": 64}
+
+DEFAULT_LANE = "interactive"
+LANES = ("interactive", "bulk")
+
+# Comma-separated API keys that get a tenant (and quota) of their own
+API_KEYS = tuple(k.strip() for k in os.environ.get("OCR_API_KEYS", "").split(",") if k.strip())
+
+# Tenant of requests without a listed API key
+ANONYMOUS_TENANT = "anonymous"
+
+# Recent waits kept per lane for the wait-time percentiles
+WAIT_SAMPLES = 512
+
+
+class SchedulerBusy(Exception):
+    """A request could not get a pipeline slot (queue full or wait timed out)"""
+
+
+def parse_lane(value):
+    """Lane named by a request (X-Priority header / priority option). Raises ValueError"""
+    if value is None or value == "":
+        return DEFAULT_LANE
+    lane = value.strip().lower()
+    if lane not in LANES:
+        raise ValueError(f"priority must be one of {', '.join(LANES)}")
+    return lane
+
+
+def tenant_id(api_key, known_keys=None):
+    """Stable, non-reversible tenant name for an API key (shown in /metrics).
+
+    Only keys in `known_keys` (default: OCR_API_KEYS) get their own tenant;
+    a missing or unknown key maps to ANONYMOUS_TENANT, so a client cannot
+    get a fresh quota by sending a new key.
+    """
+    known_keys = API_KEYS if known_keys is None else known_keys
+    if not api_key:
+        return ANONYMOUS_TENANT
+    key_bytes = api_key.encode("utf-8")
+    if not any(hmac.compare_digest(key_bytes, key.encode("utf-8")) for key in known_keys):
+        return ANONYMOUS_TENANT
+    return hashlib.sha256(key_bytes).hexdigest()[:12]
+
+
+def parse_weights(spec):
+    weights = {lane: 1.0 for lane in LANES}
+    for part in spec.split(","):
+        if ":" in part:
+            lane, weight = part.split(":", 1)
+            if lane.strip() in weights:
+                weights[lane.strip()] = max(float(weight), 0.01)
+    return weights
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _Ticket:
+    __slots__ = ("lane", "tenant", "enqueued", "granted")
+
+    def __init__(self, lane, tenant):
+        self.lane = lane
+        self.tenant = tenant
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+
+class _LaneState:
+    def __init__(self, name, weight, timeout_s, max_queued):
+        self.name = name
+        self.weight = weight
+        self.timeout_s = timeout_s
+        self.max_queued = max_queued
+        # Waiting tickets per tenant, and each tenant's round-robin pass
+        self.queues = {}
+        self.tenant_pass = {}
+        self.pass_value = 0.0
+        self.queued = 0
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.waits_ms = deque(maxlen=WAIT_SAMPLES)
+
+    def stats(self):
+        waits = list(self.waits_ms)
+        return {
+            "weight": self.weight,
+            "queued": self.queued,
+            "running": self.running,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_ms": {
+                "p50": round(_percentile(waits, 0.5), 1) if waits else None,
+                "p95": round(_percentile(waits, 0.95), 1) if waits else None,
+                "max": round(max(waits), 1) if waits else None,
+            },
+        }
+
+
+class Scheduler:
+    """Per-worker slot scheduler with priority lanes and tenant quotas.
+
+    acquire() blocks until the request gets a slot and returns a ticket for
+    release(); slot() does both around a with-block. A request whose lane
+    queue is full, or that waits longer than its lane timeout, is rejected
+    with SchedulerBusy.
+    """
+
+    def __init__(self, slots=DEFAULT_SLOTS, tenant_max_concurrent=DEFAULT_TENANT_MAX_CONCURRENT,
+                 reserved_slots=DEFAULT_INTERACTIVE_RESERVED_SLOTS, weights=DEFAULT_LANE_WEIGHTS):
+        self.slots = max(1, slots)
+        self.tenant_max_concurrent = max(1, tenant_max_concurrent)
+        # Bulk keeps at least one slot, even on a single-slot worker
+        self.bulk_slots = max(1, self.slots - reserved_slots)
+        weights = parse_weights(weights) if isinstance(weights, str) else weights
+        self.lanes = {lane: _LaneState(lane, weights[lane], LANE_TIMEOUT_S[lane], LANE_MAX_QUEUED[lane])
+                      for lane in LANES}
+        self.running = 0
+        self.tenant_running = {}
+        self._cond = threading.Condition()
+
+    def acquire(self, lane=DEFAULT_LANE, tenant=ANONYMOUS_TENANT, timeout_s=None):
+        state = self.lanes[lane]
+        timeout_s = state.timeout_s if timeout_s is None else timeout_s
+        ticket = _Ticket(lane, tenant)
+        with self._cond:
+            if state.queued >= state.max_queued:
+                state.rejected += 1
+                raise SchedulerBusy(f"{lane} queue full")
+            self._enqueue(state, ticket)
+            self._dispatch()
+            end = ticket.enqueued + timeout_s
+            while not ticket.granted:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    self._dequeue(state, ticket)
+                    state.timed_out += 1
+                    state.rejected += 1
+                    raise SchedulerBusy(f"timed out waiting in the {lane} queue")
+                self._cond.wait(remaining)
+            state.waits_ms.append((time.monotonic() - ticket.enqueued) * 1000.0)
+        return ticket
+
+    def release(self, ticket):
+        with self._cond:
+            self.running -= 1
+            self.lanes[ticket.lane].running -= 1
+            count = self.tenant_running[ticket.tenant] - 1
+            if count:
+                self.tenant_running[ticket.tenant] = count
+            else:
+                del self.tenant_running[ticket.tenant]
+            self._dispatch()
+
+    def slot(self, lane=DEFAULT_LANE, tenant=ANONYMOUS_TENANT, timeout_s=None):
+        """Context manager holding a slot for the block"""
+        return _Slot(self, lane, tenant, timeout_s)
+
+    def _enqueue(self, state, ticket):
+        if not state.queued:
+            # A lane coming back from idle starts level with the busiest one, without banked credit
+            active = [s.pass_value for s in self.lanes.values() if s.queued]
+            state.pass_value = max(state.pass_value, min(active)) if active else state.pass_value
+        queue = state.queues.get(ticket.tenant)
+        if queue is None:
+            queue = state.queues[ticket.tenant] = deque()
+            backlogged = [state.tenant_pass[t] for t in state.queues if t != ticket.tenant]
+            floor = min(backlogged) if backlogged else 0.0
+            state.tenant_pass[ticket.tenant] = max(state.tenant_pass.get(ticket.tenant, 0.0), floor)
+        queue.append(ticket)
+        state.queued += 1
+
+    def _dequeue(self, state, ticket):
+        queue = state.queues[ticket.tenant]
+        queue.remove(ticket)
+        state.queued -= 1
+        if not queue:
+            del state.queues[ticket.tenant]
+
+    def _next_ticket(self):
+        """Head ticket of the eligible tenant with the lowest pass, in the eligible lane with the lowest pass"""
+        best = None
+        for state in self.lanes.values():
+            if not state.queued:
+                continue
+            if state.name == "bulk" and self.running >= self.bulk_slots:
+                continue
+            tenants = [t for t in state.queues
+                       if self.tenant_running.get(t, 0) < self.tenant_max_concurrent]
+            if not tenants:
+                continue
+            tenant = min(tenants, key=lambda t: state.tenant_pass[t])
+            if best is None or state.pass_value < best[0].pass_value:
+                best = (state, tenant)
+        return best
+
+    def _dispatch(self):
+        granted = False
+        while self.running < self.slots:
+            best = self._next_ticket()
+            if best is None:
+                break
+            state, tenant = best
+            ticket = state.queues[tenant][0]
+            self._dequeue(state, ticket)
+            state.pass_value += 1.0 / state.weight
+            state.tenant_pass[tenant] += 1.0
+            if tenant not in state.queues:
+                # Idle tenants are forgotten; _enqueue levels them up on return
+                del state.tenant_pass[tenant]
+            ticket.granted = True
+            self.running += 1
+            state.running += 1
+            state.admitted += 1
+            self.tenant_running[tenant] = self.tenant_running.get(tenant, 0) + 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "slots": self.slots,
+                "bulk_slots": self.bulk_slots,
+                "running": self.running,
+                "tenant_max_concurrent": self.tenant_max_concurrent,
+                "lanes": {lane: state.stats() for lane, state in self.lanes.items()},
+                "tenants": {
+                    tenant: {
+                        "running": self.tenant_running.get(tenant, 0),
+                        "queued": {lane: len(s.queues[tenant]) for lane, s in self.lanes.items() if tenant in s.queues},
+                    }
+                    for tenant in set(self.tenant_running).union(*(s.queues for s in self.lanes.values()))
+                },
+            }
+
+
+class _Slot:
+    def __init__(self, scheduler, lane, tenant, timeout_s):
+        self.scheduler = scheduler
+        self.lane = lane
+        self.tenant = tenant
+        self.timeout_s = timeout_s
+        self.ticket = None
+
+    def __enter__(self):
+        self.ticket = self.scheduler.acquire(self.lane, self.tenant, self.timeout_s)
+        return self
+
+    def __exit__(self, *exc):
+        self.scheduler.release(self.ticket)
+        return False
+
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Process-wide scheduler, created on first use (after any fork)"""
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = Scheduler()
+    return _default_scheduler
@@ -0,0 +1,24 @@
+"""
+Fast JSON serialization for responses and stored results.
+Uses orjson when it is installed and falls back to the standard library.
+Output is always compact UTF-8 (no indentation, no ASCII escaping).
+"""
+import json
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def dumps_bytes(obj):
+    """Serialize `obj` to compact UTF-8 JSON bytes"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(obj):
+    """Serialize `obj` to a compact JSON string"""
+    return dumps_bytes(obj).decode("utf-8")
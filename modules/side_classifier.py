@@ -0,0 +1,144 @@
+"""
+Content-based front/back classification.
+Assigns card sides when file names are missing or contradict the images,
+before any expensive stage runs. Works on a downscaled grayscale copy: a
+face counts for the front, a QR code for the back. Only when those cues do
+not settle it does one sparse OCR pass of the small copy look for the
+"Address" / C/O label (back), DOB and gender words (front) and the share of
+digits in the text.
+"""
+import re
+
+import cv2
+import pytesseract
+
+from .ocr_languages import PRIMARY_LANG
+from .quality import read_downscaled_gray
+from .utils import detect_faces
+
+
+SIDE_MAX_SIDE = 800
+
+# Sparse text: find labels anywhere on the card without layout analysis
+SIDE_OCR_CONFIG = "--psm 11"
+SIDE_OCR_TIMEOUT_S = 2
+
+# Score each cue adds to the side it points at
+CUE_WEIGHTS = {"face": 2.0, "qr": 3.0, "address_label": 2.0, "front_label": 2.0, "digit_density": 0.5}
+
+# Score lead needed to call a side
+DECISION_MARGIN = 1.5
+
+# Digit share of the OCR'd characters: the front is short (number, DOB),
+# the back is mostly address text
+FRONT_DIGIT_DENSITY = 0.25
+BACK_DIGIT_DENSITY = 0.12
+
+_ADDRESS_RE = re.compile(r"address|\b[CSDW]\s*/\s*O\b", re.IGNORECASE)
+_FRONT_RE = re.compile(r"\bDOB\b|date of birth|year of birth|\bmale\b|\bfemale\b", re.IGNORECASE)
+
+_FRONT_NAME_RE = re.compile(r"^af|front")
+_BACK_NAME_RE = re.compile(r"^ab|back")
+
+
+def filename_side(name):
+    """Side a file name claims (the find_images patterns), or None when it claims neither or both"""
+    if not name:
+        return None
+    name = name.lower()
+    front = bool(_FRONT_NAME_RE.search(name))
+    back = bool(_BACK_NAME_RE.search(name))
+    if front == back:
+        return None
+    return "front" if front else "back"
+
+
+def label_conflict(front_name, back_name):
+    """True when the name of the file given as one side claims the other side"""
+    return filename_side(front_name) == "back" or filename_side(back_name) == "front"
+
+
+def _scores(cues):
+    scores = {"front": 0.0, "back": 0.0}
+    if cues.get("face"):
+        scores["front"] += CUE_WEIGHTS["face"]
+    if cues.get("qr"):
+        scores["back"] += CUE_WEIGHTS["qr"]
+    if cues.get("address_label"):
+        scores["back"] += CUE_WEIGHTS["address_label"]
+    if cues.get("front_label"):
+        scores["front"] += CUE_WEIGHTS["front_label"]
+    density = cues.get("digit_density")
+    if density is not None:
+        if density >= FRONT_DIGIT_DENSITY:
+            scores["front"] += CUE_WEIGHTS["digit_density"]
+        elif density <= BACK_DIGIT_DENSITY:
+            scores["back"] += CUE_WEIGHTS["digit_density"]
+    return scores
+
+
+def _text_cues(gray):
+    try:
+        text = pytesseract.image_to_string(gray, lang=PRIMARY_LANG, config=SIDE_OCR_CONFIG,
+                                           timeout=SIDE_OCR_TIMEOUT_S)
+    except Exception:
+        return {}
+    chars = [c for c in text if c.isalnum()]
+    return {
+        "address_label": bool(_ADDRESS_RE.search(text)),
+        "front_label": bool(_FRONT_RE.search(text)),
+        "digit_density": round(sum(c.isdigit() for c in chars) / len(chars), 3) if chars else None,
+    }
+
+
+def classify_side(image_path, use_text=True):
+    """Classify a card image as front or back from its content.
+
+    Returns {"side": "front", "back" or None (undecided), "scores":
+    {"front", "back"}, "cues": {...}}. The OCR cues are only computed when
+    the face/QR cues leave it undecided and `use_text` is set.
+    """
+    gray = read_downscaled_gray(image_path, SIDE_MAX_SIDE)
+    if gray is None:
+        return {"side": None, "scores": {"front": 0.0, "back": 0.0}, "cues": {}}
+
+    cues = {}
+    try:
+        cues["face"] = len(detect_faces(gray)) > 0
+    except Exception:
+        cues["face"] = False
+    try:
+        cues["qr"] = bool(cv2.QRCodeDetector().detect(gray)[0])
+    except Exception:
+        cues["qr"] = False
+
+    scores = _scores(cues)
+    if use_text and abs(scores["front"] - scores["back"]) < DECISION_MARGIN:
+        cues.update(_text_cues(gray))
+        scores = _scores(cues)
+
+    side = None
+    if scores["front"] - scores["back"] >= DECISION_MARGIN:
+        side = "front"
+    elif scores["back"] - scores["front"] >= DECISION_MARGIN:
+        side = "back"
+    return {"side": side, "scores": scores, "cues": cues}
+
+
+def assign_sides(first_path, second_path):
+    """Put two card images in (front, back) order by content.
+
+    The given order is kept unless the classification contradicts it: the
+    pair is swapped when the first image looks like a back or the second
+    like a front, and the other image does not claim that same side.
+    Returns (front_path, back_path, info) with info = {"swapped", "first",
+    "second"}.
+    """
+    first = classify_side(first_path)
+    second = classify_side(second_path)
+    swapped = ((first["side"] == "back" and second["side"] != "back")
+               or (second["side"] == "front" and first["side"] != "front"))
+    info = {"swapped": swapped, "first": first, "second": second}
+    if swapped:
+        return second_path, first_path, info
+    return first_path, second_path, info
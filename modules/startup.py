@@ -0,0 +1,134 @@
+"""
+Worker start-up: Tesseract resolution, preloading and warm-up.
+
+preload() is fork-safe and meant to run once in the gunicorn master
+(preload_app): it imports the heavy modules and builds lookup tables.
+start_warm_up() runs in each worker after fork: it loads the face detector
+and pushes a synthetic card through the pipeline, then marks the worker
+ready. /ready reports is_ready() so rolling deploys wait for warm workers.
+"""
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+
+# Where Tesseract usually lives when it is not on PATH
+DEFAULT_TESSERACT_PATHS = (
+    r"C:\Program Files\Tesseract-OCR\tesseract.exe",
+    r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
+    "/usr/bin/tesseract",
+    "/usr/local/bin/tesseract",
+    "/opt/homebrew/bin/tesseract",
+)
+
+_ready = threading.Event()
+_start_lock = threading.Lock()
+_state = {"preloaded": False, "warm_up_started": False, "warm_up_error": None, "tesseract_cmd": None}
+
+
+def resolve_tesseract_cmd():
+    """Tesseract binary from TESSERACT_CMD, then PATH, then the usual install locations"""
+    configured = os.environ.get("TESSERACT_CMD")
+    if configured:
+        return configured
+    found = shutil.which("tesseract")
+    if found:
+        return found
+    for path in DEFAULT_TESSERACT_PATHS:
+        if os.path.isfile(path):
+            return path
+    return "tesseract"
+
+
+def preload():
+    """Import heavy modules and build indexes. Safe to call before fork, idempotent"""
+    if _state["preloaded"]:
+        return
+    # Pulls in cv2, pytesseract, pyzbar, deep_translator
+    importlib.import_module("main")
+    from .india_states_districts import build_indexes
+    from .ocr_languages import available_languages
+    from .tesseract_config import load_tuned_config
+
+    build_indexes()
+    available_languages()
+    load_tuned_config()
+    _state["tesseract_cmd"] = resolve_tesseract_cmd()
+    _state["preloaded"] = True
+
+
+def _write_warm_up_card(path):
+    """Render a synthetic card with the usual front-side text"""
+    from PIL import Image, ImageDraw
+
+    card = Image.new("RGB", (1000, 630), "white")
+    draw = ImageDraw.Draw(card)
+    draw.rectangle((20, 20, 980, 610), outline="black", width=4)
+    draw.rectangle((60, 160, 300, 460), outline="gray", width=3)
+    lines = ("Government of India", "Warm Up Card", "DOB: 01/01/1990", "MALE", "2345 6789 0124")
+    for i, line in enumerate(lines):
+        draw.text((340, 160 + i * 60), line, fill="black")
+    card.save(path)
+
+
+def warm_up():
+    """Load per-worker resources and run one synthetic card through the pipeline"""
+    preload()
+    from main import process_images
+    from .utils import get_face_cascade
+
+    get_face_cascade()
+    fd, path = tempfile.mkstemp(suffix=".png", prefix="warmup_")
+    os.close(fd)
+    try:
+        _write_warm_up_card(path)
+        # Minimal profile: no translation network calls during warm-up
+        process_images(path, path, profile="minimal", quality_gate=False)
+    finally:
+        os.remove(path)
+
+
+def _warm_up_and_mark_ready():
+    try:
+        warm_up()
+    except Exception as e:
+        # A failed warm-up must not keep the worker out of rotation forever
+        _state["warm_up_error"] = str(e)
+        print(f"Warm-up failed: {e}", file=sys.stderr)
+    _ready.set()
+
+
+def start_warm_up(background=True):
+    """Warm this worker up (call after fork). Only the first call does anything.
+
+    Returns the thread when run in background.
+    """
+    with _start_lock:
+        if _state["warm_up_started"]:
+            return None
+        _state["warm_up_started"] = True
+    if background:
+        thread = threading.Thread(target=_warm_up_and_mark_ready, name="warm-up", daemon=True)
+        thread.start()
+        return thread
+    _warm_up_and_mark_ready()
+    return None
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def readiness():
+    from .tesseract_config import tuned_config_info
+
+    return {
+        "ready": is_ready(),
+        "preloaded": _state["preloaded"],
+        "tesseract_cmd": _state["tesseract_cmd"],
+        "tesseract_config": tuned_config_info(),
+        "warm_up_error": _state["warm_up_error"],
+    }
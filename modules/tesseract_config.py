@@ -0,0 +1,117 @@
+"""
+Tuned Tesseract settings per OCR zone.
+autotune.py sweeps engine mode, page segmentation mode, preprocessing and
+scale for each zone over a labeled corpus and writes the fastest setting
+that meets the zone's accuracy floor to a versioned JSON file. The OCR
+passes read their zone's setting from that file (OCR_TESSERACT_CONFIG,
+default config/tesseract_tuned.json); without the file, or for zones it
+does not list, they keep the built-in defaults below.
+"""
+import json
+import os
+import sys
+import threading
+
+
+TUNED_CONFIG_VERSION = 1
+
+# Tuned settings file, written by autotune.py
+DEFAULT_TUNED_CONFIG_PATH = os.environ.get(
+    "OCR_TESSERACT_CONFIG",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "tesseract_tuned.json"),
+)
+
+# Zones: the whole-page pass of each side and the digit-only re-read of the number strip
+ZONES = ("front", "back", "number")
+
+# Preprocessing variants per kind of zone (implemented in ocr_reader.prepare_page for the page
+# zones and ocr_reader._digit_variant for the number strip)
+PAGE_PREPROCESS = ("none", "gray", "clahe", "otsu")
+NUMBER_PREPROCESS = ("gray", "otsu", "adaptive")
+
+# Settings used when a zone is not tuned: what the passes did before autotuning.
+# oem/psm None leave Tesseract's own default.
+DEFAULT_ZONE_SETTINGS = {
+    "front": {"oem": None, "psm": None, "preprocess": "none", "scale": 1.0},
+    "back": {"oem": None, "psm": None, "preprocess": "none", "scale": 1.0},
+    "number": {"oem": None, "psm": 7, "preprocess": "gray", "scale": 2.0},
+}
+
+SETTING_KEYS = ("oem", "psm", "preprocess", "scale")
+
+_loaded = {"path": None, "config": None}
+_lock = threading.Lock()
+
+
+def validate_settings(zone, settings):
+    """Raise ValueError unless `settings` is a usable setting for `zone`"""
+    missing = [key for key in SETTING_KEYS if key not in settings]
+    if missing:
+        raise ValueError(f"{zone}: missing {', '.join(missing)}")
+    allowed = NUMBER_PREPROCESS if zone == "number" else PAGE_PREPROCESS
+    if settings.get("preprocess") not in allowed:
+        raise ValueError(f"{zone}: preprocess must be one of {', '.join(allowed)}")
+    for key in ("oem", "psm"):
+        if settings.get(key) is not None and not isinstance(settings[key], int):
+            raise ValueError(f"{zone}: {key} must be an integer or null")
+    if not isinstance(settings.get("scale"), (int, float)) or not 0.1 <= settings["scale"] <= 8.0:
+        raise ValueError(f"{zone}: scale must be a number between 0.1 and 8")
+
+
+def load_tuned_config(path=None, reload=False):
+    """Read the tuned settings file once. Returns its dict, or None when there is none.
+
+    A file of another version or with an invalid zone is ignored as a whole
+    (with a warning), so a bad file never changes OCR behavior.
+    """
+    path = path or DEFAULT_TUNED_CONFIG_PATH
+    with _lock:
+        if not reload and _loaded["path"] == path:
+            return _loaded["config"]
+        config = None
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    config = json.load(f)
+                if config.get("version") != TUNED_CONFIG_VERSION:
+                    raise ValueError(f"version {config.get('version')!r}, expected {TUNED_CONFIG_VERSION}")
+                for zone, entry in config.get("zones", {}).items():
+                    if zone not in ZONES:
+                        raise ValueError(f"unknown zone {zone!r}")
+                    validate_settings(zone, entry)
+            except (OSError, ValueError, AttributeError) as e:
+                print(f"Ignoring tuned Tesseract config {path}: {e}", file=sys.stderr)
+                config = None
+        _loaded["path"] = path
+        _loaded["config"] = config
+        return config
+
+
+def zone_settings(zone):
+    """Settings for one zone: the tuned ones when the file lists the zone, else the defaults"""
+    config = load_tuned_config()
+    entry = (config or {}).get("zones", {}).get(zone)
+    if entry is None:
+        return dict(DEFAULT_ZONE_SETTINGS[zone])
+    return {key: entry[key] for key in SETTING_KEYS}
+
+
+def tesseract_args(settings, extra=""):
+    """Tesseract config string for a setting, e.g. "--oem 1 --psm 6" plus `extra`"""
+    args = []
+    if settings.get("oem") is not None:
+        args.append(f"--oem {settings['oem']}")
+    if settings.get("psm") is not None:
+        args.append(f"--psm {settings['psm']}")
+    if extra:
+        args.append(extra)
+    return " ".join(args)
+
+
+def tuned_config_info():
+    """Path and version of the tuned settings in use, for /ready"""
+    config = load_tuned_config()
+    if config is None:
+        return None
+    return {"path": _loaded["path"], "version": config["version"], "created": config.get("created"),
+            "zones": sorted(config.get("zones", {}))}
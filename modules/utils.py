@@ -1,10 +1,31 @@
 import cv2
 import base64
+import threading
 from io import BytesIO
 from PIL import Image
 import numpy as np
 
 
+# detectMultiScale is not safe to call on one classifier from several threads
+# (gthread workers), so each thread loads its own
+_face_cascades = threading.local()
+
+
+def get_face_cascade():
+	"""OpenCV's frontal face haarcascade, loaded once per thread"""
+	cascade = getattr(_face_cascades, 'cascade', None)
+	if cascade is None:
+		cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+		cascade = _face_cascades.cascade = cv2.CascadeClassifier(cascade_path)
+	return cascade
+
+
+def detect_faces(gray, min_size=(30, 30)):
+	"""Run the face cascade on a grayscale array. Returns a list of (x, y, w, h)"""
+	faces = get_face_cascade().detectMultiScale(gray, scaleFactor=1.1, minNeighbors=4, minSize=min_size)
+	return [tuple(int(v) for v in f) for f in faces]
+
+
 def extract_largest_face_base64(image_path, resize_width=400):
 	"""Detect faces in the image and return the largest face cropped as a base64 PNG string.
 
@@ -30,12 +51,10 @@ def extract_largest_face_base64(image_path, resize_width=400):
 
 	# Use OpenCV's haarcascade (bundled with opencv-python)
 	try:
-		cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-		face_cascade = cv2.CascadeClassifier(cascade_path)
+		faces = detect_faces(gray)
 	except Exception:
 		return None
 
-	faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=4, minSize=(30, 30))
 	if len(faces) == 0:
 		return None
 
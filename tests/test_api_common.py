@@ -0,0 +1,17 @@
+import os
+
+import pytest
+
+# api_common imports main, which pulls in the OCR stack (cv2, pytesseract, pyzbar)
+api_common = pytest.importorskip("modules.api_common")
+
+
+def test_remove_uploads_finds_partially_saved_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(api_common, "UPLOAD_FOLDER", str(tmp_path))
+    os.makedirs(tmp_path / "burst")
+    (tmp_path / "req1_front.jpg").write_bytes(b"x")
+    (tmp_path / "burst" / "req1_back_0.jpg").write_bytes(b"x")
+    (tmp_path / "req2_front.jpg").write_bytes(b"x")
+    api_common.remove_uploads("req1")
+    assert sorted(os.listdir(tmp_path)) == ["burst", "req2_front.jpg"]
+    assert os.listdir(tmp_path / "burst") == []
@@ -0,0 +1,27 @@
+import pytest
+
+# api_common imports main, which pulls in the OCR stack (cv2, pytesseract, pyzbar)
+api_common = pytest.importorskip("modules.api_common")
+
+TOKEN = "s3cret"
+
+
+@pytest.fixture
+def token(monkeypatch):
+    monkeypatch.setattr(api_common, "DUPLICATES_TOKEN", TOKEN)
+
+
+def test_disabled_without_a_configured_token(monkeypatch):
+    monkeypatch.setattr(api_common, "DUPLICATES_TOKEN", "")
+    assert api_common.duplicates_denied({"X-Duplicates-Token": "anything"})[1] == 403
+
+
+def test_wrong_or_missing_token_is_refused(token):
+    assert api_common.duplicates_denied({})[1] == 401
+    assert api_common.duplicates_denied({"X-Duplicates-Token": "guess"})[1] == 401
+    assert api_common.duplicates_denied({"X-Duplicates-Token": TOKEN}) is None
+
+
+def test_upload_without_a_face_is_a_client_error():
+    payload, status = api_common.duplicates_payload(face_b64=None, face_uploaded=True)
+    assert status == 400 and "face" in payload["error"]
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+# ingest imports main, which pulls in the OCR stack (cv2, pytesseract, pyzbar)
+ingest = pytest.importorskip("ingest")
+
+
+def test_pairs_front_and_back_of_one_card():
+    jobs = ingest.plan_jobs({"a/1234_front.jpg": 0, "a/1234-back.png": 0}, now=1, pair_wait_s=60)
+    assert jobs == [{"kind": "pair", "files": ["a/1234_front.jpg", "a/1234-back.png"]}]
+
+
+def test_different_cards_are_not_paired():
+    files = {"a/1234_front.jpg": 0, "a/5678_back.jpg": 0}
+    assert ingest.plan_jobs(files, now=1, pair_wait_s=60) == []
+    assert ingest.plan_jobs(files, now=61, pair_wait_s=60) == [
+        {"kind": "single", "files": ["a/1234_front.jpg"]},
+        {"kind": "single", "files": ["a/5678_back.jpg"]},
+    ]
+
+
+def test_pair_key_keeps_name_prefixes():
+    assert ingest.pair_key("affidavit_front.jpg") == "affidavit"
+    assert ingest.pair_key("abhi_front.jpg") == "abhi"
+    assert ingest.pair_key("aff.jpg") == ingest.pair_key("ab.jpg") == ""
+
+
+def test_unlabelled_and_pdf_files_run_alone():
+    jobs = ingest.plan_jobs({"scan.jpg": 0, "card.pdf": 0}, now=0, pair_wait_s=60)
+    assert sorted(j["kind"] for j in jobs) == ["pdf", "single"]
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    d = ingest.IngestDaemon(str(tmp_path), workers=1, node_id="node-a")
+    yield d
+    d._pool.shutdown()
+
+
+def drop(daemon, rel, data=b"x"):
+    path = os.path.join(daemon.inbox, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_claim_moves_files_and_loser_leaves_them(daemon, tmp_path):
+    drop(daemon, "a/1234_front.jpg")
+    drop(daemon, "a/1234_back.jpg")
+    job = {"kind": "pair", "files": ["a/1234_front.jpg", "a/1234_back.jpg"]}
+    claimed = daemon.claim(job)
+    assert [os.path.dirname(p) for p in claimed] == [daemon.claimed] * 2
+    assert not os.path.exists(os.path.join(daemon.inbox, "a/1234_front.jpg"))
+
+    other = ingest.IngestDaemon(str(tmp_path), workers=1, node_id="node-b")
+    try:
+        assert other.claim(job) is None
+        assert other.lost_claims == 1
+    finally:
+        other._pool.shutdown()
+
+
+def test_requeue_claims_puts_files_back(daemon):
+    drop(daemon, "a/1234_front.jpg")
+    daemon.claim({"kind": "single", "files": ["a/1234_front.jpg"]})
+    os.makedirs(os.path.join(daemon.claimed, "work"))
+    daemon.requeue_claims()
+    assert os.path.exists(os.path.join(daemon.inbox, "a/1234_front.jpg"))
+    assert os.listdir(daemon.claimed) == []
@@ -0,0 +1,51 @@
+import threading
+
+import pytest
+
+# memory imports pdf_reader (PyMuPDF) and PIL
+memory = pytest.importorskip("modules.memory")
+from PIL import Image  # noqa: E402
+
+
+def test_request_over_budget_is_rejected_when_no_one_may_wait():
+    budget = memory.MemoryBudget(limit_bytes=100, timeout_s=1, max_waiting=0)
+    reserved = budget.acquire(60)
+    with pytest.raises(memory.MemoryBudgetExceeded, match="queue full"):
+        budget.acquire(60)
+    budget.release(reserved)
+    assert budget.stats()["rejected"] == 1
+
+
+def test_waiting_request_is_admitted_when_memory_is_released():
+    budget = memory.MemoryBudget(limit_bytes=100, timeout_s=5, max_waiting=1)
+    reserved = budget.acquire(60)
+    threading.Timer(0.05, budget.release, args=(reserved,)).start()
+    with budget.admit(60):
+        assert budget.in_use == 60
+    assert budget.in_use == 0
+    assert budget.stats()["queued"] == 1
+
+
+def test_waiting_request_times_out():
+    budget = memory.MemoryBudget(limit_bytes=100, timeout_s=0.05, max_waiting=1)
+    budget.acquire(60)
+    with pytest.raises(memory.MemoryBudgetExceeded, match="timed out"):
+        budget.acquire(60)
+    assert budget.waiting == 0
+
+
+def test_request_larger_than_the_budget_runs_alone():
+    budget = memory.MemoryBudget(limit_bytes=100, timeout_s=0.05, max_waiting=1)
+    assert budget.acquire(500) == 100
+    with pytest.raises(memory.MemoryBudgetExceeded):
+        budget.acquire(1)
+
+
+def test_estimate_reads_image_headers(tmp_path):
+    path = str(tmp_path / "card.png")
+    Image.new("L", (100, 50)).save(path)
+    broken = tmp_path / "broken.jpg"
+    broken.write_bytes(b"not an image")
+    factor = memory.DECODE_OVERHEAD_FACTOR
+    assert memory.estimate_decoded_bytes([path, path, None]) == 100 * 50 * 3 * factor
+    assert memory.estimate_decoded_bytes([str(broken)]) == memory.UNKNOWN_IMAGE_BYTES * factor
@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+# montage imports pytesseract
+montage = pytest.importorskip("modules.montage")
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Replace the Tesseract read with one that echoes each key and records the batches"""
+    batches = []
+
+    def fake_ocr_crops(crops, lang="eng", config=None, timeout=None):
+        batches.append({"keys": [key for key, _ in crops], "config": config, "timeout": timeout})
+        return {key: {"text": repr(key)} for key, _ in crops}
+    monkeypatch.setattr(montage, "ocr_crops", fake_ocr_crops)
+    return batches
+
+
+def run_together(batcher, calls):
+    """Call batcher.ocr_crops from one thread per (crops, kwargs); returns results or errors in order"""
+    results = [None] * len(calls)
+
+    def call(i, crops, kwargs):
+        try:
+            results[i] = batcher.ocr_crops(crops, **kwargs)
+        except Exception as e:
+            results[i] = e
+    threads = [threading.Thread(target=call, args=(i, crops, kwargs)) for i, (crops, kwargs) in enumerate(calls)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    return results
+
+
+def test_concurrent_calls_share_one_read(reads):
+    batcher = montage.MontageBatcher(max_crops=4, wait_s=5)
+    results = run_together(batcher, [
+        ([("name", None), ("dob", None)], {"timeout": 10}),
+        ([("name", None), ("pin", None)], {"timeout": 3}),
+    ])
+    assert len(reads) == 1 and reads[0]["timeout"] == 3
+    assert set(results[0]) == {"name", "dob"} and set(results[1]) == {"name", "pin"}
+    # Both callers' "name" crops were read, each handed back to its own caller
+    assert results[0]["name"] != results[1]["name"]
+    assert batcher.stats() == {"calls": 2, "batches": 1, "crops": 4}
+
+
+def test_different_configs_are_read_apart(reads):
+    batcher = montage.MontageBatcher(max_crops=100, wait_s=0.05)
+    run_together(batcher, [([("a", None)], {"config": "--psm 6"}), ([("b", None)], {"config": "--psm 7"})])
+    assert sorted(r["config"] for r in reads) == ["--psm 6", "--psm 7"]
+
+
+def test_failed_read_is_raised_in_every_caller(monkeypatch):
+    def fail(crops, **kwargs):
+        raise RuntimeError("tesseract crashed")
+    monkeypatch.setattr(montage, "ocr_crops", fail)
+    batcher = montage.MontageBatcher(max_crops=2, wait_s=5)
+    results = run_together(batcher, [([("a", None)], {}), ([("b", None)], {})])
+    assert all(isinstance(r, RuntimeError) for r in results)
@@ -0,0 +1,20 @@
+from modules.ocr_parser_new import extract_aadhaar_candidates, extract_aadhaar_number
+
+# Checksum-valid number used throughout
+NUMBER = "234567890124"
+
+
+def test_mixed_separators_are_candidates():
+    for text in ("2345 67890124", "23456789 0124", "2345-6789 0124", "2345 6789-0124", "2345-67890124"):
+        assert extract_aadhaar_number(text) == NUMBER, text
+
+
+def test_card_format_ranks_above_mixed_separators():
+    candidates = extract_aadhaar_candidates("2345 67890124\n2345 6789 0124")
+    assert [c["number"] for c in candidates] == [NUMBER]
+    assert candidates[0]["score"] == 12.0
+
+
+def test_longer_digit_runs_are_not_candidates():
+    assert extract_aadhaar_candidates("1234 5678 9012 3456") == []
+    assert extract_aadhaar_candidates("2345 6789-0124 5") == []
@@ -0,0 +1,50 @@
+import glob
+import os
+import threading
+
+from modules.output_sink import JsonlOutputSink, read_record
+
+
+def test_records_are_read_back_by_request_id(tmp_path):
+    sink = JsonlOutputSink(str(tmp_path), flush_interval_s=0.05)
+    for i in range(5):
+        assert sink.submit({"n": i}, request_id=f"req-{i}")
+    assert sink.flush(timeout=5)
+    assert read_record(str(tmp_path), "req-3")["result"] == {"n": 3}
+    assert read_record(str(tmp_path), "missing") is None
+    sink.close()
+    # The index outlives the writer
+    assert read_record(str(tmp_path), "req-0")["result"] == {"n": 0}
+
+
+def test_old_segments_are_pruned_with_their_index_rows(tmp_path):
+    # Every batch opens a new segment
+    sink = JsonlOutputSink(str(tmp_path), max_segment_bytes=1, flush_interval_s=0.05, max_segments=2)
+    for i in range(4):
+        sink.submit({"n": i}, request_id=f"req-{i}")
+        assert sink.flush(timeout=5)
+    sink.close()
+    assert len(glob.glob(os.path.join(str(tmp_path), "results_*.jsonl.gz"))) == 2
+    assert read_record(str(tmp_path), "req-0") is None
+    assert read_record(str(tmp_path), "req-3")["result"] == {"n": 3}
+
+
+def test_full_buffer_drops_are_counted_per_source(tmp_path, monkeypatch):
+    sink = JsonlOutputSink(str(tmp_path), buffer_size=1, flush_interval_s=0.05, submit_wait_s=0.01)
+    stalled = threading.Event()
+    release = threading.Event()
+
+    def stall(batch):
+        stalled.set()
+        release.wait(5)
+    monkeypatch.setattr(sink, "_write_batch", stall)
+
+    sink.submit({"n": 0}, request_id="a", source="/process")
+    assert stalled.wait(5)
+    sink.submit({"n": 1}, request_id="b", source="/process")
+    assert not sink.submit({"n": 2}, request_id="c", source="/process/stream")
+    assert sink.stats()["dropped_by_source"] == {"/process/stream": 1}
+    release.set()
+    sink.close()
+    assert not sink.submit({"n": 3}, source="ingest")
+    assert sink.stats()["dropped"] == 2
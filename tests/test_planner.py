@@ -0,0 +1,44 @@
+import pytest
+
+from modules.planner import plan_pipeline
+
+# main pulls in the OCR stack (cv2, pytesseract, pyzbar)
+main = pytest.importorskip("main")
+
+FRONT_TEXT = "Ramesh Kumar Sharma\nDOB: 01/02/1990\nMale\n2345 6789 0124\n"
+BACK_TEXT = "Address: C/O Suresh Sharma, House No 12, MG Road, Bangalore, Karnataka 560001\n"
+# Differs from the number printed in FRONT_TEXT
+QR_UID = "987654321096"
+
+
+def run_fields(fields, monkeypatch):
+    """assemble_final record of a pipeline run asking for `fields` only, on card text"""
+    monkeypatch.setattr(main, "extract_qr_data", lambda path, deadline=None: "<PrintLetterBarcodeData/>")
+    monkeypatch.setattr(main, "parse_aadhaar_xml", lambda raw: {"uid": QR_UID})
+    monkeypatch.setattr(main, "translate_to_english", lambda text, deadline=None: "EN " + text)
+    result = main.process_images("front.jpg", "back.jpg", fields=fields, quality_gate=False, profile="standard",
+                                 text_layer={"front": FRONT_TEXT, "back": BACK_TEXT})
+    return main.assemble_final(result)
+
+
+def test_translations_run_the_ocr_stages():
+    assert {"translate", "ocr_front", "ocr_back"} <= plan_pipeline({"translations"}, "standard")["stages"]
+
+
+def test_aadhaar_runs_the_qr_stage():
+    assert {"qr", "ocr_front"} <= plan_pipeline({"aadhaar"})["stages"]
+
+
+def test_translations_alone(monkeypatch):
+    final = run_fields({"translations"}, monkeypatch)
+    assert final["translations"]["ocr_back_translated"]["address_english"].startswith("EN C/O Suresh Sharma")
+
+
+def test_guardian_name_alone(monkeypatch):
+    final = run_fields({"guardian_name"}, monkeypatch)
+    assert final["final_data"]["address"]["guardian_name"] == "Suresh Sharma"
+
+
+def test_aadhaar_alone_prefers_the_qr(monkeypatch):
+    final = run_fields({"aadhaar"}, monkeypatch)
+    assert final["final_data"]["personal_info"]["aadhaar"] == QR_UID
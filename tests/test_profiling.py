@@ -0,0 +1,33 @@
+from modules.profiling import RequestProfile
+
+
+def leaf(n):
+    return sum(i * i for i in range(n))
+
+
+def branch():
+    return leaf(100000)
+
+
+def work():
+    return branch() + leaf(100000)
+
+
+def test_deterministic_profile_writes_folded_stacks(tmp_path):
+    profile = RequestProfile("deterministic", "test", str(tmp_path))
+    profile.start()
+    work()
+    profile.stop()
+    paths = profile.write()
+    assert {p.rsplit(".", 1)[1] for p in paths} == {"collapsed", "prof", "json"}
+
+    stacks = {}
+    with open(next(p for p in paths if p.endswith(".collapsed")), encoding="utf-8") as f:
+        for line in f:
+            stack, weight = line.rsplit(" ", 1)
+            stacks[stack] = int(weight)
+    # leaf is reached from work directly and through branch
+    leaf_paths = {tuple(label.split(" ", 1)[0] for label in s.split(";")) for s in stacks}
+    assert {("work", "branch", "leaf"), ("work", "leaf")} <= leaf_paths
+    # Microseconds: the stacks add up to about the profiled wall time
+    assert 0.5 * profile.wall_ms <= sum(stacks.values()) / 1000.0 <= 1.1 * profile.wall_ms
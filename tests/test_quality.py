@@ -0,0 +1,41 @@
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+from modules.quality import assess_image_quality  # noqa: E402
+
+
+def card(h=540, w=860, base=215):
+    """Light card with rows of dark text and a border"""
+    img = np.full((h, w), base, np.uint8)
+    for y in range(60, h - 60, 40):
+        for x in range(60, w - 200, 25):
+            cv2.putText(img, "A", (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.8, 30, 2)
+    cv2.rectangle(img, (0, 0), (w - 1, h - 1), 90, 4)
+    return img
+
+
+def assess(tmp_path, img):
+    path = str(tmp_path / "card.png")
+    cv2.imwrite(path, img)
+    return assess_image_quality(path)
+
+
+def test_card_on_a_white_flatbed_page_is_not_rejected(tmp_path):
+    page = np.full((2480, 1754), 252, np.uint8)
+    page[200:740, 200:1060] = card()
+    quality = assess(tmp_path, page)
+    assert quality["route"] != "reject"
+    assert "overexposed" not in quality["reasons"] and "glare" not in quality["reasons"]
+
+
+def test_clean_card_is_normal(tmp_path):
+    assert assess(tmp_path, card())["route"] == "normal"
+
+
+def test_glare_spot_on_the_card_is_rejected(tmp_path):
+    img = card()
+    cv2.circle(img, (430, 270), 200, 255, -1)
+    quality = assess(tmp_path, img)
+    assert quality["route"] == "reject" and quality["reason"] == "glare"
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from modules.scheduler import ANONYMOUS_TENANT, Scheduler, SchedulerBusy, parse_lane, tenant_id
+
+
+def test_only_listed_api_keys_get_a_tenant():
+    keys = ("key-a", "key-b")
+    assert tenant_id("key-a", keys) == tenant_id("key-a", keys) != tenant_id("key-b", keys)
+    assert tenant_id("key-a", keys) != ANONYMOUS_TENANT
+    assert tenant_id("made-up", keys) == tenant_id(None, keys) == tenant_id("", keys) == ANONYMOUS_TENANT
+    assert tenant_id("key-a", ()) == ANONYMOUS_TENANT
+
+
+def test_parse_lane():
+    assert parse_lane(None) == parse_lane("") == "interactive"
+    assert parse_lane(" Bulk ") == "bulk"
+    with pytest.raises(ValueError):
+        parse_lane("urgent")
+
+
+def test_tenant_quota_leaves_slots_to_other_tenants():
+    sched = Scheduler(slots=3, tenant_max_concurrent=1, reserved_slots=0)
+    held = sched.acquire(tenant="a")
+    with pytest.raises(SchedulerBusy, match="timed out"):
+        sched.acquire(tenant="a", timeout_s=0.05)
+    other = sched.acquire(tenant="b", timeout_s=0.05)
+    sched.release(held)
+    sched.release(other)
+    assert sched.stats()["running"] == 0
+
+
+def test_bulk_never_takes_the_reserved_slot():
+    sched = Scheduler(slots=2, reserved_slots=1)
+    bulk = sched.acquire("bulk", tenant="a")
+    with pytest.raises(SchedulerBusy):
+        sched.acquire("bulk", tenant="b", timeout_s=0.05)
+    interactive = sched.acquire("interactive", tenant="b", timeout_s=0.05)
+    assert sched.stats()["lanes"]["bulk"]["timed_out"] == 1
+    sched.release(bulk)
+    sched.release(interactive)
+
+
+def test_full_lane_queue_is_rejected_without_waiting():
+    sched = Scheduler(slots=1)
+    sched.lanes["interactive"].max_queued = 0
+    with pytest.raises(SchedulerBusy, match="queue full"):
+        sched.acquire(timeout_s=5)
+    assert sched.stats()["lanes"]["interactive"]["rejected"] == 1
+
+
+def test_free_slots_follow_the_lane_weights():
+    sched = Scheduler(slots=1, tenant_max_concurrent=8, reserved_slots=0, weights="interactive:2,bulk:1")
+    held = sched.acquire()
+    order = []
+
+    def request(lane):
+        ticket = sched.acquire(lane, timeout_s=5)
+        order.append(lane)
+        sched.release(ticket)
+
+    threads = [threading.Thread(target=request, args=(lane,)) for lane in ["interactive", "bulk"] * 4]
+    for t in threads:
+        t.start()
+    deadline = time.monotonic() + 5
+    while sum(s.queued for s in sched.lanes.values()) < len(threads) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    sched.release(held)
+    for t in threads:
+        t.join(5)
+    assert order[:6].count("interactive") == 4
+    assert sorted(order) == sorted(["interactive", "bulk"] * 4)
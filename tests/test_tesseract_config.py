@@ -0,0 +1,36 @@
+import json
+
+import pytest
+
+from modules import tesseract_config
+from modules.tesseract_config import DEFAULT_ZONE_SETTINGS, TUNED_CONFIG_VERSION, validate_settings, zone_settings
+
+
+@pytest.fixture
+def tuned_file(tmp_path, monkeypatch):
+    """Write `zones` as the tuned config file the OCR passes read"""
+    path = tmp_path / "tesseract_tuned.json"
+    monkeypatch.setattr(tesseract_config, "DEFAULT_TUNED_CONFIG_PATH", str(path))
+    monkeypatch.setitem(tesseract_config._loaded, "path", None)
+    monkeypatch.setitem(tesseract_config._loaded, "config", None)
+
+    def write(zones):
+        path.write_text(json.dumps({"version": TUNED_CONFIG_VERSION, "zones": zones}))
+    return write
+
+
+def test_partial_zone_entry_is_invalid():
+    with pytest.raises(ValueError, match="missing oem, psm"):
+        validate_settings("front", {"preprocess": "gray", "scale": 1.0})
+
+
+def test_partial_zone_entry_keeps_the_defaults(tuned_file):
+    tuned_file({"front": {"preprocess": "gray", "scale": 1.0}})
+    assert zone_settings("front") == DEFAULT_ZONE_SETTINGS["front"]
+
+
+def test_complete_zone_entry_is_used(tuned_file):
+    entry = {"oem": 1, "psm": 6, "preprocess": "clahe", "scale": 1.5}
+    tuned_file({"front": entry})
+    assert zone_settings("front") == entry
+    assert zone_settings("back") == DEFAULT_ZONE_SETTINGS["back"]